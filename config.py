@@ -1,5 +1,6 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import field_validator
+from typing import Optional
 
 
 class Settings(BaseSettings):
@@ -9,9 +10,148 @@ class Settings(BaseSettings):
     ADMIN_IDS: list[int] = []
     DATABASE_URL: str = "sqlite+aiosqlite:///./multi_platform_bot.db"
 
+    # Профиль движка БД: "auto" (по DATABASE_URL), "sqlite", "postgres" или "default" (без настройки)
+    DB_PROFILE: str = "auto"
+    # SQLite: WAL, synchronous=NORMAL и запись через BEGIN IMMEDIATE
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024
+    SQLITE_CACHE_SIZE_KB: int = 64 * 1024
+    SQLITE_BEGIN_IMMEDIATE: bool = True
+    # Небольшой пул: писатели ждут соединение в очереди asyncio, а не опросом блокировки SQLite
+    SQLITE_POOL_SIZE: int = 4
+    # PostgreSQL: пул соединений (воркеры outbox + обработчики апдейтов)
+    DB_POOL_SIZE: int = 20
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_PRE_PING: bool = True
+    DB_POOL_RECYCLE: int = 1800
+    DB_STATEMENT_CACHE_SIZE: int = 500
+
+    # Свой сервер Bot API (локальный telegram-bot-api, стенд для бенчмарков);
+    # по умолчанию — https://api.telegram.org
+    TELEGRAM_API_URL: Optional[str] = None
+
+    # Получение апдейтов: "polling" или "webhook"
+    BOT_MODE: str = "polling"
+    WEBHOOK_BASE_URL: Optional[str] = None
+    WEBHOOK_PATH: str = "/webhook"
+    WEBHOOK_SECRET: Optional[str] = None
+    WEBHOOK_HOST: str = "0.0.0.0"
+    WEBHOOK_PORT: int = 8080
+    WEBHOOK_MAX_CONCURRENT_UPDATES: int = 100
+
+    # Хранилище FSM: "sql" (таблица fsm_states с кэшем) или "memory"
+    FSM_STORAGE: str = "sql"
+    FSM_CACHE_SIZE: int = 10000
+    FSM_CACHE_TTL: float = 5
+    FSM_FLUSH_INTERVAL: float = 0.5
+    FSM_FLUSH_BATCH: int = 500
+    # Несколько реплик бота с одной БД: FSM пишется в БД сразу и читается мимо кэша
+    FSM_SHARED: bool = False
+
+    # Кэш пользователей telegram_id -> users.id
+    USER_CACHE_SIZE: int = 50000
+    USER_CACHE_TTL: float = 10 * 60
+
+    # Сколько ждать следующую часть альбома (media group) перед обработкой
+    ALBUM_WINDOW_MS: int = 600
+
+    # Задержка перед обновлением клавиатуры выбора сообществ (клики подряд склеиваются)
+    PICKER_DEBOUNCE_MS: int = 400
+    # Постов на странице /my_posts
+    MY_POSTS_PAGE_SIZE: int = 10
+
     VK_API_VERSION: str = "5.131"
     VK_USER_TOKEN: str 
 
+    # Транспорт VK API: "aiohttp" (асинхронный) или "vk_api" (в отдельном пуле потоков)
+    VK_TRANSPORT: str = "aiohttp"
+    VK_API_URL: str = "https://api.vk.com/method/"
+    VK_HTTP_TIMEOUT: int = 30
+    VK_HTTP_CONNECTIONS: int = 100
+    VK_EXECUTOR_WORKERS: int = 8
+    # Окно объединения вызовов одного токена в execute (0 — без объединения)
+    VK_BATCH_WINDOW_MS: int = 20
+
+    # Максимум одновременных отправок на платформу при публикации поста
+    FANOUT_TELEGRAM_CONCURRENCY: int = 20
+    FANOUT_VK_CONCURRENCY: int = 5
+
+    # Outbox: воркеры доставки PostToCommunity и повторы с экспоненциальной задержкой
+    OUTBOX_WORKERS: int = 4
+    OUTBOX_BATCH_SIZE: int = 200
+    OUTBOX_POLL_INTERVAL: float = 5
+    OUTBOX_MAX_ATTEMPTS: int = 8
+    OUTBOX_BACKOFF_BASE: float = 10
+    OUTBOX_BACKOFF_MAX: float = 60 * 60
+    OUTBOX_LEASE_SECONDS: int = 10 * 60
+    # Отложенные посты: планировщик держит в памяти посты на SCHEDULER_WINDOW_SECONDS вперёд
+    # (не больше SCHEDULER_BATCH) и перечитывает окно раз в SCHEDULER_REFRESH_SECONDS
+    SCHEDULER_WINDOW_SECONDS: int = 10 * 60
+    SCHEDULER_BATCH: int = 1000
+    SCHEDULER_REFRESH_SECONDS: float = 60
+    # Часовой пояс, в котором пользователи вводят время публикации
+    SCHEDULE_TIMEZONE: str = "Europe/Moscow"
+    # Зеркалирование каналов в VK: очередь апдейтов на канал и сколько постов канала
+    # готовятся (загрузка фото) параллельно, пока публикация идёт строго по порядку
+    MIRROR_QUEUE_SIZE: int = 100
+    MIRROR_PREFETCH: int = 4
+    # Как часто перечитывать настройки зеркал (секунды): изменения, сделанные
+    # через /mirror на другой реплике, применяются с этой задержкой
+    MIRROR_RELOAD_SECONDS: float = 60
+    # False — бот только ставит посты в очередь, доставляют отдельные процессы worker.py
+    OUTBOX_IN_BOT: bool = True
+    # Результаты доставки пишутся в БД пачками: по размеру или раз в интервал (секунды)
+    STATUS_FLUSH_BATCH: int = 500
+    STATUS_FLUSH_INTERVAL: float = 0.2
+
+    # Кэш загруженных в VK фото: (file_unique_id, group_id) -> photo{owner}_{id}
+    VK_ATTACHMENT_CACHE_SIZE: int = 10000
+    VK_ATTACHMENT_CACHE_TTL: int = 24 * 60 * 60
+    VK_UPLOAD_CONCURRENCY: int = 4
+
+    # Лимиты запросов: Telegram (глобально и на чат) и VK (на токен)
+    TG_GLOBAL_RATE: float = 30
+    TG_CHAT_RATE_PER_MINUTE: float = 20
+    TG_PRIVATE_CHAT_RATE: float = 1
+    VK_TOKEN_RATE: float = 3
+    VK_FLOOD_PAUSE: float = 10
+    FLOOD_MAX_RETRIES: int = 5
+    # Bucket чата/токена без запросов дольше этого срока удаляется (если уже восстановился)
+    FLOOD_BUCKET_IDLE_TTL: int = 10 * 60
+
+    # Пул долгоживущих VK клиентов (по одному на токен)
+    VK_CLIENT_POOL_SIZE: int = 256
+    VK_CLIENT_IDLE_TTL: int = 30 * 60
+
+    # Потоковая передача фото из Telegram в VK: размер куска и предел на один файл
+    MEDIA_CHUNK_SIZE: int = 64 * 1024
+    MEDIA_MAX_TRANSFER_BYTES: int = 50 * 1024 * 1024
+    # Дисковый кэш скачанных из Telegram файлов (ключ — file_unique_id); 0 — без кэша
+    MEDIA_CACHE_DIR: str = "media_cache"
+    MEDIA_CACHE_MAX_BYTES: int = 1024 * 1024 * 1024
+    MEDIA_CACHE_IO_WORKERS: int = 4
+    # Нормализация фото перед загрузкой в VK (нужен Pillow): уменьшение до IMAGE_MAX_SIDE
+    # по большей стороне, JPEG без метаданных; файлы меньше IMAGE_NORMALIZE_MIN_BYTES не трогаются
+    IMAGE_NORMALIZE: bool = True
+    IMAGE_MAX_SIDE: int = 2560
+    IMAGE_JPEG_QUALITY: int = 87
+    IMAGE_NORMALIZE_MIN_BYTES: int = 1024 * 1024
+    IMAGE_NORMALIZE_WORKERS: int = 2
+    # Сколько последних фото, которые не нужно нормализовать, помнить (LRU)
+    IMAGE_NORMALIZE_SKIP_SIZE: int = 10_000
+
+    # Метрики Prometheus: http://METRICS_HOST:METRICS_PORT/metrics; 0 — не поднимать.
+    # У бота и каждого worker.py должен быть свой порт
+    METRICS_HOST: str = "127.0.0.1"
+    METRICS_PORT: int = 9100
+
+    # Трассировка апдейтов и доставок: доля трасс с деревом span, порог медленной трассы
+    # (пишется в лог и показывается в /slow), сколько медленных хранить, предел span на трассу
+    TRACE_SAMPLE_RATE: float = 0.05
+    TRACE_SLOW_MS: int = 3000
+    TRACE_KEEP: int = 50
+    TRACE_MAX_SPANS: int = 500
+
     @field_validator("ADMIN_IDS", mode="before")
     @classmethod
     def parse_admin_ids(cls, v):
@@ -1,10 +1,114 @@
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from config import settings
+from services.metrics import instrument_engine
+
+
+def _resolve_profile(url: str, profile: str) -> str:
+    if profile != "auto":
+        return profile
+    backend = make_url(url).get_backend_name()
+    if backend == "sqlite":
+        return "sqlite"
+    if backend == "postgresql":
+        return "postgres"
+    return "default"
+
+
+def _setup_sqlite(engine: AsyncEngine) -> None:
+    """
+    Прагмы на каждое новое соединение и BEGIN IMMEDIATE вместо отложенной транзакции:
+    писатели встают в очередь на busy_timeout в начале транзакции, а не получают
+    "database is locked" при попытке записи посреди уже начатого чтения.
+    """
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        if settings.SQLITE_BEGIN_IMMEDIATE:
+            # Транзакциями управляем сами (событие begin ниже)
+            dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+        cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+        # Отрицательное значение — размер в КиБ, а не в страницах
+        cursor.execute(f"PRAGMA cache_size=-{int(settings.SQLITE_CACHE_SIZE_KB)}")
+        cursor.close()
+
+    if settings.SQLITE_BEGIN_IMMEDIATE:
+        @event.listens_for(engine.sync_engine, "begin")
+        def on_begin(conn):
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def _postgres_url(url: str) -> URL:
+    """
+    URL для профиля postgres: кэш подготовленных выражений — параметр asyncpg,
+    другим драйверам (psycopg) его не передаём.
+    """
+    parsed = make_url(url)
+    if parsed.get_driver_name() == "asyncpg" and "prepared_statement_cache_size" not in parsed.query:
+        parsed = parsed.update_query_dict(
+            {"prepared_statement_cache_size": str(settings.DB_STATEMENT_CACHE_SIZE)}
+        )
+    return parsed
 
-engine = create_async_engine(settings.DATABASE_URL, echo=False)
+
+def make_engine(url: str, profile: Optional[str] = None) -> AsyncEngine:
+    """
+    Создаёт движок с настройками профиля (DB_PROFILE по умолчанию).
+    """
+    profile = _resolve_profile(url, profile or settings.DB_PROFILE)
+
+    if profile == "postgres":
+        return create_async_engine(
+            _postgres_url(url),
+            echo=False,
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_pre_ping=settings.DB_POOL_PRE_PING,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+        )
+
+    if profile == "sqlite":
+        # По умолчанию aiosqlite работает без пула: новое соединение (и поток) на каждую сессию
+        new_engine = create_async_engine(
+            url,
+            echo=False,
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=settings.SQLITE_POOL_SIZE,
+            max_overflow=0,
+        )
+        _setup_sqlite(new_engine)
+        return new_engine
+
+    return create_async_engine(url, echo=False)
+
+
+engine = make_engine(settings.DATABASE_URL)
+instrument_engine(engine)
 async_session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 async def init_db():
+    from migrations import check_schema, run_migrations
     from models import Base
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(run_migrations)
+        await conn.run_sync(check_schema, Base.metadata)
+
+
+def dialect_insert(model):
+    """
+    INSERT текущего диалекта (SQLite/PostgreSQL) — с поддержкой on_conflict_do_*.
+    """
+    if engine.dialect.name == "postgresql":
+        return pg_insert(model)
+    return sqlite_insert(model)
@@ -1,7 +1,10 @@
 from aiogram import Router
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.types import Message
 from config import settings
+from services.metrics import PUBLISH_RESULTS
+from services.stats_service import StatsService
+from services.tracing import format_trace, tracer
 
 router = Router()
 
@@ -14,7 +17,8 @@ async def cmd_admin(message: Message):
     await message.answer(
         "👑 Админ панель\n\n"
         "Доступные команды:\n"
-        "/stats - Статистика бота"
+        "/stats - Статистика бота\n"
+        "/slow [N] - Последние медленные апдейты и доставки"
     )
 
 @router.message(Command("stats"))
@@ -22,18 +26,30 @@ async def cmd_stats(message: Message):
     if message.from_user.id not in settings.ADMIN_IDS:
         return
 
-    from database import async_session_maker
-    from sqlalchemy import select, func
-    from models import User, Post, Community
-
-    async with async_session_maker() as session:
-        users_count = await session.scalar(select(func.count(User.id)))
-        posts_count = await session.scalar(select(func.count(Post.id)))
-        communities_count = await session.scalar(select(func.count(Community.id)))
-
+    # Счётчики в памяти (см. StatsService) — без COUNT(*) по таблицам
     await message.answer(
         f"📊 Статистика:\n\n"
-        f"👥 Пользователей: {users_count}\n"
-        f"📝 Постов: {posts_count}\n"
-        f"🏘 Сообществ: {communities_count}"
+        f"👥 Пользователей: {StatsService.get('users')}\n"
+        f"📝 Постов: {StatsService.get('posts')}\n"
+        f"🏘 Сообществ: {StatsService.get('communities')}\n\n"
+        f"С момента запуска этого процесса:\n"
+        f"✅ Доставлено: {int(PUBLISH_RESULTS.total(result='sent'))}\n"
+        f"❌ Ошибок доставки: {int(PUBLISH_RESULTS.total(result='failed') + PUBLISH_RESULTS.total(result='error'))}"
     )
+
+@router.message(Command("slow"))
+async def cmd_slow(message: Message, command: CommandObject):
+    if message.from_user.id not in settings.ADMIN_IDS:
+        return
+
+    limit = int(command.args) if command.args and command.args.isdigit() else 3
+    traces = list(tracer.slow)[-limit:]
+    if not traces:
+        await message.answer(f"🐢 Медленных трасс (дольше {tracer.slow_ms} мс) пока нет.")
+        return
+
+    text = "\n\n".join(format_trace(t) for t in reversed(traces))
+    # Предел длины сообщения Telegram
+    if len(text) > 4000:
+        text = text[:4000] + "\n…"
+    await message.answer(text)
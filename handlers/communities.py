@@ -3,13 +3,15 @@ from aiogram.filters import Command
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-import asyncio
 import logging
 
 from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
 
 from database import async_session_maker
-from models import User, Community, PlatformType
+from models import Community, PlatformType
+from services.stats_service import StatsService
+from services.user_service import CachedUser
 from services.vk_service import VKService
 
 router = Router()
@@ -36,7 +38,7 @@ async def add_community(message: Message, state: FSMContext):
 @router.callback_query(AddCommunityState.waiting_for_platform, F.data.in_(["add_tg", "add_vk"]))
 async def platform_selected(callback: CallbackQuery, state: FSMContext):
     if callback.data == "add_tg":
-        await state.update_data(platform=PlatformType.TELEGRAM)
+        await state.update_data(platform=PlatformType.TELEGRAM.value)
         await callback.message.edit_text(
             "Отправь ID/username канала.\n\n"
             "Примеры:\n"
@@ -47,7 +49,7 @@ async def platform_selected(callback: CallbackQuery, state: FSMContext):
         await state.set_state(AddCommunityState.waiting_for_tg_id)
 
     if callback.data == "add_vk":
-        await state.update_data(platform=PlatformType.VK)
+        await state.update_data(platform=PlatformType.VK.value)
         await callback.message.edit_text(
             "Как получить токен VK группы:\n\n"
             "1. Открой группу VK\n"
@@ -74,34 +76,34 @@ async def tg_id_received(message: Message, state: FSMContext):
 
 
 @router.message(AddCommunityState.waiting_for_tg_name)
-async def tg_name_received(message: Message, state: FSMContext):
+async def tg_name_received(message: Message, state: FSMContext, db_user: CachedUser):
     name = message.text.strip()
     data = await state.get_data()
     community_id = data["community_id"]
 
     async with async_session_maker() as session:
-        u = await session.execute(select(User).where(User.telegram_id == message.from_user.id))
-        user = u.scalar_one_or_none()
-        if not user:
-            await message.answer("Сначала /start")
-            await state.clear()
-            return
-
         session.add(Community(
-            user_id=user.id,
+            user_id=db_user.id,
             platform=PlatformType.TELEGRAM,
             community_id=community_id,
             community_name=name,
             access_token=None
         ))
-        await session.commit()
+        try:
+            await session.commit()
+        except IntegrityError:
+            # Уникальный индекс (user_id, platform, community_id)
+            await message.answer("ℹ️ Этот канал уже добавлен.")
+            await state.clear()
+            return
+    StatsService.count("communities")
 
     await message.answer(f"✅ Telegram-канал добавлен: {name}")
     await state.clear()
 
 
 @router.message(AddCommunityState.waiting_for_vk_token)
-async def vk_token_received(message: Message, state: FSMContext):
+async def vk_token_received(message: Message, state: FSMContext, db_user: CachedUser):
     token = message.text.strip()
 
     # Удаляем сообщение с токеном для безопасности
@@ -111,7 +113,14 @@ async def vk_token_received(message: Message, state: FSMContext):
         pass
 
     # Валидация токена
-    if not VKService.validate_token(token):
+    try:
+        valid = await VKService.validate_token(token)
+    except Exception as e:
+        logger.warning(f"VK token check failed: {e}")
+        await message.answer("⚠️ Не удалось проверить токен: VK не ответил. Пришли токен ещё раз чуть позже.")
+        return
+
+    if not valid:
         await message.answer(
             "❌ Токен невалидный.\n\n"
             "Проверь что токен:\n"
@@ -127,8 +136,7 @@ async def vk_token_received(message: Message, state: FSMContext):
     # Автоматически определяем группу по токену
     vk = VKService(token)
     try:
-        loop = asyncio.get_event_loop()
-        groups = await loop.run_in_executor(None, lambda: vk.api.groups.getById())
+        groups = await vk.get_token_groups()
         
         if not groups:
             await message.answer("❌ Не удалось определить группу по токену.")
@@ -140,17 +148,10 @@ async def vk_token_received(message: Message, state: FSMContext):
         group_name = group.get("name", f"VK {group_id}")
         
         async with async_session_maker() as session:
-            u = await session.execute(select(User).where(User.telegram_id == message.from_user.id))
-            user = u.scalar_one_or_none()
-            if not user:
-                await message.answer("Сначала /start")
-                await state.clear()
-                return
-
             # Проверяем дубликаты
             exists = await session.execute(
                 select(Community).where(
-                    Community.user_id == user.id,
+                    Community.user_id == db_user.id,
                     Community.platform == PlatformType.VK,
                     Community.community_id == group_id
                 )
@@ -161,13 +162,14 @@ async def vk_token_received(message: Message, state: FSMContext):
                 return
 
             session.add(Community(
-                user_id=user.id,
+                user_id=db_user.id,
                 platform=PlatformType.VK,
                 community_id=group_id,
                 community_name=group_name,
                 access_token=token
             ))
             await session.commit()
+        StatsService.count("communities")
 
         await message.answer(
             f"✅ VK группа добавлена!\n\n"
@@ -187,15 +189,9 @@ async def vk_token_received(message: Message, state: FSMContext):
 
 
 @router.message(Command("my_communities"))
-async def my_communities(message: Message):
+async def my_communities(message: Message, db_user: CachedUser):
     async with async_session_maker() as session:
-        u = await session.execute(select(User).where(User.telegram_id == message.from_user.id))
-        user = u.scalar_one_or_none()
-        if not user:
-            await message.answer("Сначала /start")
-            return
-
-        result = await session.execute(select(Community).where(Community.user_id == user.id))
+        result = await session.execute(select(Community).where(Community.user_id == db_user.id))
         comms = result.scalars().all()
 
     if not comms:
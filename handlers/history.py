@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from aiogram import Router, F
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.filters import Command
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
+
+from database import async_session_maker
+from handlers.posts import schedule_tz
+from services.post_service import HistoryCursor, PostService, PostSummary
+from services.scheduler import as_utc
+from services.user_service import CachedUser
+
+router = Router()
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_SNIPPET_LENGTH = 60
+
+
+def encode_cursor(cursor: HistoryCursor) -> str:
+    created_at, post_id = cursor
+    # Микросекунды целым числом: граница страницы должна совпадать с created_at точно
+    return f"{(as_utc(created_at) - _EPOCH) // timedelta(microseconds=1)}:{post_id}"
+
+
+def decode_cursor(value: str) -> HistoryCursor:
+    micros, post_id = value.split(":")
+    return _EPOCH + timedelta(microseconds=int(micros)), int(post_id)
+
+
+def post_line(post: PostSummary, now: datetime) -> str:
+    created = as_utc(post.created_at).astimezone(schedule_tz)
+    snippet = (post.text or "").strip().split("\n")[0]
+    if len(snippet) > _SNIPPET_LENGTH:
+        snippet = snippet[:_SNIPPET_LENGTH] + "…"
+    if not snippet:
+        snippet = "📷 фото" if post.has_media else "(без текста)"
+
+    status = f"✅ {post.sent} · ⏳ {post.pending} · ❌ {post.failed}"
+    if post.publish_at is not None and post.pending and as_utc(post.publish_at) > now:
+        status += f" · 🕒 {as_utc(post.publish_at).astimezone(schedule_tz):%d.%m %H:%M}"
+    return f"#{post.id} · {created:%d.%m.%Y %H:%M}\n{snippet}\n{status}"
+
+
+def history_keyboard(posts: List[PostSummary], has_newer: bool, has_older: bool) -> Optional[InlineKeyboardMarkup]:
+    row = []
+    if has_newer:
+        row.append(InlineKeyboardButton(text="⬅️ Новее", callback_data=f"myposts:n:{encode_cursor(posts[0].cursor)}"))
+    if has_older:
+        row.append(InlineKeyboardButton(text="Старее ➡️", callback_data=f"myposts:o:{encode_cursor(posts[-1].cursor)}"))
+    return InlineKeyboardMarkup(inline_keyboard=[row]) if row else None
+
+
+def history_text(posts: List[PostSummary]) -> str:
+    now = datetime.now(timezone.utc)
+    return "📝 Твои посты:\n\n" + "\n\n".join(post_line(p, now) for p in posts)
+
+
+@router.message(Command("my_posts"))
+async def my_posts(message: Message, db_user: CachedUser):
+    async with async_session_maker() as session:
+        posts, more = await PostService(session).get_history_page(db_user.id)
+
+    if not posts:
+        await message.answer("У тебя пока нет постов. Создай первый: /new_post")
+        return
+
+    await message.answer(history_text(posts), reply_markup=history_keyboard(posts, False, more))
+
+
+@router.callback_query(F.data.startswith("myposts:"))
+async def my_posts_page(callback: CallbackQuery, db_user: CachedUser):
+    _, direction, cursor = callback.data.split(":", 2)
+    newer = direction == "n"
+
+    async with async_session_maker() as session:
+        posts, more = await PostService(session).get_history_page(
+            db_user.id, cursor=decode_cursor(cursor), newer=newer
+        )
+
+    if not posts:
+        await callback.answer("Больше постов нет.")
+        return
+
+    # Пришли со страницы по другую сторону курсора — туда всегда можно вернуться
+    has_newer, has_older = (more, True) if newer else (True, more)
+    try:
+        await callback.message.edit_text(
+            history_text(posts), reply_markup=history_keyboard(posts, has_newer, has_older)
+        )
+    except TelegramBadRequest as e:
+        if "message is not modified" not in str(e):
+            raise
+    await callback.answer()
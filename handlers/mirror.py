@@ -0,0 +1,175 @@
+import logging
+from typing import Dict, List, Optional, Set
+
+from aiogram import Bot, Router, F
+from aiogram.enums import ChatMemberStatus
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.filters import Command
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+
+from database import async_session_maker
+from models import ChannelMirror, Community, PlatformType
+from services.mirror import mirror_pipeline
+from services.user_service import CachedUser
+
+router = Router()
+logger = logging.getLogger(__name__)
+
+
+@router.channel_post()
+async def channel_post(message: Message):
+    # Постановка в очередь — первое ожидание в обработке апдейта, поэтому посты канала
+    # попадают в очередь в том порядке, в каком пришли
+    await mirror_pipeline.submit(message)
+
+
+@router.edited_channel_post()
+async def edited_channel_post(message: Message):
+    await mirror_pipeline.submit(message, edit=True)
+
+
+async def resolve_channel(bot: Bot, community: Community) -> Optional[int]:
+    """
+    Числовой id канала, если бот в нём администратор (иначе channel_post не приходят).
+    """
+    try:
+        chat = await bot.get_chat(community.community_id)
+        member = await bot.get_chat_member(chat.id, bot.id)
+    except TelegramBadRequest as e:
+        logger.warning(f"Mirror: channel {community.community_id} unavailable: {e}")
+        return None
+    if member.status not in (ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.CREATOR):
+        return None
+    return chat.id
+
+
+async def user_communities(user_id: int) -> Dict[PlatformType, List[Community]]:
+    async with async_session_maker() as session:
+        result = await session.execute(
+            select(Community).where(Community.user_id == user_id).order_by(Community.id)
+        )
+        communities = result.scalars().all()
+    by_platform: Dict[PlatformType, List[Community]] = {PlatformType.TELEGRAM: [], PlatformType.VK: []}
+    for c in communities:
+        by_platform.setdefault(c.platform, []).append(c)
+    return by_platform
+
+
+def channels_keyboard(channels: List[Community]) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=f"📱 {c.community_name}", callback_data=f"mirror:ch:{c.id}")]
+        for c in channels
+    ])
+
+
+def groups_keyboard(channel: Community, groups: List[Community], mirrored: Set[int]) -> InlineKeyboardMarkup:
+    buttons = [
+        [InlineKeyboardButton(
+            text=f"{'✅' if g.id in mirrored else '▫️'} {g.community_name}",
+            callback_data=f"mirror:vk:{channel.id}:{g.id}",
+        )]
+        for g in groups
+    ]
+    buttons.append([InlineKeyboardButton(text="⬅️ Каналы", callback_data="mirror:list")])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+async def mirrored_groups(channel: Community) -> Set[int]:
+    async with async_session_maker() as session:
+        result = await session.execute(
+            select(ChannelMirror.vk_community_id).where(ChannelMirror.tg_community_id == channel.id)
+        )
+        return set(result.scalars().all())
+
+
+async def show_channel(callback: CallbackQuery, channel: Community, groups: List[Community]) -> None:
+    await callback.message.edit_text(
+        f"🔁 Зеркало канала {channel.community_name}\n\n"
+        "Новые посты, альбомы и правки канала будут автоматически публиковаться "
+        "в отмеченных VK группах:",
+        reply_markup=groups_keyboard(channel, groups, await mirrored_groups(channel)),
+    )
+
+
+@router.message(Command("mirror"))
+async def mirror_start(message: Message, db_user: CachedUser):
+    communities = await user_communities(db_user.id)
+    if not communities[PlatformType.TELEGRAM] or not communities[PlatformType.VK]:
+        await message.answer("Для зеркала нужны Telegram-канал и VK группа. Добавь их через /add_community")
+        return
+    await message.answer(
+        "Выбери канал для зеркалирования в VK:",
+        reply_markup=channels_keyboard(communities[PlatformType.TELEGRAM]),
+    )
+
+
+@router.callback_query(F.data == "mirror:list")
+async def mirror_list(callback: CallbackQuery, db_user: CachedUser):
+    communities = await user_communities(db_user.id)
+    await callback.message.edit_text(
+        "Выбери канал для зеркалирования в VK:",
+        reply_markup=channels_keyboard(communities[PlatformType.TELEGRAM]),
+    )
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("mirror:ch:"))
+async def mirror_channel(callback: CallbackQuery, db_user: CachedUser):
+    channel_pk = int(callback.data.split(":")[2])
+    communities = await user_communities(db_user.id)
+    channel = next((c for c in communities[PlatformType.TELEGRAM] if c.id == channel_pk), None)
+    if channel is None:
+        await callback.answer("Канал не найден.", show_alert=True)
+        return
+
+    await show_channel(callback, channel, communities[PlatformType.VK])
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("mirror:vk:"))
+async def mirror_toggle(callback: CallbackQuery, db_user: CachedUser):
+    _, _, channel_pk, group_pk = callback.data.split(":")
+    communities = await user_communities(db_user.id)
+    channel = next((c for c in communities[PlatformType.TELEGRAM] if c.id == int(channel_pk)), None)
+    group = next((g for g in communities[PlatformType.VK] if g.id == int(group_pk)), None)
+    if channel is None or group is None:
+        await callback.answer("Сообщество не найдено.", show_alert=True)
+        return
+
+    mirror_filter = (ChannelMirror.tg_community_id == channel.id, ChannelMirror.vk_community_id == group.id)
+    async with async_session_maker() as session:
+        removed = (await session.execute(delete(ChannelMirror).where(*mirror_filter))).rowcount
+        await session.commit()
+
+    conflict = False
+    if not removed:
+        if not group.access_token:
+            await callback.answer("У VK группы нет токена — добавь её заново.", show_alert=True)
+            return
+        # Проверка прав — вне транзакции, это запросы к Telegram
+        channel_id = await resolve_channel(callback.bot, channel)
+        if channel_id is None:
+            await callback.answer("⚠️ Бот должен быть админом канала.", show_alert=True)
+            return
+        async with async_session_maker() as session:
+            session.add(ChannelMirror(
+                user_id=db_user.id,
+                channel_id=channel_id,
+                tg_community_id=channel.id,
+                vk_community_id=group.id,
+            ))
+            try:
+                await session.commit()
+            except IntegrityError:
+                # Канал уже зеркалится в эту группу (повторный клик или тот же канал под другим id)
+                await session.rollback()
+                conflict = True
+    await mirror_pipeline.load()
+
+    await show_channel(callback, channel, communities[PlatformType.VK])
+    if conflict:
+        await callback.answer("⚠️ Этот канал уже зеркалится в эту группу.", show_alert=True)
+    else:
+        await callback.answer("Зеркало выключено." if removed else "Зеркало включено.")
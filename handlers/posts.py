@@ -1,4 +1,10 @@
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
 from aiogram import Router, F
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
@@ -6,16 +12,97 @@ from aiogram.fsm.state import State, StatesGroup
 
 from sqlalchemy import select
 
+from config import settings
 from database import async_session_maker
-from models import User, Community, PlatformType
+from models import Community, PlatformType, Post
+from middlewares.album import AlbumMiddleware
+from services.debounce import Debouncer
+from services.media import message_media
+from services.outbox import Outbox
 from services.post_service import PostService
+from services.user_service import CachedUser
 
 router = Router()
+router.message.middleware(AlbumMiddleware())
+
+picker_edits = Debouncer(settings.PICKER_DEBOUNCE_MS / 1000)
+
+
+schedule_tz = ZoneInfo(settings.SCHEDULE_TIMEZONE)
+
+_RELATIVE_TIME = re.compile(r"^\+\s*(\d+)\s*(m|min|м|мин|h|ч)$")
+_ABSOLUTE_TIME = re.compile(r"^(?:(\d{1,2})\.(\d{1,2})(?:\.(\d{4}))?\s+)?(\d{1,2}):(\d{2})$")
 
 
 class CreatePostState(StatesGroup):
     waiting_for_post_message = State()
     waiting_for_communities = State()
+    waiting_for_publish_time = State()
+
+
+def parse_publish_at(text: str, now: datetime) -> Optional[datetime]:
+    """
+    Время публикации из сообщения пользователя (часовой пояс SCHEDULE_TIMEZONE):
+    "18:30" — сегодня или завтра, "25.12 18:30", "25.12.2026 18:30", "+90m", "+2ч".
+    Возвращает время в UTC или None, если формат не распознан.
+    """
+    text = text.strip().lower()
+
+    relative = _RELATIVE_TIME.match(text)
+    if relative:
+        amount, unit = int(relative.group(1)), relative.group(2)
+        try:
+            return now + (timedelta(hours=amount) if unit in ("h", "ч") else timedelta(minutes=amount))
+        except OverflowError:
+            # "+99999999h" — за пределами datetime
+            return None
+
+    absolute = _ABSOLUTE_TIME.match(text)
+    if not absolute:
+        return None
+    day, month, year, hour, minute = absolute.groups()
+    local_now = now.astimezone(schedule_tz)
+    try:
+        local = local_now.replace(
+            year=int(year) if year else local_now.year,
+            month=int(month) if month else local_now.month,
+            day=int(day) if day else local_now.day,
+            hour=int(hour),
+            minute=int(minute),
+            second=0,
+            microsecond=0,
+        )
+        if local <= local_now and not year:
+            # "18:30" уже прошло — завтра, "25.12 18:30" — в следующем году
+            local = local + timedelta(days=1) if not day else local.replace(year=local.year + 1)
+        return local.astimezone(timezone.utc)
+    except (ValueError, OverflowError):
+        # 31.02, 24:00 или дата на границе datetime (31.12.9999)
+        return None
+
+
+def picker_snapshot(communities: Iterable[Community]) -> List[list]:
+    """
+    Снимок сообществ для клавиатуры выбора: [id, platform, name].
+    Хранится в FSM, чтобы клики по кнопкам не ходили в БД.
+    """
+    return [[c.id, c.platform.value, c.community_name] for c in communities]
+
+
+def picker_keyboard(picker: List[list], selected: Iterable[int]) -> InlineKeyboardMarkup:
+    selected = set(selected)
+    buttons = []
+    for comm_id, platform, name in picker:
+        emoji = "📱" if platform == PlatformType.TELEGRAM.value else "🔵"
+        check = "☑" if comm_id in selected else "☐"
+        buttons.append([InlineKeyboardButton(text=f"{check} {emoji} {name}", callback_data=f"sel_{comm_id}")])
+
+    buttons.append([
+        InlineKeyboardButton(text="✅ Опубликовать", callback_data="confirm"),
+        InlineKeyboardButton(text="🕒 Запланировать", callback_data="schedule"),
+    ])
+    buttons.append([InlineKeyboardButton(text="❌ Отмена", callback_data="cancel")])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
 @router.message(Command("new_post"))
@@ -25,26 +112,25 @@ async def new_post_start(message: Message, state: FSMContext):
 
 
 @router.message(CreatePostState.waiting_for_post_message)
-async def post_message_received(message: Message, state: FSMContext):
+async def post_message_received(
+    message: Message,
+    state: FSMContext,
+    db_user: CachedUser,
+    album: Optional[List[Message]] = None,
+):
     """
     Сохраняем в FSM:
-    - from_chat_id/message_id: для TG copy_message
-    - text: для VK wall.post
-    - photo_file_id: если прислали как фото
-    - document_file_id: если прислали как документ (часто так кидают 'без сжатия')
+    - from_chat_id/message_ids: для TG copy_message(s), альбом целиком
+    - text: для VK wall.post (подпись альбома)
+    - media: картинки [{file_id, file_unique_id, file_size}] для VK, все фото альбома
     """
-    text = (message.text or message.caption or "").strip()
-
-    photo_file_id = message.photo[-1].file_id if message.photo else None
+    messages = album or [message]
 
-    document_file_id = None
-    if message.document:
+    # У альбома подпись обычно только у одного сообщения
+    text = next((t for t in ((m.text or m.caption or "").strip() for m in messages) if t), "")
+    media = [m for m in map(message_media, messages) if m]
 
-        mime = (message.document.mime_type or "").lower()
-        if mime.startswith("image/"):
-            document_file_id = message.document.file_id
-
-    if not text and not photo_file_id and not document_file_id:
+    if not text and not media:
         await message.answer(
             "❌ Я не вижу ни текста, ни картинки.\n"
             "Отправь текст и/или изображение (как фото или как файл)."
@@ -53,21 +139,14 @@ async def post_message_received(message: Message, state: FSMContext):
 
     await state.update_data(
         from_chat_id=message.chat.id,
-        message_id=message.message_id,
+        message_id=messages[0].message_id,
+        message_ids=[m.message_id for m in messages],
         text=text,
-        photo_file_id=photo_file_id,
-        document_file_id=document_file_id,
+        media=media,
     )
 
     async with async_session_maker() as session:
-        u = await session.execute(select(User).where(User.telegram_id == message.from_user.id))
-        user = u.scalar_one_or_none()
-        if not user:
-            await message.answer("Сначала /start")
-            await state.clear()
-            return
-
-        comms = await session.execute(select(Community).where(Community.user_id == user.id))
+        comms = await session.execute(select(Community).where(Community.user_id == db_user.id))
         communities = comms.scalars().all()
 
     if not communities:
@@ -75,24 +154,42 @@ async def post_message_received(message: Message, state: FSMContext):
         await state.clear()
         return
 
-    buttons = []
-    for c in communities:
-        emoji = "📱" if c.platform == PlatformType.TELEGRAM else "🔵"
-        buttons.append([InlineKeyboardButton(text=f"☐ {emoji} {c.community_name}", callback_data=f"sel_{c.id}")])
+    picker = picker_snapshot(communities)
+    await state.update_data(all_ids=[c.id for c in communities], picker=picker, selected=[])
+    await message.answer("Выбери сообщества:", reply_markup=picker_keyboard(picker, []))
+    await state.set_state(CreatePostState.waiting_for_communities)
 
-    buttons.append([InlineKeyboardButton(text="✅ Опубликовать", callback_data="confirm")])
-    buttons.append([InlineKeyboardButton(text="❌ Отмена", callback_data="cancel")])
 
-    await state.update_data(all_ids=[c.id for c in communities], selected=[])
-    await message.answer("Выбери сообщества:", reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons))
-    await state.set_state(CreatePostState.waiting_for_communities)
+async def save_post(
+    data: dict,
+    selected: List[int],
+    db_user: CachedUser,
+    publish_at: Optional[datetime] = None,
+) -> Tuple[Post, int]:
+    async with async_session_maker() as session:
+        return await PostService(session).create_post(
+            user_id=db_user.id,
+            from_chat_id=data["from_chat_id"],
+            message_id=data["message_id"],
+            text=data["text"],
+            photo_file_id=data.get("photo_file_id"),
+            document_file_id=data.get("document_file_id"),
+            community_ids=selected,
+            file_unique_id=data.get("file_unique_id"),
+            media=data.get("media"),
+            message_ids=data.get("message_ids"),
+            publish_at=publish_at,
+        )
 
 
 @router.callback_query(CreatePostState.waiting_for_communities)
-async def community_toggle(callback: CallbackQuery, state: FSMContext):
+async def community_toggle(callback: CallbackQuery, state: FSMContext, outbox: Outbox, db_user: CachedUser):
     data = await state.get_data()
 
+    picker_key = (callback.message.chat.id, callback.message.message_id)
+
     if callback.data == "cancel":
+        picker_edits.cancel(picker_key)
         await callback.message.edit_text("Отменено.")
         await state.clear()
         await callback.answer()
@@ -108,57 +205,96 @@ async def community_toggle(callback: CallbackQuery, state: FSMContext):
             selected.add(comm_id)
 
         selected = list(selected)
-        await state.update_data(selected=selected)
+        picker = data.get("picker")
+        if picker is None:
+            # Состояние, начатое до появления снимка: собираем его один раз
+            async with async_session_maker() as session:
+                result = await session.execute(select(Community).where(Community.id.in_(data["all_ids"])))
+                picker = picker_snapshot(result.scalars().all())
+            await state.update_data(selected=selected, picker=picker)
+        else:
+            await state.update_data(selected=selected)
 
-        async with async_session_maker() as session:
-            result = await session.execute(select(Community).where(Community.id.in_(data["all_ids"])))
-            communities = result.scalars().all()
+        await callback.answer()
 
-        buttons = []
-        for c in communities:
-            emoji = "📱" if c.platform == PlatformType.TELEGRAM else "🔵"
-            check = "☑" if c.id in selected else "☐"
-            buttons.append([InlineKeyboardButton(text=f"{check} {emoji} {c.community_name}", callback_data=f"sel_{c.id}")])
+        # Быстрые клики подряд дают одно edit_reply_markup с последним выбором
+        markup = picker_keyboard(picker, selected)
+        message = callback.message
 
-        buttons.append([InlineKeyboardButton(text="✅ Опубликовать", callback_data="confirm")])
-        buttons.append([InlineKeyboardButton(text="❌ Отмена", callback_data="cancel")])
+        async def edit() -> None:
+            try:
+                await message.edit_reply_markup(reply_markup=markup)
+            except TelegramBadRequest as e:
+                if "message is not modified" not in str(e):
+                    raise
 
-        await callback.message.edit_reply_markup(reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons))
-        await callback.answer()
+        picker_edits.schedule(picker_key, edit)
         return
 
-    if callback.data == "confirm":
+    if callback.data in ("confirm", "schedule"):
         selected = data.get("selected", [])
         if not selected:
             await callback.answer("Выбери хотя бы одно сообщество.", show_alert=True)
             return
 
-        async with async_session_maker() as session:
-            u = await session.execute(select(User).where(User.telegram_id == callback.from_user.id))
-            user = u.scalar_one_or_none()
-            if not user:
-                await callback.message.edit_text("Сначала /start")
-                await state.clear()
-                await callback.answer()
-                return
-
-        
-            post_service = PostService(session)
-            sent = await post_service.publish_from_state(
-                bot=callback.bot,
-                user_id=user.id,
-                from_chat_id=data["from_chat_id"],
-                message_id=data["message_id"],
-                text=data["text"],
-                photo_file_id=data.get("photo_file_id"),
-                document_file_id=data.get("document_file_id"),
-                community_ids=selected,
-            )
+        picker_edits.cancel(picker_key)
 
+    if callback.data == "schedule":
         await callback.message.edit_text(
-            f"✅ Готово.\n"
+            "🕒 Когда опубликовать?\n\n"
+            f"Отправь время ({settings.SCHEDULE_TIMEZONE}):\n"
+            "• 18:30 — сегодня или завтра\n"
+            "• 25.12 18:30 или 25.12.2026 18:30\n"
+            "• +90m или +2h — через 90 минут / 2 часа",
+            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
+                [InlineKeyboardButton(text="❌ Отмена", callback_data="cancel")]
+            ]),
+        )
+        await state.set_state(CreatePostState.waiting_for_publish_time)
+        await callback.answer()
+        return
+
+    if callback.data == "confirm":
+        _, targets = await save_post(data, selected, db_user)
+
+        # Доставка идёт в фоне воркерами outbox
+        outbox.notify()
+
+        await callback.message.edit_text(
+            f"✅ Пост поставлен в очередь на публикацию.\n"
             f"Всего выбрано: {len(selected)}\n"
-            f"Успешно: {sent}"
+            f"В очереди: {targets}"
         )
         await state.clear()
         await callback.answer()
+
+
+@router.callback_query(CreatePostState.waiting_for_publish_time, F.data == "cancel")
+async def publish_time_cancel(callback: CallbackQuery, state: FSMContext):
+    await callback.message.edit_text("Отменено.")
+    await state.clear()
+    await callback.answer()
+
+
+@router.message(CreatePostState.waiting_for_publish_time)
+async def publish_time_received(message: Message, state: FSMContext, outbox: Outbox, db_user: CachedUser):
+    now = datetime.now(timezone.utc)
+    publish_at = parse_publish_at(message.text or "", now)
+    if publish_at is None:
+        await message.answer("❌ Не понял время. Пример: 18:30, 25.12 18:30 или +2h")
+        return
+    if publish_at <= now:
+        await message.answer("❌ Это время уже прошло. Укажи время в будущем.")
+        return
+
+    data = await state.get_data()
+    selected = data.get("selected", [])
+    post, targets = await save_post(data, selected, db_user, publish_at=publish_at)
+    outbox.schedule(post.id, publish_at)
+
+    await message.answer(
+        f"🕒 Пост запланирован на {publish_at.astimezone(schedule_tz):%d.%m.%Y %H:%M} "
+        f"({settings.SCHEDULE_TIMEZONE}).\n"
+        f"Сообществ: {targets}"
+    )
+    await state.clear()
@@ -2,28 +2,15 @@ from aiogram import Router
 from aiogram.filters import Command
 from aiogram.types import Message
 
-from database import async_session_maker
-from models import User
-from sqlalchemy import select
+from services.user_service import user_cache
 
 router = Router()
 
 
 @router.message(Command("start"))
 async def cmd_start(message: Message):
-    async with async_session_maker() as session:
-        result = await session.execute(
-            select(User).where(User.telegram_id == message.from_user.id)
-        )
-        user = result.scalar_one_or_none()
-
-        if not user:
-            user = User(
-                telegram_id=message.from_user.id,
-                username=message.from_user.username
-            )
-            session.add(user)
-            await session.commit()
+    # Пользователь уже создан UserMiddleware; обновляем username и сбрасываем кэш
+    await user_cache.refresh(message.from_user)
 
     await message.answer(
         "Привет! Я бот для публикации постов в Telegram и VK.\n\n"
@@ -31,6 +18,8 @@ async def cmd_start(message: Message):
         "/add_community — добавить канал/группу\n"
         "/my_communities — список сообществ\n"
         "/new_post — создать пост и опубликовать\n"
+        "/my_posts — история постов\n"
+        "/mirror — зеркало канала в VK\n"
         "/forward_to_vk — переслать реплаем в VK\n"
         "/help — справка"
     )
@@ -43,5 +32,7 @@ async def cmd_help(message: Message):
         "/add_community — добавить канал/группу\n"
         "/my_communities — список сообществ\n"
         "/new_post — создать пост и опубликовать\n"
+        "/my_posts — история постов\n"
+        "/mirror — автоматически публиковать посты канала в VK\n"
         "/forward_to_vk — ответь на сообщение и отправь в VK\n"
     )
@@ -1,22 +1,66 @@
-from aiogram import Bot, Dispatcher
+from aiogram import Dispatcher
 from aiogram.fsm.storage.memory import MemoryStorage
 import asyncio
 
-from config import BOT_TOKEN
-from database import init_db
-from handlers import start, communities, posts, forwarding
+from config import BOT_TOKEN, settings
+from database import async_session_maker, init_db
+from handlers import admin, start, communities, history, mirror, posts, forwarding
+from middlewares.tracing import TracingMiddleware
+from middlewares.user import UserMiddleware
+from services.bot_factory import create_bot
+from services.executors import shutdown_executors
+from services.fsm_storage import SQLStorage
+from services.metrics import start_metrics_server
+from services.mirror import mirror_pipeline
+from services.outbox import Outbox
+from services.stats_service import StatsService
+from services.status_recorder import status_recorder
+from services.vk_clients import vk_clients
+from services.vk_transport import vk_transport
+from webhook import run_webhook
 
 async def main():
     await init_db()
-    bot = Bot(token=BOT_TOKEN)
-    dp = Dispatcher(storage=MemoryStorage())
+    async with async_session_maker() as session:
+        await StatsService(session).load_counters()
+    await mirror_pipeline.load()
+    mirror_pipeline.start()
+    metrics_server = await start_metrics_server()
+
+    bot = create_bot(BOT_TOKEN)
+    storage = SQLStorage() if settings.FSM_STORAGE == "sql" else MemoryStorage()
+    dp = Dispatcher(storage=storage)
+    dp.update.outer_middleware(TracingMiddleware())
+    dp.update.outer_middleware(UserMiddleware())
 
     dp.include_router(start.router)
+    dp.include_router(admin.router)
     dp.include_router(communities.router)
+    # До posts: /my_posts и листание работают в любом состоянии создания поста
+    dp.include_router(history.router)
+    dp.include_router(mirror.router)
     dp.include_router(posts.router)
     dp.include_router(forwarding.router)
 
-    await dp.start_polling(bot)
+    outbox = Outbox(bot)
+    dp["outbox"] = outbox
+    if settings.OUTBOX_IN_BOT:
+        await outbox.start()
+
+    try:
+        if settings.BOT_MODE == "webhook":
+            await run_webhook(bot, dp)
+        else:
+            await dp.start_polling(bot)
+    finally:
+        await outbox.stop()
+        await mirror_pipeline.stop()
+        await status_recorder.close()
+        await vk_transport.close()
+        vk_clients.close()
+        if metrics_server is not None:
+            await metrics_server.cleanup()
+        shutdown_executors()
 
 if __name__ == "__main__":
     asyncio.run(main())
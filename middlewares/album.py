@@ -0,0 +1,59 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message, TelegramObject
+
+from config import settings
+
+
+class _Album:
+    __slots__ = ("messages", "updated")
+
+    def __init__(self, first: Message):
+        self.messages: List[Message] = [first]
+        self.updated = time.monotonic()
+
+
+class AlbumMiddleware(BaseMiddleware):
+    """
+    Собирает сообщения одного альбома (media_group_id) — Telegram присылает их
+    отдельными апдейтами. Обработчик вызывается один раз, на первом сообщении,
+    после паузы ALBUM_WINDOW_MS без новых частей; все сообщения альбома
+    (по возрастанию message_id) передаются в аргументе album.
+    """
+
+    def __init__(self, window: float = settings.ALBUM_WINDOW_MS / 1000):
+        self.window = window
+        self._albums: Dict[Tuple[int, str], _Album] = {}
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if not isinstance(event, Message) or not event.media_group_id:
+            return await handler(event, data)
+
+        key = (event.chat.id, event.media_group_id)
+        album = self._albums.get(key)
+        if album is not None:
+            album.messages.append(event)
+            album.updated = time.monotonic()
+            return None
+
+        album = _Album(event)
+        self._albums[key] = album
+        try:
+            while True:
+                remaining = album.updated + self.window - time.monotonic()
+                if remaining <= 0:
+                    break
+                await asyncio.sleep(remaining)
+        finally:
+            self._albums.pop(key, None)
+
+        data["album"] = sorted(album.messages, key=lambda m: m.message_id)
+        return await handler(event, data)
@@ -0,0 +1,51 @@
+import re
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from services.tracing import tracer
+
+# Хвостовой id в callback data вида "sel_<id>"
+_CALLBACK_ID = re.compile(r"_-?\d+$")
+
+
+def callback_name(data: str) -> str:
+    """
+    Вид кнопки без id: "mirror:vk:1:2" -> "mirror", "sel_15" -> "sel".
+    Иначе каждое сообщество давало бы отдельное имя трассы.
+    """
+    return _CALLBACK_ID.sub("", data.split(":")[0])
+
+
+def update_name(update: Update) -> str:
+    """
+    Короткое имя апдейта для трассы: тип и команда / вид callback data.
+    """
+    if update.message is not None:
+        text = update.message.text or ""
+        if text.startswith("/"):
+            # "/start@bot payload" -> "/start"
+            return f"message {text.split()[0].split('@')[0]}"
+        return f"message {update.message.content_type.value}"
+    if update.callback_query is not None:
+        return f"callback {callback_name(update.callback_query.data or '')}"
+    return update.event_type
+
+
+class TracingMiddleware(BaseMiddleware):
+    """
+    Внешний middleware апдейтов: вся обработка апдейта — одна трасса.
+    Регистрируется первым, чтобы в трассу попадали остальные middleware.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if not isinstance(event, Update):
+            return await handler(event, data)
+        with tracer.trace(update_name(event), update_id=event.update_id):
+            return await handler(event, data)
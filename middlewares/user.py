@@ -0,0 +1,24 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, User as TelegramUser
+
+from services.user_service import user_cache
+
+
+class UserMiddleware(BaseMiddleware):
+    """
+    Один раз на апдейт находит (или создаёт) пользователя и кладёт его
+    в аргументы обработчиков как db_user: CachedUser.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        tg_user: TelegramUser = data.get("event_from_user")
+        if tg_user is not None and not tg_user.is_bot:
+            data["db_user"] = await user_cache.resolve(tg_user)
+        return await handler(event, data)
@@ -0,0 +1,145 @@
+"""
+Версионные миграции схемы.
+
+create_all создаёт только недостающие таблицы и не меняет существующие,
+поэтому изменения уже развёрнутых таблиц описываются здесь шагами с номерами.
+Применённые версии записываются в schema_version; каждый шаг идемпотентен,
+так что на свежей базе (где create_all уже создал всё нужное) он ничего не меняет.
+
+Новая колонка в существующей таблице models.py требует шага здесь же, в том же
+изменении. После миграций check_schema сверяет таблицы с моделями: если колонки
+не хватает, процесс не стартует, а не падает позже на запросах outbox.
+"""
+import logging
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+from sqlalchemy.engine import Connection
+
+logger = logging.getLogger(__name__)
+
+# Ключ pg_advisory_xact_lock: бот и worker.py не мигрируют базу одновременно
+_PG_LOCK_KEY = 7_401_001
+
+_metadata = MetaData()
+
+schema_version = Table(
+    "schema_version",
+    _metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String(255), nullable=False),
+    Column("applied_at", DateTime(timezone=True), nullable=False),
+)
+
+
+def _timestamp(conn: Connection) -> str:
+    return "TIMESTAMP WITH TIME ZONE" if conn.dialect.name == "postgresql" else "DATETIME"
+
+
+def _add_columns(conn: Connection, table: str, columns: Dict[str, str]) -> None:
+    existing = {c["name"] for c in inspect(conn).get_columns(table)}
+    for name, ddl in columns.items():
+        if name not in existing:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+
+
+def _create_index(conn: Connection, name: str, table: str, columns: Sequence[str], unique: bool = False) -> None:
+    kind = "UNIQUE INDEX" if unique else "INDEX"
+    conn.execute(text(f"CREATE {kind} IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"))
+
+
+def _v1_outbox_columns(conn: Connection) -> None:
+    ts = _timestamp(conn)
+    _add_columns(conn, "posts", {
+        "text": "TEXT",
+        "media": "JSON",
+    })
+    _add_columns(conn, "post_to_community", {
+        "attempts": "INTEGER NOT NULL DEFAULT 0",
+        "next_attempt_at": ts,
+        "last_error": "TEXT",
+        "locked_by": "VARCHAR(64)",
+        "locked_until": ts,
+    })
+
+
+def _v2_indexes(conn: Connection) -> None:
+    # Перед уникальным индексом убираем дубли сообществ: ссылки переводим
+    # на самую раннюю запись, остальные копии удаляем
+    keep = "SELECT MIN(id) FROM communities GROUP BY user_id, platform, community_id"
+    conn.execute(text(f"""
+        UPDATE post_to_community SET community_id = (
+            SELECT MIN(c2.id) FROM communities c1
+            JOIN communities c2
+              ON c2.user_id = c1.user_id AND c2.platform = c1.platform AND c2.community_id = c1.community_id
+            WHERE c1.id = post_to_community.community_id
+        )
+        WHERE community_id NOT IN ({keep})
+    """))
+    removed = conn.execute(text(f"DELETE FROM communities WHERE id NOT IN ({keep})")).rowcount
+    if removed:
+        logger.warning(f"Removed {removed} duplicate communities")
+
+    _create_index(conn, "uq_communities_user_platform_community", "communities",
+                  ["user_id", "platform", "community_id"], unique=True)
+    _create_index(conn, "ix_posts_user_created", "posts", ["user_id", "created_at"])
+    _create_index(conn, "ix_ptc_post_status", "post_to_community", ["post_id", "status"])
+    _create_index(conn, "ix_ptc_status_next_attempt", "post_to_community", ["status", "next_attempt_at"])
+    _create_index(conn, "ix_ptc_community", "post_to_community", ["community_id"])
+
+
+def _v3_album_messages(conn: Connection) -> None:
+    _add_columns(conn, "posts", {"message_ids": "JSON"})
+
+
+def _v4_scheduled_posts(conn: Connection) -> None:
+    _add_columns(conn, "posts", {"publish_at": _timestamp(conn)})
+    _create_index(conn, "ix_posts_publish_at", "posts", ["publish_at"])
+
+
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "outbox columns on posts and post_to_community", _v1_outbox_columns),
+    (2, "indexes and unique communities", _v2_indexes),
+    (3, "album message ids on posts", _v3_album_messages),
+    (4, "scheduled posts", _v4_scheduled_posts),
+]
+
+
+def check_schema(conn: Connection, metadata: MetaData) -> None:
+    """
+    Проверяет, что у существующих таблиц есть все колонки моделей.
+    """
+    inspector = inspect(conn)
+    missing = []
+    for table in metadata.sorted_tables:
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        missing += [f"{table.name}.{c.name}" for c in table.columns if c.name not in existing]
+    if missing:
+        raise RuntimeError(f"Database schema is missing columns (no migration step?): {', '.join(missing)}")
+
+
+def run_migrations(conn: Connection) -> List[int]:
+    """
+    Применяет недостающие миграции в текущей транзакции.
+    Возвращает номера применённых версий.
+    """
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _PG_LOCK_KEY})
+
+    _metadata.create_all(conn)
+    applied = set(conn.execute(select(schema_version.c.version)).scalars())
+
+    done = []
+    for version, description, step in MIGRATIONS:
+        if version in applied:
+            continue
+        logger.info(f"Applying migration {version}: {description}")
+        step(conn)
+        conn.execute(schema_version.insert().values(
+            version=version,
+            description=description,
+            applied_at=datetime.now(timezone.utc),
+        ))
+        done.append(version)
+    return done
@@ -1,4 +1,4 @@
-from sqlalchemy import Integer, String, Text, DateTime, ForeignKey, BigInteger, Enum as SQLEnum, JSON
+from sqlalchemy import Integer, String, Text, DateTime, ForeignKey, BigInteger, Enum as SQLEnum, JSON, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship, DeclarativeBase
 from datetime import datetime, timezone
 from typing import List, Optional
@@ -29,6 +29,11 @@ class PlatformType(enum.Enum):
 
 class Community(Base):
     __tablename__ = "communities"
+    __table_args__ = (
+        # Одно и то же сообщество не добавляется пользователю дважды;
+        # индекс также покрывает выборки по user_id
+        Index("uq_communities_user_platform_community", "user_id", "platform", "community_id", unique=True),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"), nullable=False)
@@ -44,12 +49,25 @@ class Community(Base):
 
 class Post(Base):
     __tablename__ = "posts"
-    
+    __table_args__ = (
+        Index("ix_posts_user_created", "user_id", "created_at"),
+        # Планировщик читает ближайшие по времени отложенные посты
+        Index("ix_posts_publish_at", "publish_at"),
+    )
+
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"), nullable=False)
     
     message_id: Mapped[int] = mapped_column(Integer, nullable=False)
     from_chat_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+
+    # Содержимое для доставки воркерами: текст для VK и фото [{file_id, file_unique_id}]
+    text: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    media: Mapped[Optional[list]] = mapped_column(JSON, nullable=True)
+    # Все сообщения альбома для copy_messages (None — одно сообщение message_id)
+    message_ids: Mapped[Optional[list]] = mapped_column(JSON, nullable=True)
+    # Отложенная публикация (UTC); None — сразу
+    publish_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
     
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
 
@@ -65,6 +83,12 @@ class PostStatus(enum.Enum):
 
 class PostToCommunity(Base):
     __tablename__ = "post_to_community"
+    __table_args__ = (
+        Index("ix_ptc_post_status", "post_id", "status"),
+        # Выборка outbox: PENDING-строки по возрастанию next_attempt_at
+        Index("ix_ptc_status_next_attempt", "status", "next_attempt_at"),
+        Index("ix_ptc_community", "community_id"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     post_id: Mapped[int] = mapped_column(Integer, ForeignKey("posts.id"), nullable=False)
@@ -72,5 +96,69 @@ class PostToCommunity(Base):
     status: Mapped[PostStatus] = mapped_column(SQLEnum(PostStatus), default=PostStatus.PENDING)
     sent_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
 
+    # Outbox: PENDING-строки с next_attempt_at <= now забирают воркеры доставки
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    next_attempt_at: Mapped[Optional[datetime]] = mapped_column(
+        DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=True
+    )
+    last_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    # Аренда строки воркером: пока locked_until в будущем, другие процессы её не берут
+    locked_by: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+    locked_until: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+
     post: Mapped["Post"] = relationship(back_populates="communities")
     community: Mapped["Community"] = relationship(back_populates="posts")
+
+
+class ChannelMirror(Base):
+    """
+    Автоматическое зеркалирование Telegram-канала (администрируемого ботом) в VK группу.
+    """
+    __tablename__ = "channel_mirrors"
+    __table_args__ = (
+        Index("uq_channel_mirrors_channel_vk", "channel_id", "vk_community_id", unique=True),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"), nullable=False)
+    # Числовой id канала (chat.id в channel_post)
+    channel_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    tg_community_id: Mapped[int] = mapped_column(Integer, ForeignKey("communities.id"), nullable=False)
+    vk_community_id: Mapped[int] = mapped_column(Integer, ForeignKey("communities.id"), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+
+
+class MirroredPost(Base):
+    """
+    Пост канала -> пост на стене VK группы, для wall.edit при редактировании.
+    У альбома по строке на каждое сообщение, все указывают на один пост VK.
+    """
+    __tablename__ = "mirrored_posts"
+    __table_args__ = (
+        Index("uq_mirrored_posts_message", "channel_id", "message_id", "community_id", unique=True),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    channel_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    message_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    community_id: Mapped[int] = mapped_column(Integer, ForeignKey("communities.id"), nullable=False)
+    vk_post_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    # Текущее содержимое поста VK: wall.edit заменяет текст и вложения целиком
+    text: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    attachments: Mapped[Optional[list]] = mapped_column(JSON, nullable=True)
+    # Индекс фото этого сообщения в attachments (None — сообщение без фото)
+    position: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    # Фото сообщения: при правке загружается заново, только если фото заменили
+    file_unique_id: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+
+
+class FSMRecord(Base):
+    __tablename__ = "fsm_states"
+
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    state: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    data: Mapped[Optional[dict]] = mapped_column(JSON, nullable=True)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=lambda: datetime.now(timezone.utc)
+    )
@@ -0,0 +1,300 @@
+"""
+Нагрузочный тест публикации против локальных заглушек Telegram и VK (scripts/fake_apis.py).
+
+    python scripts/bench_publish.py --users 50 --communities 20 --posts 3
+    python scripts/bench_publish.py --scenario forward --vk-share 1 --latency-ms 80
+    python scripts/bench_publish.py --flood-rate 0.02 --error-rate 0.01 --real-limits
+
+Заглушки запускаются отдельным процессом (или берутся по --api-url), бот направляется
+на них через TELEGRAM_API_URL / VK_API_URL. N пользователей с M сообществами каждый
+(доля VK — --vk-share) публикуют посты одновременно:
+- publish — PostService.publish_from_state (пост + доставка в текущей корутине);
+- forward — ForwardingService.forward_reply_to_all_vk (ответ в ЛС уходит во все VK группы).
+
+Результат: доставки в секунду, p50/p99 времени одной публикации, RSS, время запросов к БД
+и счётчики заглушек. По умолчанию база — временный SQLite, лимиты Telegram/VK сняты
+(--real-limits оставляет настройки из .env), чтобы мерить сам путь рассылки.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import aiohttp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from scripts.fake_apis import add_fault_arguments  # noqa: E402
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def configure(args: argparse.Namespace, api_url: str, workdir: str) -> None:
+    """
+    Переменные окружения для config.Settings — до импорта модулей проекта.
+    """
+    os.environ.setdefault("BOT_TOKEN", "123456:bench")
+    os.environ.setdefault("VK_USER_TOKEN", "vk1.a.bench-user")
+    os.environ["DATABASE_URL"] = args.url or f"sqlite+aiosqlite:///{workdir}/bench.sqlite3"
+    os.environ["TELEGRAM_API_URL"] = api_url
+    os.environ["VK_API_URL"] = api_url + "/method/"
+    os.environ["VK_TRANSPORT"] = "aiohttp"
+    os.environ["METRICS_PORT"] = "0"
+    os.environ["MEDIA_CACHE_DIR"] = os.path.join(workdir, "media_cache")
+    os.environ.setdefault("IMAGE_NORMALIZE", "false")
+    if not args.real_limits:
+        for name in ("TG_GLOBAL_RATE", "TG_PRIVATE_CHAT_RATE", "VK_TOKEN_RATE"):
+            os.environ[name] = "1000000"
+        os.environ["TG_CHAT_RATE_PER_MINUTE"] = "60000000"
+
+
+async def start_fake_apis(args: argparse.Namespace) -> "tuple[str, subprocess.Popen | None]":
+    if args.api_url:
+        return args.api_url.rstrip("/"), None
+
+    port = free_port()
+    cmd = [
+        sys.executable, os.path.join(ROOT, "scripts", "fake_apis.py"), "--port", str(port),
+        "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+        "--error-rate", str(args.error_rate), "--flood-rate", str(args.flood_rate),
+        "--retry-after", str(args.retry_after), "--photo-bytes", str(args.photo_bytes),
+    ]
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    async with aiohttp.ClientSession() as session:
+        for _ in range(100):
+            try:
+                async with session.get(url + "/_stats"):
+                    return url, proc
+            except aiohttp.ClientConnectionError:
+                await asyncio.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError("fake APIs did not start")
+
+
+async def fake_stats(api_url: str) -> dict:
+    async with aiohttp.ClientSession() as session:
+        async with session.get(api_url + "/_stats") as resp:
+            return await resp.json()
+
+
+async def prepare(users: int, per_user: int, vk_share: float) -> dict:
+    """
+    Пересоздаёт таблицы и заводит пользователей с сообществами.
+    Возвращает user_id -> (telegram_id, [id сообществ]).
+    """
+    from sqlalchemy import insert
+
+    from database import engine
+    from migrations import run_migrations
+    from models import Base, Community, PlatformType, User
+
+    now = datetime.now(timezone.utc)
+    vk_per_user = round(per_user * vk_share)
+    rows, owners = [], {}
+    for u in range(1, users + 1):
+        ids = []
+        for k in range(1, per_user + 1):
+            cid = (u - 1) * per_user + k
+            vk = k <= vk_per_user
+            rows.append({
+                "id": cid,
+                "user_id": u,
+                "platform": PlatformType.VK if vk else PlatformType.TELEGRAM,
+                "community_id": str(cid) if vk else str(-1_000_000_000_000 - cid),
+                "community_name": f"bench {cid}",
+                "access_token": f"vk1.a.bench-{cid}" if vk else None,
+                "created_at": now,
+            })
+            ids.append(cid)
+        owners[u] = (1_000_000 + u, ids)
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(run_migrations)
+        await conn.execute(insert(User), [
+            {"id": u, "telegram_id": tg_id, "created_at": now} for u, (tg_id, _) in owners.items()
+        ])
+        await conn.execute(insert(Community), rows)
+    return owners
+
+
+def photo_for(args: argparse.Namespace, n: int):
+    if not args.photos:
+        return None
+    return f"bench-photo-{n % args.photos}"
+
+
+async def run_publish(bot, args, owners, latencies, sent) -> None:
+    from database import async_session_maker
+    from services.post_service import PostService
+
+    async def user_loop(user_id: int, tg_id: int, community_ids) -> None:
+        for n in range(args.posts):
+            photo = photo_for(args, random.randrange(1 << 30))
+            started = time.perf_counter()
+            async with async_session_maker() as session:
+                delivered = await PostService(session).publish_from_state(
+                    bot,
+                    user_id=user_id,
+                    from_chat_id=tg_id,
+                    message_id=n + 1,
+                    text=f"bench post {n} from {user_id}",
+                    photo_file_id=photo,
+                    document_file_id=None,
+                    community_ids=community_ids,
+                    file_unique_id=photo,
+                )
+            sent[0] += delivered
+            latencies.append(time.perf_counter() - started)
+
+    await gather_limited(args.concurrency, [user_loop(u, tg, ids) for u, (tg, ids) in owners.items()])
+
+
+async def run_forward(bot, args, owners, latencies, sent) -> None:
+    from aiogram.types import Message
+
+    from database import async_session_maker
+    from services.forwarding_service import ForwardingService
+
+    async def user_loop(user_id: int, tg_id: int) -> None:
+        for n in range(args.posts):
+            photo = photo_for(args, random.randrange(1 << 30))
+            message = Message.model_validate({
+                "message_id": n + 1,
+                "date": int(time.time()),
+                "chat": {"id": tg_id, "type": "private"},
+                "from": {"id": tg_id, "is_bot": False, "first_name": "Bench"},
+                "caption" if photo else "text": f"bench reply {n} from {user_id}",
+                "photo": [{"file_id": photo, "file_unique_id": photo, "width": 1280, "height": 960}] if photo else None,
+            }).as_(bot)
+            started = time.perf_counter()
+            async with async_session_maker() as session:
+                delivered = await ForwardingService(session).forward_reply_to_all_vk(message, user_id)
+            sent[0] += delivered
+            latencies.append(time.perf_counter() - started)
+
+    await gather_limited(args.concurrency, [user_loop(u, tg) for u, (tg, _) in owners.items()])
+
+
+async def gather_limited(limit: int, coros) -> None:
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def run(coro):
+        async with semaphore:
+            await coro
+
+    await asyncio.gather(*(run(c) for c in coros))
+
+
+def percentile(values, p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return 0.0
+
+
+async def bench(args: argparse.Namespace, api_url: str) -> None:
+    from config import BOT_TOKEN
+    from services.bot_factory import create_bot
+    from services.executors import shutdown_executors
+    from services.metrics import DB_QUERY_DURATION, PUBLISH_DURATION, PUBLISH_RESULTS
+    from services.status_recorder import status_recorder
+    from services.vk_clients import vk_clients
+    from services.vk_transport import vk_transport
+
+    owners = await prepare(args.users, args.communities, args.vk_share)
+    bot = create_bot(BOT_TOKEN)
+    latencies, sent = [], [0]
+    db_before = DB_QUERY_DURATION.total()
+    rss_before = rss_mb()
+
+    started = time.perf_counter()
+    try:
+        if args.scenario == "publish":
+            await run_publish(bot, args, owners, latencies, sent)
+        else:
+            await run_forward(bot, args, owners, latencies, sent)
+        await status_recorder.flush()
+        elapsed = time.perf_counter() - started
+    finally:
+        await status_recorder.close()
+        await bot.session.close()
+        await vk_transport.close()
+        vk_clients.close()
+        shutdown_executors()
+
+    db_count, db_seconds = (a - b for a, b in zip(DB_QUERY_DURATION.total(), db_before))
+    targets = args.users * args.posts * (
+        args.communities if args.scenario == "publish" else round(args.communities * args.vk_share)
+    )
+    print(f"\nscenario={args.scenario} users={args.users} communities={args.communities} "
+          f"posts={args.posts} vk_share={args.vk_share} photos={args.photos}")
+    print(f"  elapsed:      {elapsed:.2f} s")
+    print(f"  delivered:    {sent[0]} / {targets} ({sent[0] / elapsed:.1f} deliveries/s)")
+    print(f"  publish:      {len(latencies) / elapsed:.1f} posts/s, "
+          f"p50 {percentile(latencies, 0.5) * 1000:.1f} ms, p99 {percentile(latencies, 0.99) * 1000:.1f} ms, "
+          f"mean {statistics.fmean(latencies) * 1000 if latencies else 0:.1f} ms")
+    for platform in ("telegram", "vk"):
+        count = PUBLISH_DURATION.count(platform=platform)
+        if count:
+            print(f"  send {platform:<8}  {count} sends, "
+                  f"{int(PUBLISH_RESULTS.value(platform=platform, result='sent'))} ok")
+    print(f"  db:           {db_count} queries, {db_seconds:.2f} s total "
+          f"({db_seconds / elapsed * 100:.0f}% of wall time)")
+    print(f"  rss:          {rss_mb():.0f} MB (start {rss_before:.0f} MB, "
+          f"peak {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB)")
+    print(f"  fake apis:    {json.dumps(await fake_stats(api_url), sort_keys=True)}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=["publish", "forward"], default="publish")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--communities", type=int, default=10, help="сообществ у каждого пользователя")
+    parser.add_argument("--vk-share", type=float, default=0.5, help="доля VK среди сообществ")
+    parser.add_argument("--posts", type=int, default=3, help="публикаций на пользователя")
+    parser.add_argument("--photos", type=int, default=5, help="разных фото в постах (0 — без фото)")
+    parser.add_argument("--concurrency", type=int, default=50, help="пользователей, публикующих одновременно")
+    parser.add_argument("--url", default=None, help="DATABASE_URL (по умолчанию временный SQLite)")
+    parser.add_argument("--api-url", default=None, help="уже запущенный scripts/fake_apis.py")
+    parser.add_argument("--real-limits", action="store_true", help="не снимать лимиты Telegram/VK из настроек")
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    api_url, proc = await start_fake_apis(args)
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            configure(args, api_url, workdir)
+            await bench(args, api_url)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,251 @@
+"""
+Локальные заглушки Telegram Bot API и VK API для бенчмарков.
+
+    python scripts/fake_apis.py --port 8081 --latency-ms 40 --jitter-ms 10 \\
+        --error-rate 0.01 --flood-rate 0.02
+
+Один сервер обслуживает оба API:
+- Telegram: /bot<token>/<method> (getFile, copyMessage, copyMessages, sendMessage)
+  и /file/bot<token>/<path> (скачивание файла); бот: TELEGRAM_API_URL=http://127.0.0.1:8081
+- VK: /method/<method> (wall.post, wall.edit, photos.*, groups.getById, users.get, execute)
+  и /upload (сервер загрузки фото); бот: VK_API_URL=http://127.0.0.1:8081/method/
+- /_stats — JSON со счётчиками запросов, ошибок и флуд-ответов.
+
+Ошибки и флуд-контроль выдаются случайно с заданной вероятностью на каждый вызов:
+Telegram отвечает 400 / 429 (retry_after), VK — ошибкой 100 / 6.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, List, Tuple
+
+from aiohttp import web
+
+
+@dataclass
+class FaultConfig:
+    latency_ms: float = 0
+    jitter_ms: float = 0
+    error_rate: float = 0
+    flood_rate: float = 0
+    retry_after: int = 1
+    photo_bytes: int = 200 * 1024
+    chunk_size: int = 64 * 1024
+
+    async def delay(self) -> None:
+        if self.latency_ms or self.jitter_ms:
+            await asyncio.sleep(max(0.0, random.gauss(self.latency_ms, self.jitter_ms)) / 1000)
+
+    def fault(self) -> str:
+        """
+        "flood", "error" или "" — что ответить на очередной вызов.
+        """
+        r = random.random()
+        if r < self.flood_rate:
+            return "flood"
+        if r < self.flood_rate + self.error_rate:
+            return "error"
+        return ""
+
+
+def parse_execute_code(code: str) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    Разбирает код вида return [API.m1({...}),API.m2({...})]; из VKBatcher.
+    """
+    decoder = json.JSONDecoder()
+    calls = []
+    pos = code.find("API.")
+    while pos != -1:
+        start = pos + len("API.")
+        paren = code.index("(", start)
+        params, end = decoder.raw_decode(code, paren + 1)
+        calls.append((code[start:paren], params))
+        pos = code.find("API.", end)
+    return calls
+
+
+class FakeAPIs:
+    def __init__(self, config: FaultConfig):
+        self.config = config
+        self.stats: Counter = Counter()
+        self._ids = itertools.count(1)
+        self._chunk = random.randbytes(config.chunk_size)
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self.telegram_method)
+        app.router.add_get("/file/bot{token}/{path:.+}", self.telegram_file)
+        app.router.add_post("/method/{method}", self.vk_method)
+        app.router.add_post("/upload", self.vk_upload)
+        app.router.add_get("/_stats", self.get_stats)
+        return app
+
+    async def get_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(dict(self.stats))
+
+    # Telegram
+
+    async def telegram_method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        form = await request.post()
+        self.stats[f"tg.{method}"] += 1
+        await self.config.delay()
+
+        fault = self.config.fault()
+        if fault == "flood":
+            self.stats["tg.flood"] += 1
+            retry_after = self.config.retry_after
+            return web.json_response({
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {retry_after}",
+                "parameters": {"retry_after": retry_after},
+            }, status=429)
+        if fault == "error" and method != "getFile":
+            self.stats["tg.error"] += 1
+            return web.json_response({
+                "ok": False, "error_code": 400, "description": "Bad Request: chat not found",
+            }, status=400)
+
+        return web.json_response({"ok": True, "result": self._telegram_result(method, form)})
+
+    def _telegram_result(self, method: str, form) -> Any:
+        method = method.lower()
+        if method == "getfile":
+            file_id = form.get("file_id", "file")
+            return {
+                "file_id": file_id,
+                "file_unique_id": file_id,
+                "file_size": self.config.photo_bytes,
+                "file_path": f"photos/{file_id}.jpg",
+            }
+        if method == "copymessage":
+            return {"message_id": next(self._ids)}
+        if method == "copymessages":
+            return [{"message_id": next(self._ids)} for _ in json.loads(form.get("message_ids", "[]"))]
+        if method == "sendmessage":
+            chat_id = int(form.get("chat_id", 0))
+            return {
+                "message_id": next(self._ids),
+                "date": 0,
+                "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "channel"},
+                "text": form.get("text", ""),
+            }
+        return True
+
+    async def telegram_file(self, request: web.Request) -> web.StreamResponse:
+        self.stats["tg.download"] += 1
+        await self.config.delay()
+        resp = web.StreamResponse()
+        resp.content_length = self.config.photo_bytes
+        await resp.prepare(request)
+        left = self.config.photo_bytes
+        while left > 0:
+            chunk = self._chunk[:left]
+            await resp.write(chunk)
+            left -= len(chunk)
+        self.stats["tg.download_bytes"] += self.config.photo_bytes
+        return resp
+
+    # VK
+
+    async def vk_method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = dict(await request.post())
+        self.stats[f"vk.{method}"] += 1
+        await self.config.delay()
+
+        fault = self.config.fault()
+        if fault == "flood":
+            self.stats["vk.flood"] += 1
+            return web.json_response({"error": {"error_code": 6, "error_msg": "Too many requests per second"}})
+        if fault == "error":
+            self.stats["vk.error"] += 1
+            return web.json_response({"error": {"error_code": 100, "error_msg": "Invalid parameters"}})
+
+        if method == "execute":
+            results, errors = [], []
+            for sub_method, sub_params in parse_execute_code(params.get("code", "")):
+                self.stats[f"vk.{sub_method}"] += 1
+                try:
+                    results.append(self._vk_result(sub_method, sub_params, request))
+                except KeyError:
+                    results.append(False)
+                    errors.append({"method": sub_method, "error_code": 3, "error_msg": "Unknown method passed"})
+            return web.json_response({"response": results, "execute_errors": errors})
+
+        try:
+            return web.json_response({"response": self._vk_result(method, params, request)})
+        except KeyError:
+            return web.json_response({"error": {"error_code": 3, "error_msg": "Unknown method passed"}})
+
+    def _vk_result(self, method: str, params: Dict[str, Any], request: web.Request) -> Any:
+        if method == "wall.post":
+            return {"post_id": next(self._ids)}
+        if method == "wall.edit":
+            return 1
+        if method == "photos.getWallUploadServer":
+            return {
+                "upload_url": str(request.url.with_path("/upload").with_query({"group_id": params.get("group_id", "")})),
+                "album_id": 1,
+                "user_id": 1,
+            }
+        if method == "photos.saveWallPhoto":
+            return [{"id": next(self._ids), "owner_id": -int(params.get("group_id") or 1)}]
+        if method == "groups.getById":
+            ids = str(params.get("group_ids") or params.get("group_id") or "1").split(",")
+            return [{"id": int(g), "name": f"Bench group {g}", "screen_name": f"club{g}"} for g in ids]
+        if method == "users.get":
+            return [{"id": 1, "first_name": "Bench", "last_name": "User"}]
+        raise KeyError(method)
+
+    async def vk_upload(self, request: web.Request) -> web.Response:
+        self.stats["vk.upload"] += 1
+        received = 0
+        async for chunk in request.content.iter_any():
+            received += len(chunk)
+        self.stats["vk.upload_bytes"] += received
+        await self.config.delay()
+        return web.json_response({
+            "server": 1,
+            "photo": json.dumps([{"photo": f"p{next(self._ids)}"}]),
+            "hash": "bench",
+        })
+
+
+def add_fault_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency-ms", type=float, default=20, help="средняя задержка ответа")
+    parser.add_argument("--jitter-ms", type=float, default=5, help="стандартное отклонение задержки")
+    parser.add_argument("--error-rate", type=float, default=0, help="доля вызовов с ошибкой")
+    parser.add_argument("--flood-rate", type=float, default=0, help="доля вызовов с флуд-контролем")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after в ответах Telegram 429")
+    parser.add_argument("--photo-bytes", type=int, default=200 * 1024, help="размер файлов Telegram")
+
+
+def fault_config(args: argparse.Namespace) -> FaultConfig:
+    return FaultConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        flood_rate=args.flood_rate,
+        retry_after=args.retry_after,
+        photo_bytes=args.photo_bytes,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    web.run_app(FakeAPIs(fault_config(args)).app(), host=args.host, port=args.port, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Отправляет поддельные апдейты Telegram на локальный webhook бота.
+
+    python scripts/fake_update.py --url http://127.0.0.1:8080/webhook --secret SECRET --text /start
+    python scripts/fake_update.py --count 500 --concurrency 50 --text /help
+
+Бот обработает апдейты как настоящие; ответы уйдут в Telegram API от имени бота.
+"""
+import argparse
+import asyncio
+import itertools
+import time
+
+import aiohttp
+
+_update_ids = itertools.count(int(time.time()))
+
+
+def build_update(user_id: int, text: str) -> dict:
+    now = int(time.time())
+    update_id = next(_update_ids)
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id % 1_000_000,
+            "date": now,
+            "chat": {"id": user_id, "type": "private", "first_name": "Test"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Test"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+            if text.startswith("/") else [],
+        },
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8080/webhook")
+    parser.add_argument("--secret", default=None)
+    parser.add_argument("--text", default="/help")
+    parser.add_argument("--user-id", type=int, default=1)
+    parser.add_argument("--count", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=1)
+    args = parser.parse_args()
+
+    headers = {"X-Telegram-Bot-Api-Secret-Token": args.secret} if args.secret else {}
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    statuses = {}
+
+    async with aiohttp.ClientSession(headers=headers) as session:
+        async def post_one(i: int) -> None:
+            async with semaphore:
+                started = time.perf_counter()
+                async with session.post(args.url, json=build_update(args.user_id + i % args.concurrency, args.text)) as resp:
+                    await resp.read()
+                    statuses[resp.status] = statuses.get(resp.status, 0) + 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(post_one(i) for i in range(args.count)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    print(f"sent={args.count} statuses={statuses} elapsed={elapsed:.2f}s "
+          f"rate={args.count / elapsed:.1f}/s p50={p50:.1f}ms p99={p99:.1f}ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
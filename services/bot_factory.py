@@ -0,0 +1,19 @@
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import PRODUCTION, TelegramAPIServer
+
+from config import settings
+from services.metrics import TelegramMetricsMiddleware
+from services.rate_limiter import TelegramFloodMiddleware
+
+
+def create_bot(token: str) -> Bot:
+    """
+    Bot с общими middleware сессии: лимиты Telegram (снаружи) и метрики запросов.
+    TELEGRAM_API_URL подменяет адрес Bot API.
+    """
+    api = TelegramAPIServer.from_base(settings.TELEGRAM_API_URL) if settings.TELEGRAM_API_URL else PRODUCTION
+    session = AiohttpSession(api=api)
+    session.middleware(TelegramFloodMiddleware())
+    session.middleware(TelegramMetricsMiddleware())
+    return Bot(token=token, session=session)
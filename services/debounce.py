@@ -0,0 +1,34 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+class Debouncer:
+    """
+    Откладывает действие на delay секунд; повторный schedule с тем же ключом
+    отменяет предыдущее ожидающее действие. Уже начатое действие не прерывается.
+    """
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self._pending: Dict[Hashable, asyncio.Task] = {}
+
+    def schedule(self, key: Hashable, action: Callable[[], Awaitable[None]]) -> None:
+        self.cancel(key)
+        self._pending[key] = asyncio.create_task(self._run(key, action))
+
+    def cancel(self, key: Hashable) -> None:
+        task = self._pending.pop(key, None)
+        if task is not None and not task.done():
+            task.cancel()
+
+    async def _run(self, key: Hashable, action: Callable[[], Awaitable[None]]) -> None:
+        await asyncio.sleep(self.delay)
+        # После этого момента действие уже не отменяется новым schedule
+        self._pending.pop(key, None)
+        try:
+            await action()
+        except Exception as e:
+            logger.error(f"Debounced action error: {e}")
@@ -0,0 +1,93 @@
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, TypeVar
+
+from config import settings
+from services.metrics import registry
+from services.tracing import tracer
+
+T = TypeVar("T")
+
+# Отдельный пул для блокирующих вызовов vk_api, чтобы они не занимали
+# общий default executor и не задерживали остальные обработчики.
+vk_executor = ThreadPoolExecutor(
+    max_workers=settings.VK_EXECUTOR_WORKERS,
+    thread_name_prefix="vk",
+)
+
+# Дисковые операции кэша медиа (чтение/запись кусков файлов)
+file_executor = ThreadPoolExecutor(
+    max_workers=settings.MEDIA_CACHE_IO_WORKERS,
+    thread_name_prefix="media-io",
+)
+
+# Перекодирование изображений нагружает CPU — отдельные процессы (spawn: без копии
+# потоков и соединений родителя), чтобы не держать GIL и цикл событий.
+# Дочерний процесс при старте импортирует __main__ заново — процессы долгоживущие
+def _new_image_executor() -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(
+        max_workers=settings.IMAGE_NORMALIZE_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+
+
+image_executor = _new_image_executor()
+
+
+def _queue_depths() -> Dict[tuple, float]:
+    # Задачи, которые ждут свободного потока/процесса (у ProcessPoolExecutor —
+    # вместе с выполняемыми)
+    return {
+        ("vk",): vk_executor._work_queue.qsize(),
+        ("media_io",): file_executor._work_queue.qsize(),
+        ("image",): len(image_executor._pending_work_items),
+    }
+
+
+registry.gauge("executor_queue_depth", "Очередь задач пулов исполнителей", ["executor"], collect=_queue_depths)
+
+
+async def run_in_vk_executor(func: Callable[..., T], *args: Any) -> T:
+    loop = asyncio.get_running_loop()
+    with tracer.span("executor.vk") as span:
+        if span is None:
+            return await loop.run_in_executor(vk_executor, func, *args)
+
+        submitted = time.perf_counter()
+
+        def run() -> T:
+            # Сколько задача ждала свободного потока
+            span.attrs["queued_ms"] = round((time.perf_counter() - submitted) * 1000)
+            return func(*args)
+
+        return await loop.run_in_executor(vk_executor, run)
+
+
+async def run_in_file_executor(func: Callable[..., T], *args: Any) -> T:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(file_executor, func, *args)
+
+
+async def run_in_image_executor(func: Callable[..., T], *args: Any) -> T:
+    global image_executor
+    loop = asyncio.get_running_loop()
+    executor = image_executor
+    try:
+        with tracer.span("executor.image", queued=len(executor._pending_work_items)):
+            return await loop.run_in_executor(executor, func, *args)
+    except BrokenProcessPool:
+        # Процесс упал (например, нехватка памяти на огромном файле) — пул больше
+        # не принимает задачи; следующие вызовы пойдут в новый
+        if image_executor is executor:
+            image_executor = _new_image_executor()
+            executor.shutdown(wait=False, cancel_futures=True)
+        raise
+
+
+def shutdown_executors() -> None:
+    vk_executor.shutdown(wait=False, cancel_futures=True)
+    file_executor.shutdown(wait=False, cancel_futures=True)
+    image_executor.shutdown(wait=False, cancel_futures=True)
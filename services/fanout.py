@@ -0,0 +1,88 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Tuple, TypeVar
+
+from config import settings
+from models import PlatformType
+from services.metrics import PUBLISH_DURATION, PUBLISH_RESULTS
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class FanoutEngine:
+    """
+    Параллельная рассылка по целям с лимитом одновременных запросов на платформу.
+    Семафоры общие для всех постов, поэтому несколько одновременных публикаций
+    не превышают лимит платформы суммарно.
+    """
+
+    def __init__(self, limits: Dict[PlatformType, int]):
+        self._semaphores = {platform: asyncio.Semaphore(max(1, n)) for platform, n in limits.items()}
+
+    def _semaphore(self, platform: PlatformType) -> Optional[asyncio.Semaphore]:
+        return self._semaphores.get(platform)
+
+    async def _send_one(
+        self,
+        target: T,
+        platform: PlatformType,
+        send: Callable[[T], Awaitable[bool]],
+    ) -> Tuple[T, bool, Optional[str]]:
+        sem = self._semaphore(platform)
+        try:
+            if sem is None:
+                ok = await self._timed(platform, send, target)
+            else:
+                async with sem:
+                    ok = await self._timed(platform, send, target)
+            PUBLISH_RESULTS.inc(platform=platform.value, result="sent" if ok else "failed")
+            return target, ok, None if ok else f"{platform.value}: delivery failed"
+        except Exception as e:
+            logger.error(f"Fan-out send error ({platform.value}): {e}")
+            PUBLISH_RESULTS.inc(platform=platform.value, result="error")
+            return target, False, f"{platform.value}: {e}"
+
+    @staticmethod
+    async def _timed(platform: PlatformType, send: Callable[[T], Awaitable[bool]], target: T) -> bool:
+        # Время самой отправки, без ожидания семафора платформы
+        started = time.perf_counter()
+        try:
+            return await send(target)
+        finally:
+            PUBLISH_DURATION.observe(time.perf_counter() - started, platform=platform.value)
+
+    async def run(
+        self,
+        targets: Iterable[T],
+        platform_of: Callable[[T], PlatformType],
+        send: Callable[[T], Awaitable[bool]],
+        on_result: Callable[[T, bool, Optional[str]], Awaitable[None]],
+    ) -> int:
+        """
+        Запускает send для всех целей одновременно (в пределах лимитов).
+        on_result(target, ok, error) вызывается последовательно по мере завершения
+        отправок, поэтому внутри него можно работать с одной AsyncSession.
+        Возвращает количество успешных отправок.
+        """
+        tasks = [asyncio.create_task(self._send_one(t, platform_of(t), send)) for t in targets]
+        sent_ok = 0
+        try:
+            for fut in asyncio.as_completed(tasks):
+                target, ok, error = await fut
+                await on_result(target, ok, error)
+                if ok:
+                    sent_ok += 1
+        finally:
+            for t in tasks:
+                if not t.done():
+                    t.cancel()
+        return sent_ok
+
+
+fanout_engine = FanoutEngine({
+    PlatformType.TELEGRAM: settings.FANOUT_TELEGRAM_CONCURRENCY,
+    PlatformType.VK: settings.FANOUT_VK_CONCURRENCY,
+})
@@ -1,12 +1,17 @@
-import os
-from typing import List
+import logging
+
 from sqlalchemy import select
 
 from aiogram.types import Message
 
 from models import Community, PlatformType
+from services.media import MediaRef
+from services.image_normalizer import vk_upload_stream
+from services.vk_attachments import attachment_planner
+from services.tracing import tracer
 from services.vk_service import VKService
 
+logger = logging.getLogger(__name__)
 
 class ForwardingService:
     def __init__(self, session):
@@ -20,42 +25,33 @@ class ForwardingService:
             )
         )
         vk_groups = result.scalars().all()
+        # Не держим транзакцию открытой на время загрузок и отправок
+        await self.session.commit()
         if not vk_groups:
             return 0
 
         text = message.text or message.caption or ""
-        photo_paths = await self._download_single_photo(message)
+        media = []
+        if message.photo:
+            best = message.photo[-1]
+            media.append(MediaRef(file_id=best.file_id, file_unique_id=best.file_unique_id, file_size=best.file_size))
+
+        vk_groups = [g for g in vk_groups if g.access_token]
+        with tracer.span("vk.plan", groups=len(vk_groups), media=len(media)):
+            plan = await attachment_planner.plan(
+                [g.community_id for g in vk_groups], media, lambda m: vk_upload_stream(message.bot, m)
+            )
 
         sent = 0
         for g in vk_groups:
-            if not g.access_token:
-                continue
             vk = VKService(g.access_token)
-            post_id = await vk.post_to_wall(g.community_id, text, photo_paths or None)
+            attachments = plan.get(str(g.community_id).replace("-", ""))
+            if attachments is None:
+                logger.error(f"Forward to VK group {g.community_id} skipped: photo upload failed")
+                continue
+            with tracer.span("send.vk"):
+                post_id = await vk.post_to_wall(g.community_id, text, attachments or None)
             if post_id:
                 sent += 1
 
-        for p in photo_paths:
-            try:
-                os.remove(p)
-            except OSError:
-                pass
-
         return sent
-
-    async def _download_single_photo(self, message: Message) -> List[str]:
-        try:
-            if not message.photo:
-                return []
-            best = message.photo[-1]
-            file = await message.bot.get_file(best.file_id)
-            data = await message.bot.download_file(file.file_path)
-
-            os.makedirs("tmp_photos", exist_ok=True)
-            path = os.path.join("tmp_photos", f"{best.file_id}.jpg")
-            with open(path, "wb") as f:
-                f.write(data.read())
-
-            return [path]
-        except Exception:
-            return []
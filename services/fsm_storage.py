@@ -0,0 +1,209 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from sqlalchemy import delete
+
+from config import settings
+from database import async_session_maker, dialect_insert
+from models import FSMRecord
+
+logger = logging.getLogger(__name__)
+
+
+class _Entry:
+    __slots__ = ("state", "data", "loaded_at")
+
+    def __init__(self, state: Optional[str], data: Dict[str, Any]):
+        self.state = state
+        self.data = data
+        self.loaded_at = time.monotonic()
+
+
+class SQLStorage(BaseStorage):
+    """
+    FSM-хранилище в таблице fsm_states с write-behind кэшем в памяти.
+    Чтения обслуживаются из ограниченного LRU-кэша (свежесть FSM_CACHE_TTL),
+    записи копятся и сбрасываются в БД пачкой раз в FSM_FLUSH_INTERVAL
+    или при FSM_FLUSH_BATCH изменённых ключах.
+    Несколько кликов подряд по клавиатуре стоят одной записи в БД.
+
+    Кэш верен, только пока все апдейты пользователя обрабатывает один процесс.
+    Если реплик несколько (webhook за балансировщиком), нужен shared (FSM_SHARED):
+    запись сразу уходит в БД, а чтение берёт из кэша только ключи с ещё не
+    записанными изменениями этой реплики, остальное читается из БД. Иначе
+    следующий клик, попавший на другую реплику, увидел бы старое состояние
+    (потерянный выбор сообществ, подтверждение по старым данным). Цена — запрос
+    к БД на каждое чтение и запись состояния.
+    """
+
+    def __init__(
+        self,
+        session_maker=async_session_maker,
+        cache_size: int = settings.FSM_CACHE_SIZE,
+        cache_ttl: float = settings.FSM_CACHE_TTL,
+        flush_interval: float = settings.FSM_FLUSH_INTERVAL,
+        flush_batch: int = settings.FSM_FLUSH_BATCH,
+        shared: bool = settings.FSM_SHARED,
+    ):
+        self.session_maker = session_maker
+        self.cache_size = cache_size
+        # Другая реплика могла изменить ключ в любой момент — кэшу без своих правок не верим
+        self.cache_ttl = 0 if shared else cache_ttl
+        self.shared = shared
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self._cache: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._dirty: Set[str] = set()
+        # Ключи, которые сейчас записывает flush: в БД их ещё нет
+        self._flushing: Set[str] = set()
+        self._flush_now = asyncio.Event()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return ":".join(str(part) for part in (
+            key.bot_id, key.chat_id, key.user_id,
+            key.thread_id or "", key.business_connection_id or "", key.destiny,
+        ))
+
+    async def _entry(self, key: StorageKey) -> _Entry:
+        k = self._key(key)
+        entry = self._cache.get(k)
+        if entry is not None and (self._unwritten(k) or time.monotonic() - entry.loaded_at < self.cache_ttl):
+            self._cache.move_to_end(k)
+            return entry
+
+        async with self.session_maker() as session:
+            record = await session.get(FSMRecord, k)
+
+        # Пока ходили в БД, ключ мог измениться локально — локальная версия новее
+        if self._unwritten(k) and k in self._cache:
+            return self._cache[k]
+
+        entry = _Entry(record.state if record else None, dict(record.data or {}) if record else {})
+        self._cache[k] = entry
+        self._cache.move_to_end(k)
+        # Только что прочитанную запись не вытесняем: вызывающий сейчас её изменит,
+        # а изменения записи вне кэша flush не увидит
+        self._evict(keep=k)
+        return entry
+
+    def _unwritten(self, k: str) -> bool:
+        return k in self._dirty or k in self._flushing
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        # Вытесняем только чистые записи; грязные сначала должны попасть в БД
+        if len(self._cache) <= self.cache_size:
+            return
+        for k in list(self._cache):
+            if len(self._cache) <= self.cache_size:
+                break
+            if not self._unwritten(k) and k != keep:
+                del self._cache[k]
+        if len(self._cache) > self.cache_size:
+            self._flush_now.set()
+
+    def _mark_dirty(self, key: StorageKey) -> None:
+        self._dirty.add(self._key(key))
+        self._ensure_flusher()
+        if len(self._dirty) >= self.flush_batch:
+            self._flush_now.set()
+
+    async def _written(self, key: StorageKey) -> None:
+        self._mark_dirty(key)
+        if self.shared:
+            # Write-through: следующий апдейт пользователя может прийти на другую реплику
+            await self.flush()
+
+    def _ensure_flusher(self) -> None:
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop(), name="fsm-flush")
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        entry = await self._entry(key)
+        entry.state = state.state if isinstance(state, State) else state
+        await self._written(key)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._entry(key)).state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        entry = await self._entry(key)
+        entry.data = dict(data)
+        await self._written(key)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return dict((await self._entry(key)).data)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"FSM flush error: {e}")
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            keys, self._dirty = self._dirty, set()
+            self._flushing = keys
+
+            now = datetime.now(timezone.utc)
+            upserts: List[Dict[str, Any]] = []
+            deletes: List[str] = []
+            for k in keys:
+                entry = self._cache.get(k)
+                if entry is None:
+                    continue
+                if entry.state is None and not entry.data:
+                    deletes.append(k)
+                else:
+                    upserts.append({"key": k, "state": entry.state, "data": dict(entry.data), "updated_at": now})
+
+            try:
+                async with self.session_maker() as session:
+                    if upserts:
+                        stmt = dialect_insert(FSMRecord).values(upserts)
+                        stmt = stmt.on_conflict_do_update(
+                            index_elements=[FSMRecord.key],
+                            set_={
+                                "state": stmt.excluded.state,
+                                "data": stmt.excluded.data,
+                                "updated_at": stmt.excluded.updated_at,
+                            },
+                        )
+                        await session.execute(stmt)
+                    if deletes:
+                        await session.execute(delete(FSMRecord).where(FSMRecord.key.in_(deletes)))
+                    await session.commit()
+            except BaseException:
+                # Не потерять изменения (в том числе при отмене из close): вернуть ключи в очередь на запись
+                self._dirty |= keys
+                raise
+            finally:
+                self._flushing = set()
+
+            self._evict()
+
+    async def close(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
@@ -0,0 +1,162 @@
+import logging
+from collections import OrderedDict
+from typing import AsyncIterator, Callable, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError
+
+from config import settings
+from services.executors import run_in_file_executor, run_in_image_executor
+from services.media import MediaRef, MediaTooLarge, stream_telegram_file
+from services.media_cache import MediaCache, media_cache
+
+try:
+    from services.image_ops import normalize_image_file
+except ImportError:  # Pillow не установлен — фото уходят в VK как есть
+    normalize_image_file = None
+
+logger = logging.getLogger(__name__)
+
+
+class _NotSmaller(Exception):
+    pass
+
+
+class ImageNormalizer:
+    """
+    Этап между скачиванием из Telegram и загрузкой в VK: большие изображения
+    уменьшаются и перекодируются в JPEG в пуле процессов.
+    Результат хранится в media_cache под отдельным ключом (зависит от настроек),
+    так что каждое фото нормализуется один раз. Если Pillow нет, кэш выключен
+    или перекодирование не уменьшает файл — отдаётся оригинал.
+    Размер оригинала берётся из метаданных Telegram; скачивать файл ради
+    проверки приходится, только если размер неизвестен.
+    """
+
+    def __init__(
+        self,
+        cache: MediaCache,
+        enabled: bool = settings.IMAGE_NORMALIZE,
+        max_side: int = settings.IMAGE_MAX_SIDE,
+        quality: int = settings.IMAGE_JPEG_QUALITY,
+        min_bytes: int = settings.IMAGE_NORMALIZE_MIN_BYTES,
+        skip_size: int = settings.IMAGE_NORMALIZE_SKIP_SIZE,
+    ):
+        self.cache = cache
+        self.enabled = enabled and normalize_image_file is not None and cache.max_bytes > 0
+        self.max_side = max_side
+        self.quality = quality
+        self.min_bytes = min_bytes
+        # file_unique_id, которые не удалось или нет смысла перекодировать (LRU)
+        self.skip_size = skip_size
+        self._skip: "OrderedDict[str, None]" = OrderedDict()
+
+        if enabled and normalize_image_file is None:
+            logger.warning("Pillow is not installed: image normalization disabled")
+
+    def _skipped(self, ref: MediaRef) -> bool:
+        if ref.file_unique_id not in self._skip:
+            return False
+        self._skip.move_to_end(ref.file_unique_id)
+        return True
+
+    def _add_skip(self, ref: MediaRef) -> None:
+        self._skip[ref.file_unique_id] = None
+        self._skip.move_to_end(ref.file_unique_id)
+        while len(self._skip) > self.skip_size:
+            self._skip.popitem(last=False)
+
+    def _key(self, ref: MediaRef) -> str:
+        return f"normalized:{self.max_side}:{self.quality}:{ref.file_unique_id}"
+
+    async def stream(self, bot: Bot, ref: MediaRef) -> AsyncIterator[bytes]:
+        fetch = lambda: stream_telegram_file(bot, ref.file_id)  # noqa: E731
+
+        if await self._worth_normalizing(bot, ref, fetch):
+            normalized = self.cache.stream(self._key(ref), lambda: self._normalize(ref, fetch))
+            try:
+                first = await normalized.__anext__()
+            except StopAsyncIteration:
+                return
+            except MediaTooLarge:
+                raise
+            except _NotSmaller:
+                self._add_skip(ref)
+            except Exception as e:
+                logger.warning(f"Image normalization failed ({ref.file_unique_id}): {e}")
+                self._add_skip(ref)
+            else:
+                yield first
+                async for chunk in normalized:
+                    yield chunk
+                return
+
+        async for chunk in self.cache.stream(ref.file_unique_id, fetch):
+            yield chunk
+
+    async def _worth_normalizing(
+        self, bot: Bot, ref: MediaRef, fetch: Callable[[], AsyncIterator[bytes]]
+    ) -> bool:
+        if not self.enabled or self._skipped(ref):
+            return False
+        if await self.cache.contains(self._key(ref)):
+            return True
+
+        size = ref.file_size if ref.file_size is not None else await self._file_size(bot, ref)
+        if size is not None:
+            if size >= self.min_bytes:
+                return True
+            self._add_skip(ref)
+            return False
+
+        try:
+            async with self.cache.pinned(ref.file_unique_id, fetch) as src:
+                if src.stat().st_size >= self.min_bytes:
+                    return True
+        except MediaTooLarge:
+            raise
+        except OSError as e:
+            # Например, оригинал больше всего кэша — отдаём его потоком без нормализации
+            logger.warning(f"Image normalization skipped ({ref.file_unique_id}): {e}")
+        self._add_skip(ref)
+        return False
+
+    @staticmethod
+    async def _file_size(bot: Bot, ref: MediaRef) -> Optional[int]:
+        try:
+            return (await bot.get_file(ref.file_id)).file_size
+        except TelegramAPIError as e:
+            logger.warning(f"Image normalization: no metadata for {ref.file_unique_id}: {e}")
+            return None
+
+    async def _normalize(self, ref: MediaRef, fetch: Callable[[], AsyncIterator[bytes]]) -> AsyncIterator[bytes]:
+        out = await self.cache.temp_path()
+        try:
+            async with self.cache.pinned(ref.file_unique_id, fetch) as src:
+                smaller = await run_in_image_executor(
+                    normalize_image_file, str(src), str(out), self.max_side, self.quality
+                )
+            if not smaller:
+                raise _NotSmaller()
+
+            f = await run_in_file_executor(open, out, "rb")
+            try:
+                while True:
+                    chunk = await run_in_file_executor(f.read, self.cache.chunk_size)
+                    if not chunk:
+                        break
+                    yield chunk
+            finally:
+                f.close()
+        finally:
+            out.unlink(missing_ok=True)
+
+
+image_normalizer = ImageNormalizer(media_cache)
+
+
+def vk_upload_stream(bot: Bot, ref: MediaRef) -> AsyncIterator[bytes]:
+    """
+    Поток фото для загрузки в VK: из кэша, при необходимости нормализованный.
+    """
+    return image_normalizer.stream(bot, ref)
@@ -0,0 +1,31 @@
+"""
+Операции над изображениями для пула процессов.
+Модуль не импортирует ничего из проекта, поэтому задача не тянет за собой
+состояние родителя. Запуск дочернего процесса при этом не дешёвый: spawn заново
+импортирует __main__ (main.py или worker.py со всеми их импортами). Процессы пула
+создаются при первых задачах и переиспользуются, так что это разовая плата на процесс.
+"""
+import os
+
+from PIL import Image, ImageOps
+
+
+def normalize_image_file(src: str, dst: str, max_side: int, quality: int) -> bool:
+    """
+    Перекодирует src в JPEG dst: поворот по EXIF, уменьшение до max_side
+    по большей стороне, без метаданных. Прозрачность заливается белым.
+    Возвращает False, если результат не меньше исходника (тогда dst не нужен).
+    """
+    with Image.open(src) as original:
+        img = ImageOps.exif_transpose(original)
+        if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+            rgba = img.convert("RGBA")
+            img = Image.new("RGB", rgba.size, (255, 255, 255))
+            img.paste(rgba, mask=rgba.getchannel("A"))
+        elif img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+
+        img.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        img.save(dst, "JPEG", quality=quality, optimize=True, progressive=True)
+
+    return os.path.getsize(dst) < os.path.getsize(src)
@@ -0,0 +1,73 @@
+import logging
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional
+
+from aiogram import Bot
+from aiogram.types import Message
+
+from config import settings
+from services.metrics import MEDIA_DOWNLOAD_BYTES
+from services.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class MediaRef:
+    """
+    Ссылка на фото в Telegram.
+    file_id нужен для скачивания, file_unique_id — стабильный ключ для кэшей
+    (file_id у одного и того же файла может меняться).
+    file_size — размер из метаданных Telegram, если известен.
+    """
+    file_id: str
+    file_unique_id: str
+    file_size: Optional[int] = None
+
+
+def message_media(message: Message) -> Optional[dict]:
+    """
+    Картинка из сообщения: фото или изображение, присланное файлом ('без сжатия').
+    """
+    if message.photo:
+        file = message.photo[-1]
+    elif message.document and (message.document.mime_type or "").lower().startswith("image/"):
+        file = message.document
+    else:
+        return None
+    return {"file_id": file.file_id, "file_unique_id": file.file_unique_id, "file_size": file.file_size}
+
+
+class MediaTooLarge(Exception):
+    pass
+
+
+async def stream_telegram_file(
+    bot: Bot,
+    file_id: str,
+    chunk_size: int = settings.MEDIA_CHUNK_SIZE,
+    max_bytes: int = settings.MEDIA_MAX_TRANSFER_BYTES,
+) -> AsyncIterator[bytes]:
+    """
+    Отдаёт файл из Telegram кусками по chunk_size без сохранения на диск.
+    В памяти одновременно держится не больше одного куска;
+    если файл больше max_bytes — передача прерывается MediaTooLarge.
+    """
+    file = await bot.get_file(file_id)
+    if file.file_size and file.file_size > max_bytes:
+        raise MediaTooLarge(f"{file_id}: {file.file_size} > {max_bytes} bytes")
+
+    url = bot.session.api.file_url(bot.token, file.file_path)
+    received = 0
+    started = time.perf_counter()
+    try:
+        async for chunk in bot.session.stream_content(url=url, chunk_size=chunk_size, raise_for_status=True):
+            received += len(chunk)
+            MEDIA_DOWNLOAD_BYTES.inc(len(chunk))
+            if received > max_bytes:
+                raise MediaTooLarge(f"{file_id}: more than {max_bytes} bytes")
+            yield chunk
+    finally:
+        # Включает время, пока потребитель обрабатывал куски (загрузка в VK идёт параллельно)
+        tracer.add("tg.download", started, bytes=received)
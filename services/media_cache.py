@@ -0,0 +1,250 @@
+import asyncio
+import hashlib
+import logging
+import os
+import uuid
+from collections import OrderedDict, defaultdict
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, Callable, Dict, List, Tuple
+
+from config import settings
+from services.executors import run_in_file_executor
+
+logger = logging.getLogger(__name__)
+
+_TMP_DIR = "tmp"
+
+
+class MediaCache:
+    """
+    Дисковый кэш файлов по стабильному ключу (file_unique_id).
+
+    - Файл лежит в <root>/<xx>/<sha256 ключа>; запись идёт во временный файл
+      и публикуется через os.replace, так что читатели не видят недописанных файлов.
+    - Промах: данные отдаются потребителю по мере скачивания и одновременно пишутся
+      на диск; параллельные запросы того же ключа ждут окончания и читают с диска.
+    - Общий размер ограничен max_bytes, вытесняются давно не использованные файлы
+      (порядок восстанавливается по mtime после перезапуска). Файлы, которые
+      сейчас читаются, не удаляются (счётчик ссылок).
+    - Работа с диском (включая первый обход каталога) идёт в пуле потоков
+      run_in_file_executor, а не в цикле событий.
+    """
+
+    def __init__(
+        self,
+        root: str = settings.MEDIA_CACHE_DIR,
+        max_bytes: int = settings.MEDIA_CACHE_MAX_BYTES,
+        chunk_size: int = settings.MEDIA_CHUNK_SIZE,
+    ):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self._entries: "OrderedDict[str, int]" = OrderedDict()  # имя -> размер, от старых к новым
+        self._size = 0
+        self._refs: Dict[str, int] = defaultdict(int)
+        self._inflight: Dict[str, asyncio.Event] = {}
+        self._loaded = False
+        self._load_lock = asyncio.Lock()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @staticmethod
+    def _name(key: str) -> str:
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def _path(self, name: str) -> Path:
+        return self.root / name[:2] / name
+
+    async def _load(self) -> None:
+        """
+        Индекс кэша по содержимому каталога (один раз, при первом обращении).
+        Параллельные первые обращения ждут один обход.
+        """
+        if self._loaded:
+            return
+        async with self._load_lock:
+            if self._loaded:
+                return
+            found = await run_in_file_executor(self._scan)
+            for _, name, size in sorted(found):
+                self._entries[name] = size
+                self._size += size
+            self._loaded = True
+            self._evict()
+
+    def _scan(self) -> List[Tuple[float, str, int]]:
+        # В пуле потоков: (mtime, имя, размер) файлов кэша
+        found = []
+        if not self.root.is_dir():
+            return found
+        for sub in self.root.iterdir():
+            if not sub.is_dir():
+                continue
+            if sub.name == _TMP_DIR:
+                # Недописанные файлы прошлого запуска
+                for tmp in sub.iterdir():
+                    tmp.unlink(missing_ok=True)
+                continue
+            for f in sub.iterdir():
+                st = f.stat()
+                found.append((st.st_mtime, f.name, st.st_size))
+        return found
+
+    async def contains(self, key: str) -> bool:
+        await self._load()
+        return self._name(key) in self._entries
+
+    async def stream(self, key: str, fetch: Callable[[], AsyncIterator[bytes]]) -> AsyncIterator[bytes]:
+        """
+        Отдаёт содержимое по ключу кусками: с диска, а при промахе — из fetch(),
+        попутно сохраняя в кэш.
+        """
+        if self.max_bytes <= 0:
+            async for chunk in fetch():
+                yield chunk
+            return
+
+        await self._load()
+        name = self._name(key)
+
+        # Этот же файл уже скачивается другим запросом — дождаться и читать с диска
+        while name not in self._entries and name in self._inflight:
+            await self._inflight[name].wait()
+
+        if name in self._entries:
+            f = await self._open(name)
+            if f is not None:
+                async for chunk in self._read(name, f):
+                    yield chunk
+                return
+
+        done = asyncio.Event()
+        self._inflight[name] = done
+        try:
+            async for chunk in self._fetch_and_store(name, fetch):
+                yield chunk
+        finally:
+            del self._inflight[name]
+            done.set()
+
+    @asynccontextmanager
+    async def pinned(self, key: str, fetch: Callable[[], AsyncIterator[bytes]]) -> AsyncIterator[Path]:
+        """
+        Путь к файлу в кэше (при промахе файл сначала скачивается через fetch).
+        Внутри блока файл не вытесняется.
+        """
+        await self._load()
+        name = self._name(key)
+        while name not in self._entries:
+            async for _ in self.stream(key, fetch):
+                pass
+            if name not in self._entries:
+                raise OSError(f"Media cache: {key} does not fit into {self.max_bytes} bytes")
+
+        self._refs[name] += 1
+        try:
+            self._entries.move_to_end(name)
+            yield self._path(name)
+        finally:
+            self._release(name)
+
+    async def _open(self, name: str):
+        self._refs[name] += 1
+        try:
+            f = await run_in_file_executor(self._open_touched, self._path(name))
+        except FileNotFoundError:
+            # Файл удалили мимо кэша — забываем запись и скачиваем заново
+            self._release(name)
+            self._forget(name)
+            return None
+        self._entries.move_to_end(name)
+        return f
+
+    @staticmethod
+    def _open_touched(path: Path):
+        # mtime — порядок вытеснения после перезапуска
+        f = open(path, "rb")
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return f
+
+    async def _read(self, name: str, f) -> AsyncIterator[bytes]:
+        try:
+            while True:
+                chunk = await run_in_file_executor(f.read, self.chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            f.close()
+            self._release(name)
+
+    async def temp_path(self) -> Path:
+        """
+        Путь для временного файла на том же диске, что и кэш (os.replace атомарен).
+        """
+        # Первая загрузка индекса очищает tmp — она должна пройти до выдачи первого пути
+        await self._load()
+        tmp_dir = self.root / _TMP_DIR
+        await run_in_file_executor(lambda: tmp_dir.mkdir(parents=True, exist_ok=True))
+        return tmp_dir / uuid.uuid4().hex
+
+    async def _fetch_and_store(self, name: str, fetch: Callable[[], AsyncIterator[bytes]]) -> AsyncIterator[bytes]:
+        tmp = await self.temp_path()
+        f = await run_in_file_executor(open, tmp, "wb")
+        size = 0
+        try:
+            async for chunk in fetch():
+                await run_in_file_executor(f.write, chunk)
+                size += len(chunk)
+                yield chunk
+            await run_in_file_executor(f.close)
+
+            final = self._path(name)
+            await run_in_file_executor(lambda: final.parent.mkdir(parents=True, exist_ok=True))
+            await run_in_file_executor(os.replace, tmp, final)
+        except BaseException:
+            f.close()
+            tmp.unlink(missing_ok=True)
+            raise
+
+        self._forget(name)
+        self._entries[name] = size
+        self._size += size
+        self._evict()
+
+    def _release(self, name: str) -> None:
+        self._refs[name] -= 1
+        if self._refs[name] <= 0:
+            del self._refs[name]
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _forget(self, name: str) -> None:
+        size = self._entries.pop(name, None)
+        if size is not None:
+            self._size -= size
+
+    def _evict(self) -> None:
+        if self._size <= self.max_bytes:
+            return
+        for name in list(self._entries):
+            if self._size <= self.max_bytes:
+                break
+            if self._refs.get(name) or name in self._inflight:
+                continue
+            try:
+                self._path(name).unlink(missing_ok=True)
+            except OSError as e:
+                logger.warning(f"Media cache: cannot remove {name}: {e}")
+                continue
+            self._forget(name)
+
+
+media_cache = MediaCache()
+
@@ -0,0 +1,322 @@
+"""
+Метрики процесса в текстовом формате Prometheus.
+
+Счётчики, гистограммы и gauge хранятся в памяти процесса и отдаются
+по HTTP на METRICS_HOST:METRICS_PORT (/metrics). Бот и каждый worker.py
+публикуют свои метрики — агрегирует их Prometheus.
+"""
+import bisect
+import logging
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import Response, TelegramMethod
+from aiohttp import web
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from config import settings
+from services.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+LabelValues = Tuple[str, ...]
+Sample = Tuple[str, Dict[str, str], float]
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+
+    def _key(self, labels: Dict[str, object]) -> LabelValues:
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def _labels(self, key: LabelValues) -> Dict[str, str]:
+        return dict(zip(self.labels, key))
+
+    def samples(self) -> Iterator[Sample]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def total(self, **labels) -> float:
+        """
+        Сумма по всем значениям меток, не указанных в labels.
+        """
+        fixed = {self.labels.index(k): str(v) for k, v in labels.items()}
+        return sum(v for key, v in self._values.items() if all(key[i] == val for i, val in fixed.items()))
+
+    def samples(self) -> Iterator[Sample]:
+        for key, value in self._values.items():
+            yield self.name, self._labels(key), value
+
+
+class Gauge(_Metric):
+    """
+    Значение, которое выставляется явно, или вычисляется при каждом сборе (collect).
+    """
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        collect: Optional[Callable[[], Dict[LabelValues, float]]] = None,
+    ):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+        self._collect = collect
+
+    def set(self, value: float, **labels) -> None:
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> Iterator[Sample]:
+        values = dict(self._values)
+        if self._collect is not None:
+            try:
+                values.update(self._collect())
+            except Exception as e:
+                logger.error(f"Metric {self.name} collect error: {e}")
+        for key, value in values.items():
+            yield self.name, self._labels(key), value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # метки -> [счётчики по корзинам (+Inf последней), сумма]
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        item = self._values.get(key)
+        if item is None:
+            item = ([0] * (len(self.buckets) + 1), [0.0])
+            self._values[key] = item
+        counts, total = item
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        item = self._values.get(self._key(labels))
+        return sum(item[0]) if item else 0
+
+    def total(self) -> Tuple[int, float]:
+        """
+        Количество наблюдений и их сумма по всем меткам.
+        """
+        return (
+            sum(sum(counts) for counts, _ in self._values.values()),
+            sum(total[0] for _, total in self._values.values()),
+        )
+
+    def samples(self) -> Iterator[Sample]:
+        for key, (counts, total) in self._values.items():
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative
+            yield f"{self.name}_sum", labels, total[0]
+            yield f"{self.name}_count", labels, cumulative
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: Sequence[str] = (), collect=None) -> Gauge:
+        return self.register(Gauge(name, documentation, labels, collect))
+
+    def histogram(
+        self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                if labels:
+                    rendered = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+                    lines.append(f"{name}{{{rendered}}} {_format_value(value)}")
+                else:
+                    lines.append(f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+PUBLISH_DURATION = registry.histogram(
+    "publish_send_duration_seconds", "Отправка поста в одно сообщество", ["platform"]
+)
+PUBLISH_RESULTS = registry.counter(
+    "publish_results_total", "Результаты отправки в сообщества", ["platform", "result"]
+)
+TELEGRAM_API_DURATION = registry.histogram(
+    "telegram_api_duration_seconds", "Запросы к Telegram Bot API", ["method"]
+)
+TELEGRAM_API_ERRORS = registry.counter(
+    "telegram_api_errors_total", "Ошибки Telegram Bot API", ["method", "error"]
+)
+VK_API_DURATION = registry.histogram("vk_api_duration_seconds", "Запросы к VK API", ["method"])
+VK_API_ERRORS = registry.counter("vk_api_errors_total", "Ошибки VK API по коду", ["method", "code"])
+MEDIA_DOWNLOAD_BYTES = registry.counter("media_download_bytes_total", "Байт скачано из Telegram")
+MEDIA_UPLOAD_BYTES = registry.counter("media_upload_bytes_total", "Байт загружено в VK")
+DB_QUERY_DURATION = registry.histogram(
+    "db_query_duration_seconds", "Запросы к БД", ["operation"], buckets=DB_BUCKETS
+)
+DB_ERRORS = registry.counter("db_errors_total", "Ошибки запросов к БД", ["operation"])
+MIRROR_LAG = registry.histogram(
+    "mirror_lag_seconds", "От публикации в канале до поста в VK", ["action"]
+)
+ENTITIES = registry.gauge("entities", "Количество записей (users, posts, communities)", ["kind"])
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """
+    Время каждого запроса к БД по типу операции (SELECT/INSERT/UPDATE/...).
+    """
+
+    def operation(statement: str) -> str:
+        return statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        op = operation(statement)
+        DB_QUERY_DURATION.observe(time.perf_counter() - started, operation=op)
+        tracer.add(f"db.{op}", started)
+
+    @event.listens_for(engine.sync_engine, "handle_error")
+    def on_error(context):
+        stack = context.connection.info.get("query_started") if context.connection is not None else None
+        if stack:
+            stack.pop()
+        DB_ERRORS.inc(operation=operation(context.statement or ""))
+
+
+class TelegramMetricsMiddleware(BaseRequestMiddleware):
+    """
+    Middleware сессии бота: время и ошибки каждого запроса к Bot API.
+    Регистрируется после TelegramFloodMiddleware, чтобы не учитывать ожидание лимитов
+    (в трассе ожидание остаётся в родительском span).
+    """
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Bot,
+        method: TelegramMethod,
+    ) -> Response:
+        name = type(method).__name__
+        started = time.perf_counter()
+        try:
+            with tracer.span(f"tg.{name}"):
+                return await make_request(bot, method)
+        except Exception as e:
+            TELEGRAM_API_ERRORS.inc(method=name, error=type(e).__name__)
+            raise
+        finally:
+            TELEGRAM_API_DURATION.observe(time.perf_counter() - started, method=name)
+
+
+async def _handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+
+async def start_metrics_server(
+    host: str = settings.METRICS_HOST,
+    port: int = settings.METRICS_PORT,
+) -> Optional[web.AppRunner]:
+    """
+    Поднимает /metrics. Порт 0 — метрики по HTTP не отдаются.
+    Ошибка привязки к порту не мешает работе процесса.
+    """
+    if not port:
+        return None
+    app = web.Application()
+    app.router.add_get("/metrics", _handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+    except OSError as e:
+        logger.error(f"Metrics server on {host}:{port} failed: {e}")
+        await runner.cleanup()
+        return None
+    logger.info(f"Metrics on http://{host}:{port}/metrics")
+    return runner
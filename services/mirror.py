@@ -0,0 +1,404 @@
+"""
+Зеркалирование Telegram-каналов в VK группы.
+
+Посты канала (channel_post / edited_channel_post) попадают в очередь своего канала
+и публикуются в VK строго в порядке поступления; каналы обрабатываются независимо.
+Внутри канала работа разделена на две стадии: подготовка (скачивание фото
+и загрузка в VK) идёт для MIRROR_PREFETCH постов вперёд параллельно, а wall.post /
+wall.edit выполняются по одному, в исходном порядке. Так пачка постов не ждёт
+загрузок друг друга, и задержка зеркала остаётся порядка времени одной публикации.
+"""
+import asyncio
+import contextvars
+import logging
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from aiogram.types import Message
+from sqlalchemy import and_, or_, select
+
+from config import settings
+from database import async_session_maker
+from models import ChannelMirror, Community, MirroredPost, PlatformType
+from services.fanout import fanout_engine
+from services.image_normalizer import vk_upload_stream
+from services.media import MediaRef, message_media
+from services.metrics import MIRROR_LAG, registry
+from services.tracing import tracer
+from services.vk_attachments import PhotoUploadFailed, attachment_planner
+from services.vk_service import VKService
+
+logger = logging.getLogger(__name__)
+
+# group_id -> вложения в порядке фото поста
+Attachments = Dict[str, List[str]]
+
+
+@dataclass(frozen=True)
+class MirrorTarget:
+    community_id: int
+    group_id: str
+    access_token: str
+
+    @property
+    def group_key(self) -> str:
+        return str(self.group_id).replace("-", "")
+
+
+@dataclass
+class MirrorJob:
+    channel_id: int
+    messages: List[Message]
+    edit: bool = False
+    attachments: Attachments = field(default_factory=dict)
+
+
+def job_text(messages: List[Message]) -> str:
+    # У альбома подпись обычно только у одного сообщения
+    return next((t for t in ((m.text or m.caption or "").strip() for m in messages) if t), "")
+
+
+def job_timestamp(job: MirrorJob) -> float:
+    """
+    Время публикации (или правки) в канале, unix-время.
+    """
+    last = job.messages[-1]
+    if job.edit and last.edit_date:
+        # edit_date в aiogram — целое число секунд, date — datetime
+        return float(last.edit_date)
+    return last.date.timestamp()
+
+
+class _ChannelLane:
+    """
+    Очередь одного канала: сборка альбомов, подготовка с опережением, публикация по порядку.
+    """
+
+    def __init__(self, pipeline: "ChannelMirrorPipeline", channel_id: int):
+        self.pipeline = pipeline
+        self.channel_id = channel_id
+        self.queue: asyncio.Queue[Tuple[Message, bool]] = asyncio.Queue(maxsize=settings.MIRROR_QUEUE_SIZE)
+        self._prepared: asyncio.Queue[Tuple[MirrorJob, asyncio.Task]] = asyncio.Queue(
+            maxsize=max(1, settings.MIRROR_PREFETCH)
+        )
+        # Задачи создаются вне контекста апдейта, который открыл канал:
+        # иначе они унаследовали бы его трассу
+        context = contextvars.Context()
+        self._tasks = [
+            asyncio.create_task(self._collect(), name=f"mirror-collect-{channel_id}", context=context),
+            asyncio.create_task(self._publish(), name=f"mirror-publish-{channel_id}", context=context),
+        ]
+
+    def depth(self) -> int:
+        return self.queue.qsize() + self._prepared.qsize()
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        while not self._prepared.empty():
+            _, task = self._prepared.get_nowait()
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _next_job(self, held: Optional[Tuple[Message, bool]]) -> Tuple[MirrorJob, Optional[Tuple[Message, bool]]]:
+        """
+        Следующий пост канала. Части альбома приходят отдельными апдейтами подряд:
+        они собираются, пока следующая часть приходит не позже ALBUM_WINDOW_MS.
+        Возвращает пост и уже прочитанный апдейт следующего поста.
+        """
+        message, edit = held or await self.queue.get()
+        job = MirrorJob(self.channel_id, [message], edit)
+        if edit or not message.media_group_id:
+            return job, None
+
+        window = settings.ALBUM_WINDOW_MS / 1000
+        while True:
+            try:
+                following = await asyncio.wait_for(self.queue.get(), timeout=window)
+            except asyncio.TimeoutError:
+                return job, None
+            part, part_edit = following
+            if part_edit or part.media_group_id != message.media_group_id:
+                return job, following
+            job.messages.append(part)
+
+    async def _collect(self) -> None:
+        held = None
+        while True:
+            job, held = await self._next_job(held)
+            task = asyncio.create_task(self.pipeline.prepare(job))
+            await self._prepared.put((job, task))
+
+    async def _publish(self) -> None:
+        while True:
+            job, task = await self._prepared.get()
+            kind = "edit" if job.edit else "post"
+            try:
+                with tracer.trace(f"mirror {kind}", channel=self.channel_id, messages=len(job.messages)):
+                    job.attachments = await task
+                    await self.pipeline.publish(job)
+                MIRROR_LAG.observe(max(0.0, time.time() - job_timestamp(job)), action=kind)
+            except asyncio.CancelledError:
+                task.cancel()
+                raise
+            except Exception as e:
+                logger.error(f"Mirror {kind} error (channel {self.channel_id}): {e}")
+
+
+class ChannelMirrorPipeline:
+    """
+    Настройки зеркал (канал -> VK группы) держатся в памяти, поэтому приём апдейта
+    не обращается к БД: порядок постов канала определяется порядком вызовов submit.
+    Настройки перечитываются сразу при изменении через /mirror в этом процессе
+    и раз в MIRROR_RELOAD_SECONDS — так доходят изменения с других реплик.
+    """
+
+    def __init__(self, reload_interval: float = settings.MIRROR_RELOAD_SECONDS):
+        self.reload_interval = reload_interval
+        self._targets: Dict[int, List[MirrorTarget]] = {}
+        self._lanes: Dict[int, _ChannelLane] = {}
+        self._reload_task: Optional[asyncio.Task] = None
+
+    def targets(self, channel_id: int) -> List[MirrorTarget]:
+        return self._targets.get(channel_id, [])
+
+    async def load(self) -> None:
+        async with async_session_maker() as session:
+            rows = (await session.execute(
+                select(ChannelMirror.channel_id, Community.id, Community.community_id, Community.access_token)
+                .join(Community, Community.id == ChannelMirror.vk_community_id)
+                .where(Community.platform == PlatformType.VK, Community.access_token.is_not(None))
+                .order_by(ChannelMirror.id)
+            )).all()
+
+        by_channel: Dict[int, Dict[str, MirrorTarget]] = defaultdict(dict)
+        for channel_id, community_id, group_id, token in rows:
+            target = MirrorTarget(community_id, group_id, token)
+            # Одну группу могут привязать несколько пользователей — пост уходит в неё один раз
+            by_channel[channel_id].setdefault(target.group_key, target)
+        targets = {channel_id: list(t.values()) for channel_id, t in by_channel.items()}
+        changed = targets != self._targets
+        self._targets = targets
+
+        for channel_id in [c for c in self._lanes if c not in self._targets]:
+            await self._lanes.pop(channel_id).stop()
+        if changed:
+            logger.info(f"Mirrors loaded: {len(self._targets)} channels")
+
+    def start(self) -> None:
+        if self._reload_task is None:
+            self._reload_task = asyncio.create_task(self._reload(), name="mirror-reload")
+
+    async def _reload(self) -> None:
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                await self.load()
+            except Exception as e:
+                logger.error(f"Mirror reload error: {e}")
+
+    async def stop(self) -> None:
+        if self._reload_task is not None:
+            self._reload_task.cancel()
+            await asyncio.gather(self._reload_task, return_exceptions=True)
+            self._reload_task = None
+        lanes, self._lanes = list(self._lanes.values()), {}
+        for lane in lanes:
+            await lane.stop()
+
+    def queue_depths(self) -> Dict[Tuple[str, ...], float]:
+        return {(str(channel_id),): lane.depth() for channel_id, lane in self._lanes.items()}
+
+    async def submit(self, message: Message, edit: bool = False) -> None:
+        """
+        Ставит пост канала в очередь. Если очередь канала заполнена, ждёт места —
+        апдейты канала не теряются и не обгоняют друг друга.
+        """
+        channel_id = message.chat.id
+        if channel_id not in self._targets:
+            return
+        lane = self._lanes.get(channel_id)
+        if lane is None:
+            lane = self._lanes[channel_id] = _ChannelLane(self, channel_id)
+        await lane.queue.put((message, edit))
+
+    async def prepare(self, job: MirrorJob) -> Attachments:
+        """
+        Загрузка фото нового поста во все группы канала. Правки готовятся при публикации:
+        им нужны сохранённые посты VK, а предыдущие посты канала могут быть ещё не опубликованы.
+        """
+        targets = self.targets(job.channel_id)
+        media = [MediaRef(**m) for m in map(message_media, job.messages) if m]
+        if job.edit or not media or not targets:
+            return {}
+        bot = job.messages[0].bot
+        with tracer.trace("mirror prepare", channel=job.channel_id, media=len(media)):
+            return await attachment_planner.plan(
+                [t.group_id for t in targets], media, lambda m: vk_upload_stream(bot, m)
+            )
+
+    async def publish(self, job: MirrorJob) -> None:
+        if job.edit:
+            await self._publish_edit(job.channel_id, job.messages[0])
+        else:
+            await self._publish_post(job)
+
+    async def _publish_post(self, job: MirrorJob) -> None:
+        targets = self.targets(job.channel_id)
+        text = job_text(job.messages)
+        media = [message_media(m) for m in job.messages]
+        if not targets or (not text and not any(media)):
+            # Видео, стикеры и прочее VK-зеркало не переносит
+            return
+
+        photos = [MediaRef(**m) for m in media if m]
+        missing = [t for t in targets if t.group_key not in job.attachments]
+        if photos and missing:
+            # Загрузка при подготовке не удалась (или группу добавили позже) — ещё одна попытка
+            bot = job.messages[0].bot
+            job.attachments.update(await attachment_planner.plan(
+                [t.group_id for t in missing], photos, lambda m: vk_upload_stream(bot, m)
+            ))
+
+        posted: Dict[int, int] = {}
+
+        async def send(target: MirrorTarget) -> bool:
+            attachments = job.attachments.get(target.group_key)
+            if attachments is None and photos:
+                # Пост без части фото не публикуем
+                raise PhotoUploadFailed(f"photo upload to group {target.group_id} failed")
+            with tracer.span("send.vk", group=target.group_key):
+                post_id = await VKService(target.access_token).post_to_wall(
+                    target.group_id, text, attachments or None
+                )
+            if post_id:
+                posted[target.community_id] = post_id
+            return bool(post_id)
+
+        async def on_result(target: MirrorTarget, ok: bool, error: Optional[str]) -> None:
+            if not ok:
+                logger.warning(f"Mirror post failed (channel {job.channel_id} -> {target.group_id}): {error}")
+
+        await fanout_engine.run(targets, lambda t: PlatformType.VK, send, on_result)
+        if not posted:
+            return
+
+        rows = []
+        for target in targets:
+            if target.community_id not in posted:
+                continue
+            attachments = job.attachments.get(target.group_key, [])
+            index = 0
+            for message, m in zip(job.messages, media):
+                rows.append(MirroredPost(
+                    channel_id=job.channel_id,
+                    message_id=message.message_id,
+                    community_id=target.community_id,
+                    vk_post_id=posted[target.community_id],
+                    text=text,
+                    attachments=attachments,
+                    position=index if m else None,
+                    file_unique_id=m["file_unique_id"] if m else None,
+                ))
+                if m:
+                    index += 1
+        async with async_session_maker() as session:
+            session.add_all(rows)
+            await session.commit()
+
+    async def _publish_edit(self, channel_id: int, message: Message) -> None:
+        targets = {t.community_id: t for t in self.targets(channel_id)}
+        async with async_session_maker() as session:
+            edited = (await session.execute(
+                select(MirroredPost).where(
+                    MirroredPost.channel_id == channel_id,
+                    MirroredPost.message_id == message.message_id,
+                    MirroredPost.community_id.in_(list(targets)),
+                )
+            )).scalars().all()
+            if not edited:
+                await session.commit()
+                return
+            # Строки остальных сообщений альбома: у них тот же пост VK
+            siblings = (await session.execute(
+                select(MirroredPost).where(
+                    MirroredPost.channel_id == channel_id,
+                    or_(*(
+                        and_(MirroredPost.community_id == r.community_id, MirroredPost.vk_post_id == r.vk_post_id)
+                        for r in edited
+                    )),
+                )
+            )).scalars().all()
+            # Не держим транзакцию открытой на время загрузок и отправок
+            await session.commit()
+
+            text = (message.text or message.caption or "").strip()
+            media = message_media(message)
+            changes: Dict[int, Tuple[str, List[str]]] = {}
+            replaced = [
+                r for r in edited
+                if media and r.position is not None and r.file_unique_id != media["file_unique_id"]
+            ]
+            uploads: Attachments = {}
+            if replaced:
+                uploads = await attachment_planner.plan(
+                    [targets[r.community_id].group_id for r in replaced],
+                    [MediaRef(**media)],
+                    lambda m: vk_upload_stream(message.bot, m),
+                )
+
+            for r in edited:
+                target = targets[r.community_id]
+                new_text = text
+                # Сообщение альбома без подписи: подпись поста живёт в другом сообщении
+                if not new_text and message.media_group_id:
+                    new_text = r.text or ""
+                attachments = list(r.attachments or [])
+                upload = uploads.get(target.group_key)
+                if r in replaced and upload:
+                    attachments[r.position] = upload[0]
+                if new_text != (r.text or "") or attachments != (r.attachments or []):
+                    changes[r.community_id] = (new_text, attachments)
+            if not changes:
+                return
+
+            async def send(r: MirroredPost) -> bool:
+                target = targets[r.community_id]
+                new_text, attachments = changes[r.community_id]
+                with tracer.span("edit.vk", group=target.group_key):
+                    return await VKService(target.access_token).edit_wall_post(
+                        target.group_id, r.vk_post_id, new_text, attachments or None
+                    )
+
+            saved: List[MirroredPost] = []
+
+            async def on_result(r: MirroredPost, ok: bool, error: Optional[str]) -> None:
+                if ok:
+                    saved.append(r)
+                else:
+                    logger.warning(f"Mirror edit failed (channel {channel_id}, post {r.vk_post_id}): {error}")
+
+            await fanout_engine.run(
+                [r for r in edited if r.community_id in changes], lambda r: PlatformType.VK, send, on_result
+            )
+
+            for r in saved:
+                new_text, attachments = changes[r.community_id]
+                for s in siblings:
+                    if s.community_id == r.community_id and s.vk_post_id == r.vk_post_id:
+                        s.text = new_text
+                        s.attachments = attachments
+                if r in replaced and media:
+                    r.file_unique_id = media["file_unique_id"]
+            if saved:
+                await session.commit()
+
+
+mirror_pipeline = ChannelMirrorPipeline()
+
+registry.gauge(
+    "mirror_queue_depth", "Посты каналов в очереди зеркалирования", ["channel"],
+    collect=mirror_pipeline.queue_depths,
+)
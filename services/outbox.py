@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Tuple
+
+from aiogram import Bot
+from sqlalchemy import or_, select, update
+
+from config import settings
+from database import async_session_maker, engine
+from models import PostToCommunity, PostStatus
+from services.post_service import PostService
+from services.scheduler import PostScheduler
+from services.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# (post_id, [id строк PostToCommunity])
+DeliveryUnit = Tuple[int, List[int]]
+
+
+class Outbox:
+    """
+    Очередь доставки поверх таблицы post_to_community.
+    Диспетчер забирает PENDING-строки с наступившим next_attempt_at,
+    группирует их по постам и раздаёт пулу воркеров. Состояние хранится в БД,
+    поэтому после перезапуска недоставленные строки подхватываются автоматически.
+
+    Строки арендуются (locked_by/locked_until), поэтому несколько процессов
+    (бот и отдельные worker.py) могут работать с одной таблицей одновременно.
+    Аренда истекает через OUTBOX_LEASE_SECONDS, если процесс упал.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        workers: int = settings.OUTBOX_WORKERS,
+        batch_size: int = settings.OUTBOX_BATCH_SIZE,
+        poll_interval: float = settings.OUTBOX_POLL_INTERVAL,
+    ):
+        self.bot = bot
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._queue: asyncio.Queue[DeliveryUnit] = asyncio.Queue(maxsize=workers * 2)
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self.scheduler = PostScheduler(self.notify)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+    async def start(self) -> None:
+        self.scheduler.start()
+        self._tasks.append(asyncio.create_task(self._dispatch_loop(), name="outbox-dispatcher"))
+        for i in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(), name=f"outbox-worker-{i}"))
+
+    async def stop(self) -> None:
+        await self.scheduler.stop()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def notify(self) -> None:
+        """
+        Будит диспетчер сразу после постановки новых строк в очередь.
+        """
+        self._wakeup.set()
+
+    def schedule(self, post_id: int, publish_at: datetime) -> None:
+        """
+        Отложенный пост: доставка начнётся в publish_at. Если outbox в этом процессе
+        не запущен, пост найдут планировщики worker.py при перечитывании окна.
+        """
+        self.scheduler.add(post_id, publish_at)
+
+    async def _dispatch_loop(self) -> None:
+        while True:
+            try:
+                units, full = await self._claim()
+            except Exception as e:
+                logger.error(f"Outbox claim error: {e}")
+                units, full = [], False
+
+            for unit in units:
+                await self._queue.put(unit)
+
+            if full:
+                continue
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def _due_filter(self, now: datetime):
+        return (
+            PostToCommunity.status == PostStatus.PENDING,
+            or_(PostToCommunity.next_attempt_at.is_(None), PostToCommunity.next_attempt_at <= now),
+            or_(PostToCommunity.locked_until.is_(None), PostToCommunity.locked_until < now),
+        )
+
+    async def _claim(self) -> Tuple[List[DeliveryUnit], bool]:
+        now = datetime.now(timezone.utc)
+        lease = {
+            "locked_by": f"{self.worker_id}:{uuid.uuid4().hex[:8]}"[:64],
+            "locked_until": now + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS),
+        }
+
+        async with async_session_maker() as session:
+            if engine.dialect.name == "postgresql":
+                # Строки, заблокированные другими воркерами, пропускаются без ожидания
+                query = (
+                    select(PostToCommunity.id, PostToCommunity.post_id)
+                    .where(*self._due_filter(now))
+                    .order_by(PostToCommunity.next_attempt_at)
+                    .limit(self.batch_size)
+                    .with_for_update(skip_locked=True)
+                )
+                rows = (await session.execute(query)).all()
+                if rows:
+                    await session.execute(
+                        update(PostToCommunity)
+                        .where(PostToCommunity.id.in_([r.id for r in rows]))
+                        .values(**lease)
+                    )
+            else:
+                # SQLite выполняет UPDATE атомарно, условие аренды повторяется в нём же
+                due_ids = (
+                    select(PostToCommunity.id)
+                    .where(*self._due_filter(now))
+                    .order_by(PostToCommunity.next_attempt_at)
+                    .limit(self.batch_size)
+                )
+                await session.execute(
+                    update(PostToCommunity)
+                    .where(PostToCommunity.id.in_(due_ids), *self._due_filter(now))
+                    .values(**lease)
+                    .execution_options(synchronize_session=False)
+                )
+                rows = (await session.execute(
+                    select(PostToCommunity.id, PostToCommunity.post_id)
+                    .where(PostToCommunity.locked_by == lease["locked_by"])
+                )).all()
+            await session.commit()
+
+        by_post: Dict[int, List[int]] = defaultdict(list)
+        for ptc_id, post_id in rows:
+            by_post[post_id].append(ptc_id)
+
+        return list(by_post.items()), len(rows) >= self.batch_size
+
+    async def _worker(self) -> None:
+        while True:
+            post_id, ptc_ids = await self._queue.get()
+            try:
+                with tracer.trace("outbox deliver", post=post_id, targets=len(ptc_ids)):
+                    async with async_session_maker() as session:
+                        await PostService(session).deliver(self.bot, post_id, ptc_ids)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Outbox delivery error (post {post_id}): {e}")
+            finally:
+                self._queue.task_done()
@@ -1,21 +1,51 @@
-import os
-from typing import List, Optional
-from datetime import datetime, timezone
+import logging
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+from datetime import datetime, timedelta, timezone
 
 from aiogram import Bot
-from sqlalchemy import select
+from sqlalchemy import case, func, select, tuple_
 
+from config import settings
 from models import Post, Community, PlatformType, PostToCommunity, PostStatus
+from services.fanout import fanout_engine
+from services.media import MediaRef
+from services.image_normalizer import vk_upload_stream
+from services.stats_service import StatsService
+from services.status_recorder import status_recorder
+from services.tracing import tracer
+from services.vk_attachments import PhotoUploadFailed, attachment_planner
 from services.vk_service import VKService
 
+logger = logging.getLogger(__name__)
+
+# Позиция в истории постов: (created_at, id) последнего показанного поста
+HistoryCursor = Tuple[datetime, int]
+
+
+@dataclass(frozen=True)
+class PostSummary:
+    id: int
+    created_at: datetime
+    publish_at: Optional[datetime]
+    text: Optional[str]
+    has_media: bool
+    targets: int
+    sent: int
+    pending: int
+    failed: int
+
+    @property
+    def cursor(self) -> HistoryCursor:
+        return self.created_at, self.id
+
 
 class PostService:
     def __init__(self, session):
         self.session = session
 
-    async def publish_from_state(
+    async def create_post(
         self,
-        bot: Bot,
         user_id: int,
         from_chat_id: int,
         message_id: int,
@@ -23,108 +53,251 @@ class PostService:
         photo_file_id: Optional[str],
         document_file_id: Optional[str],
         community_ids: List[int],
-    ) -> int:
-        
-        post = Post(user_id=user_id, message_id=message_id, from_chat_id=from_chat_id)
+        file_unique_id: Optional[str] = None,
+        locked_by: Optional[str] = None,
+        media: Optional[List[dict]] = None,
+        message_ids: Optional[List[int]] = None,
+        publish_at: Optional[datetime] = None,
+    ) -> Tuple[Post, int]:
+        """
+        Сохраняет пост и строки PostToCommunity в статусе PENDING (outbox).
+        Доставкой занимаются воркеры. Возвращает пост и количество целей.
+        locked_by сразу арендует строки, чтобы воркеры их не забрали.
+        media/message_ids — фото и сообщения альбома; без них берётся одно фото.
+        publish_at — отложенная публикация: строки станут доступны воркерам в это время.
+        """
+        if media is None:
+            file_id = photo_file_id or document_file_id
+            media = [{"file_id": file_id, "file_unique_id": file_unique_id or file_id}] if file_id else []
+
+        post = Post(
+            user_id=user_id,
+            message_id=message_id,
+            from_chat_id=from_chat_id,
+            text=text,
+            media=media,
+            message_ids=message_ids if message_ids and len(message_ids) > 1 else None,
+            publish_at=publish_at,
+        )
         self.session.add(post)
         await self.session.flush()
 
         result = await self.session.execute(select(Community).where(Community.id.in_(community_ids)))
         communities = result.scalars().all()
 
-        ptc_list: List[PostToCommunity] = []
+        now = datetime.now(timezone.utc)
+        locked_until = now + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS) if locked_by else None
         for c in communities:
-            ptc = PostToCommunity(post_id=post.id, community_id=c.id, status=PostStatus.PENDING)
-            self.session.add(ptc)
-            ptc_list.append(ptc)
+            self.session.add(PostToCommunity(
+                post_id=post.id,
+                community_id=c.id,
+                status=PostStatus.PENDING,
+                next_attempt_at=publish_at or now,
+                locked_by=locked_by,
+                locked_until=locked_until,
+            ))
 
         await self.session.commit()
+        StatsService.count("posts")
+        return post, len(communities)
 
-        file_id = photo_file_id or document_file_id
-        photo_paths = await self._download_photo_by_file_id(bot, file_id)
-
-        sent_ok = 0
-        for ptc in ptc_list:
-            c = await self.session.get(Community, ptc.community_id)
-
-            ok = False
-            if c.platform == PlatformType.TELEGRAM:
-                ok = await self._send_to_telegram(bot, c.community_id, from_chat_id, message_id)
+    async def get_history_page(
+        self,
+        user_id: int,
+        cursor: Optional[HistoryCursor] = None,
+        newer: bool = False,
+        limit: int = settings.MY_POSTS_PAGE_SIZE,
+    ) -> Tuple[List[PostSummary], bool]:
+        """
+        Страница истории постов пользователя, от новых к старым, одним запросом:
+        keyset по (created_at, id) (индекс ix_posts_user_created) и агрегаты статусов
+        доставки по каждому посту страницы.
+        cursor — граница предыдущей страницы; newer — листать к более новым постам.
+        Возвращает посты и признак, что в этом направлении есть ещё страница.
+        """
+        key = tuple_(Post.created_at, Post.id)
+        page = select(Post.id, Post.created_at, Post.publish_at, Post.text, Post.media).where(Post.user_id == user_id)
+        if newer:
+            if cursor is not None:
+                page = page.where(key > tuple_(*cursor))
+            page = page.order_by(Post.created_at, Post.id)
+        else:
+            if cursor is not None:
+                page = page.where(key < tuple_(*cursor))
+            page = page.order_by(Post.created_at.desc(), Post.id.desc())
+        page = page.limit(limit + 1).cte("page")
 
-            elif c.platform == PlatformType.VK:
-                ok = await self._send_to_vk(c, text, photo_paths)
+        def count_status(status: PostStatus):
+            return func.sum(case((PostToCommunity.status == status, 1), else_=0))
 
-            ptc.status = PostStatus.SENT if ok else PostStatus.FAILED
-            ptc.sent_at = datetime.now(timezone.utc) if ok else None
-            await self.session.commit()
+        stats = (
+            select(
+                PostToCommunity.post_id,
+                func.count(PostToCommunity.id).label("targets"),
+                count_status(PostStatus.SENT).label("sent"),
+                count_status(PostStatus.PENDING).label("pending"),
+                count_status(PostStatus.FAILED).label("failed"),
+            )
+            .where(PostToCommunity.post_id.in_(select(page.c.id)))
+            .group_by(PostToCommunity.post_id)
+            .subquery()
+        )
+        query = (
+            select(
+                page.c.id,
+                page.c.created_at,
+                page.c.publish_at,
+                page.c.text,
+                page.c.media,
+                func.coalesce(stats.c.targets, 0),
+                func.coalesce(stats.c.sent, 0),
+                func.coalesce(stats.c.pending, 0),
+                func.coalesce(stats.c.failed, 0),
+            )
+            .outerjoin(stats, stats.c.post_id == page.c.id)
+            .order_by(page.c.created_at.desc(), page.c.id.desc())
+        )
+        rows = (await self.session.execute(query)).all()
 
-            if ok:
-                sent_ok += 1
+        # Лишняя строка (limit + 1) — признак следующей страницы; она на "дальнем" краю
+        more = len(rows) > limit
+        if more:
+            rows = rows[1:] if newer else rows[:limit]
+        return [
+            PostSummary(
+                id=r[0],
+                created_at=r[1],
+                publish_at=r[2],
+                text=r[3],
+                has_media=bool(r[4]),
+                targets=r[5],
+                sent=r[6],
+                pending=r[7],
+                failed=r[8],
+            )
+            for r in rows
+        ], more
 
-        for p in photo_paths:
-            try:
-                os.remove(p)
-            except OSError:
-                pass
+    async def publish_from_state(
+        self,
+        bot: Bot,
+        user_id: int,
+        from_chat_id: int,
+        message_id: int,
+        text: str,
+        photo_file_id: Optional[str],
+        document_file_id: Optional[str],
+        community_ids: List[int],
+        file_unique_id: Optional[str] = None,
+        media: Optional[List[dict]] = None,
+        message_ids: Optional[List[int]] = None,
+    ) -> int:
+        """
+        Создаёт пост и сразу доставляет его в текущей корутине, минуя очередь.
+        """
+        post, _ = await self.create_post(
+            user_id=user_id,
+            from_chat_id=from_chat_id,
+            message_id=message_id,
+            text=text,
+            photo_file_id=photo_file_id,
+            document_file_id=document_file_id,
+            community_ids=community_ids,
+            file_unique_id=file_unique_id,
+            locked_by="inline",
+            media=media,
+            message_ids=message_ids,
+        )
+        return await self.deliver(bot, post.id)
 
-        return sent_ok
+    async def deliver(self, bot: Bot, post_id: int, ptc_ids: Optional[List[int]] = None) -> int:
+        """
+        Доставляет PENDING-строки поста (все или только ptc_ids) параллельно.
+        Результаты пишет status_recorder пачками: неудачные попытки откладываются
+        с экспоненциальной задержкой, после OUTBOX_MAX_ATTEMPTS строка получает статус FAILED.
+        """
+        post = await self.session.get(Post, post_id)
+        if post is None:
+            return 0
 
-    async def _send_to_telegram(self, bot: Bot, target_chat_id: str, from_chat_id: int, message_id: int) -> bool:
-        try:
-            await bot.copy_message(chat_id=target_chat_id, from_chat_id=from_chat_id, message_id=message_id)
-            return True
-        except Exception:
-            return False
+        query = (
+            select(PostToCommunity, Community)
+            .join(Community, PostToCommunity.community_id == Community.id)
+            .where(PostToCommunity.post_id == post_id, PostToCommunity.status == PostStatus.PENDING)
+        )
+        if ptc_ids is not None:
+            query = query.where(PostToCommunity.id.in_(ptc_ids))
+        rows = (await self.session.execute(query)).all()
+        if not rows:
+            return 0
 
-    async def _send_to_vk(self, community: Community, text: str, photo_paths: List[str]) -> bool:
-        try:
-            if not community.access_token:
-                return False
+        communities_by_id = {c.id: c for _, c in rows}
+        ptc_list = [ptc for ptc, _ in rows]
 
-            vk = VKService(community.access_token)
+        # Не держим транзакцию открытой на время загрузок и отправок
+        await self.session.commit()
 
-            msg = (text or "").strip()
-            message_param = msg if msg else None
+        media = [
+            MediaRef(file_id=m["file_id"], file_unique_id=m["file_unique_id"], file_size=m.get("file_size"))
+            for m in (post.media or [])
+        ]
+        text = post.text or ""
+        message_ids = post.message_ids or [post.message_id]
 
-            post_id = await vk.post_to_wall(
-                group_id=community.community_id,
-                message=message_param,        
-                photo_paths=photo_paths or None
-            )
-            return bool(post_id)
-        except Exception:
-            return False
+        vk_group_ids = [
+            c.community_id for c in communities_by_id.values()
+            if c.platform == PlatformType.VK and c.access_token
+        ]
+        vk_attachments = {}
+        if vk_group_ids:
+            with tracer.span("vk.plan", groups=len(vk_group_ids), media=len(media)):
+                vk_attachments = await attachment_planner.plan(
+                    vk_group_ids, media, lambda m: vk_upload_stream(bot, m)
+                )
 
-    async def _download_photo_by_file_id(self, bot: Bot, file_id: Optional[str]) -> List[str]:
-        """
-        bot.download_file(...) без destination возвращает BytesIO.
-        Чтобы не получать пустые файлы: делаем seek(0) и пишем getvalue().
-        """
-        if not file_id:
-            return []
+        async def send(ptc: PostToCommunity) -> bool:
+            c = communities_by_id[ptc.community_id]
+            with tracer.span(f"send.{c.platform.value}"):
+                if c.platform == PlatformType.TELEGRAM:
+                    return await self._send_to_telegram(bot, c.community_id, post.from_chat_id, message_ids)
+                if c.platform == PlatformType.VK:
+                    attachments = vk_attachments.get(str(c.community_id).replace("-", ""))
+                    if attachments is None and c.access_token:
+                        # Без фото пост не публикуем: попытка считается неудачной и повторится
+                        raise PhotoUploadFailed(f"photo upload to group {c.community_id} failed")
+                    return await self._send_to_vk(c, text, attachments or [])
+                return False
 
-        try:
-            file = await bot.get_file(file_id)
-            data = await bot.download_file(file.file_path)
+        async def on_result(ptc: PostToCommunity, ok: bool, error: Optional[str]) -> None:
+            status_recorder.record(ptc, ok, error)
 
-            try:
-                data.seek(0)
-            except Exception:
-                pass
+        return await fanout_engine.run(
+            ptc_list,
+            platform_of=lambda ptc: communities_by_id[ptc.community_id].platform,
+            send=send,
+            on_result=on_result,
+        )
 
-            os.makedirs("tmp_photos", exist_ok=True)
-            path = os.path.join("tmp_photos", f"{file_id}.jpg")
+    async def _send_to_telegram(self, bot: Bot, target_chat_id: str, from_chat_id: int, message_ids: List[int]) -> bool:
+        if len(message_ids) > 1:
+            # Альбом целиком — одним запросом, с сохранением группировки
+            await bot.copy_messages(chat_id=target_chat_id, from_chat_id=from_chat_id, message_ids=message_ids)
+        else:
+            await bot.copy_message(chat_id=target_chat_id, from_chat_id=from_chat_id, message_id=message_ids[0])
+        return True
 
-            with open(path, "wb") as f:
-                if hasattr(data, "getvalue"):
-                    f.write(data.getvalue())
-                else:
-                    f.write(data.read())
+    async def _send_to_vk(self, community: Community, text: str, attachments: List[str]) -> bool:
+        if not community.access_token:
+            return False
 
+        vk = VKService(community.access_token)
 
-            # print("Saved:", path, "size:", os.path.getsize(path))
+        msg = (text or "").strip()
+        message_param = msg if msg else None
 
-            return [path]
-        except Exception as e:
-            # print("TG download error:", e)
-            return []
+        post_id = await vk.post_to_wall(
+            group_id=community.community_id,
+            message=message_param,
+            attachments=attachments or None
+        )
+        return bool(post_id)
@@ -0,0 +1,236 @@
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+
+from config import settings
+from services.metrics import registry
+from services.vk_transport import VKApiError
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# VK: 6 — слишком много запросов в секунду, 9 — flood control
+VK_RATE_ERRORS = {6: 1.0, 9: settings.VK_FLOOD_PAUSE}
+
+
+class TokenBucket:
+    """
+    Token bucket с резервированием: каждый acquire занимает следующий слот,
+    поэтому ожидающие обслуживаются по очереди, а текущая задержка очереди
+    считается без обхода ожидающих.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self.waiting = 0
+        self.last_used = self._updated
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> float:
+        """
+        Ждёт свой слот. Возвращает, сколько секунд пришлось ждать.
+        Если за время ожидания слота bucket поставили на паузу, слот сгорает:
+        запрос ждёт конца паузы и занимает новый.
+        """
+        started = time.monotonic()
+        while True:
+            now = time.monotonic()
+            if self._blocked_until > now:
+                await self._sleep(self._blocked_until - now)
+                continue
+
+            self._refill(now)
+            self._tokens -= 1
+            if self._tokens < 0:
+                await self._sleep(-self._tokens / self.rate)
+                if self._blocked_until > time.monotonic():
+                    continue
+            return time.monotonic() - started
+
+    async def _sleep(self, seconds: float) -> None:
+        self.waiting += 1
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            self.waiting -= 1
+
+    def pause(self, seconds: float) -> None:
+        """
+        Блокирует bucket на seconds (ответ сервера о превышении лимита).
+        """
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    def at_rest(self, now: float) -> bool:
+        """
+        Bucket полон, не на паузе и никто не ждёт — он неотличим от нового.
+        """
+        tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        return self.waiting == 0 and self._blocked_until <= now and tokens >= self.capacity
+
+    def queue_wait(self) -> float:
+        """
+        Сколько секунд сейчас ждал бы новый запрос.
+        """
+        now = time.monotonic()
+        blocked = max(0.0, self._blocked_until - now)
+        tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        reserved = (1 - tokens) / self.rate if tokens < 1 else 0.0
+        return blocked + reserved
+
+
+class FloodScheduler:
+    """
+    Общий планировщик лимитов:
+    - tg:global — все запросы бота к Telegram;
+    - tg:chat:<id> — отправки в один чат;
+    - vk:<hash токена> — вызовы VK API одним токеном.
+    Превышение лимита (TelegramRetryAfter, VK 6/9) не считается ошибкой:
+    bucket ставится на паузу, и запрос повторяется.
+
+    Bucket чата или токена, не использованный idle_ttl секунд, удаляется, если
+    он уже восстановился: новый bucket на его месте вёл бы себя так же.
+    """
+
+    def __init__(self, idle_ttl: float = settings.FLOOD_BUCKET_IDLE_TTL):
+        self.idle_ttl = idle_ttl
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    def _bucket(self, name: str, rate: float, capacity: float) -> TokenBucket:
+        now = time.monotonic()
+        self._expire_idle(now)
+
+        bucket = self._buckets.get(name)
+        if bucket is None:
+            bucket = TokenBucket(rate, capacity)
+            self._buckets[name] = bucket
+        else:
+            self._buckets.move_to_end(name)
+        bucket.last_used = now
+        return bucket
+
+    def _expire_idle(self, now: float) -> None:
+        # Самые давно использованные — в начале OrderedDict: обход
+        # останавливается на первом свежем bucket, без копии всего словаря
+        expired = []
+        for name, bucket in self._buckets.items():
+            if now - bucket.last_used < self.idle_ttl:
+                break
+            # На паузе (долгий retry_after) или с ожидающими — оставляем
+            if bucket.at_rest(now):
+                expired.append(name)
+        for name in expired:
+            del self._buckets[name]
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def telegram_global(self) -> TokenBucket:
+        return self._bucket("tg:global", settings.TG_GLOBAL_RATE, settings.TG_GLOBAL_RATE)
+
+    def telegram_chat(self, chat_id: Any) -> TokenBucket:
+        # Личные чаты (положительный id) — около 1 сообщения в секунду,
+        # группы и каналы (-100..., @username) — 20 в минуту
+        if str(chat_id).lstrip("-").isdigit() and int(chat_id) > 0:
+            return self._bucket(f"tg:chat:{chat_id}", settings.TG_PRIVATE_CHAT_RATE, settings.TG_PRIVATE_CHAT_RATE)
+        rate = settings.TG_CHAT_RATE_PER_MINUTE / 60
+        return self._bucket(f"tg:chat:{chat_id}", rate, 1)
+
+    def vk_token(self, access_token: str) -> TokenBucket:
+        key = hashlib.sha1(access_token.encode()).hexdigest()[:12]
+        return self._bucket(f"vk:{key}", settings.VK_TOKEN_RATE, settings.VK_TOKEN_RATE)
+
+    async def run_telegram(self, chat_id: Optional[Any], call: Callable[[], Awaitable[T]]) -> T:
+        chat = self.telegram_chat(chat_id) if chat_id is not None else None
+        for attempt in range(settings.FLOOD_MAX_RETRIES + 1):
+            if chat is not None:
+                await chat.acquire()
+            await self.telegram_global().acquire()
+            try:
+                return await call()
+            except TelegramRetryAfter as e:
+                if attempt >= settings.FLOOD_MAX_RETRIES:
+                    raise
+                logger.warning(f"Telegram flood control (chat {chat_id}): retry after {e.retry_after}s")
+                (chat or self.telegram_global()).pause(e.retry_after)
+
+    async def run_vk(self, access_token: str, call: Callable[[], Awaitable[T]]) -> T:
+        bucket = self.vk_token(access_token)
+        for attempt in range(settings.FLOOD_MAX_RETRIES + 1):
+            await bucket.acquire()
+            try:
+                return await call()
+            except VKApiError as e:
+                if e.code not in VK_RATE_ERRORS or attempt >= settings.FLOOD_MAX_RETRIES:
+                    raise
+                logger.warning(f"VK rate limit [{e.code}] on {e.method}: retry")
+                bucket.pause(VK_RATE_ERRORS[e.code] * (attempt + 1))
+
+    def queue_stats(self) -> Dict[str, Dict[str, float]]:
+        # Только buckets с очередью: простаивающих чатов слишком много для меток
+        return {
+            name: {"waiting": b.waiting, "wait_seconds": round(b.queue_wait(), 3)}
+            for name, b in self._buckets.items()
+            if b.waiting or b.queue_wait() > 0
+        }
+
+
+flood_scheduler = FloodScheduler()
+
+
+def _queue_waiting() -> Dict[tuple, float]:
+    return {(name,): stats["waiting"] for name, stats in flood_scheduler.queue_stats().items()}
+
+
+def _queue_wait_seconds() -> Dict[tuple, float]:
+    return {(name,): stats["wait_seconds"] for name, stats in flood_scheduler.queue_stats().items()}
+
+
+registry.gauge("flood_queue_waiting", "Запросы, ждущие слота в rate limiter", ["bucket"], collect=_queue_waiting)
+registry.gauge(
+    "flood_queue_wait_seconds", "Ожидание нового запроса в rate limiter", ["bucket"], collect=_queue_wait_seconds
+)
+
+# Методы, которые отправляют сообщения в чат и подпадают под лимит на чат
+_CHAT_LIMITED_PREFIXES = ("Send", "Copy", "Forward")
+# Служебные методы (long polling, вебхук) — не под лимитом на отправку, и
+# getUpdates не должен вставать в очередь за рассылкой
+_UNLIMITED_METHODS = frozenset({
+    "GetUpdates", "SetWebhook", "DeleteWebhook", "GetWebhookInfo", "GetMe", "LogOut", "Close",
+})
+
+
+class TelegramFloodMiddleware(BaseRequestMiddleware):
+    """
+    Middleware сессии бота: пропускает запросы через flood_scheduler,
+    кроме служебных (_UNLIMITED_METHODS).
+    """
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Bot,
+        method: TelegramMethod,
+    ) -> Response:
+        name = type(method).__name__
+        if name in _UNLIMITED_METHODS:
+            return await make_request(bot, method)
+        chat_id = None
+        if name.startswith(_CHAT_LIMITED_PREFIXES):
+            chat_id = getattr(method, "chat_id", None)
+        return await flood_scheduler.run_telegram(chat_id, lambda: make_request(bot, method))
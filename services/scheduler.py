@@ -0,0 +1,130 @@
+import asyncio
+import heapq
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List, Optional, Set, Tuple
+
+from sqlalchemy import select
+
+from config import settings
+from database import async_session_maker
+from models import Post
+
+logger = logging.getLogger(__name__)
+
+
+def as_utc(value: datetime) -> datetime:
+    # SQLite возвращает время без часового пояса, хранится оно в UTC
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+class PostScheduler:
+    """
+    Будит доставку ко времени публикации отложенных постов.
+
+    Строки post_to_community отложенного поста создаются с next_attempt_at = publish_at,
+    поэтому outbox заберёт их и без планировщика (раз в OUTBOX_POLL_INTERVAL) — в том
+    числе после перезапуска. Планировщик нужен, чтобы пост вышел точно в срок: в памяти
+    лежит куча только ближайших постов (окно window, не больше batch), окно перечитывается
+    индексным запросом по posts.publish_at, а не обходом всех отложенных постов.
+    """
+
+    def __init__(
+        self,
+        on_due: Callable[[], None],
+        window: float = settings.SCHEDULER_WINDOW_SECONDS,
+        batch: int = settings.SCHEDULER_BATCH,
+        refresh: float = settings.SCHEDULER_REFRESH_SECONDS,
+    ):
+        self.on_due = on_due
+        self.window = timedelta(seconds=window)
+        self.batch = batch
+        self.refresh = timedelta(seconds=refresh)
+        self._heap: List[Tuple[datetime, int]] = []
+        self._known: Set[int] = set()
+        # Все посты с publish_at до horizon уже в куче
+        self._horizon: Optional[datetime] = None
+        self._next_refill: Optional[datetime] = None
+        self._changed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="post-scheduler")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def add(self, post_id: int, publish_at: datetime) -> None:
+        """
+        Пост, запланированный этим процессом: попадает в кучу сразу, если он внутри окна.
+        Более поздние посты подхватит перечитывание окна.
+        """
+        publish_at = as_utc(publish_at)
+        if self._horizon is not None and publish_at <= self._horizon:
+            self._push(post_id, publish_at)
+        self._changed.set()
+
+    def _push(self, post_id: int, publish_at: datetime) -> None:
+        if post_id not in self._known:
+            self._known.add(post_id)
+            heapq.heappush(self._heap, (publish_at, post_id))
+
+    async def _refill(self, now: datetime) -> None:
+        until = now + self.window
+        async with async_session_maker() as session:
+            rows = (await session.execute(
+                select(Post.id, Post.publish_at)
+                .where(Post.publish_at > now, Post.publish_at <= until)
+                .order_by(Post.publish_at)
+                .limit(self.batch)
+            )).all()
+        for post_id, publish_at in rows:
+            self._push(post_id, as_utc(publish_at))
+        # Окно не поместилось в batch — дочитаем, когда куча дойдёт до последнего поста
+        self._horizon = as_utc(rows[-1].publish_at) if len(rows) >= self.batch else until
+        self._next_refill = now + self.refresh
+
+    def _needs_refill(self, now: datetime) -> bool:
+        if self._next_refill is None or now >= self._next_refill:
+            return True
+        return not self._heap and self._horizon <= now
+
+    async def _run(self) -> None:
+        while True:
+            now = datetime.now(timezone.utc)
+            if self._needs_refill(now):
+                try:
+                    await self._refill(now)
+                except Exception as e:
+                    logger.error(f"Scheduler refill error: {e}")
+                    # Повтор через refresh; до тех пор посты доставит обычный опрос outbox
+                    self._horizon = self._next_refill = now + self.refresh
+
+            due = 0
+            while self._heap and self._heap[0][0] <= now:
+                _, post_id = heapq.heappop(self._heap)
+                self._known.discard(post_id)
+                due += 1
+            if due:
+                logger.info(f"Scheduler: {due} scheduled posts are due")
+                self.on_due()
+
+            # Outbox забирает все наступившие строки, а не только посты из кучи,
+            # поэтому посты за пределами batch с тем же временем тоже уйдут вовремя
+            wake_at = min(self._next_refill, self._heap[0][0] if self._heap else self._horizon)
+
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(
+                    self._changed.wait(),
+                    timeout=max(0.0, (wake_at - datetime.now(timezone.utc)).total_seconds()),
+                )
+            except asyncio.TimeoutError:
+                pass
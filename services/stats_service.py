@@ -0,0 +1,28 @@
+from sqlalchemy import func, select
+
+from models import Community, Post, User
+from services.metrics import ENTITIES
+
+
+class StatsService:
+    """
+    Счётчики записей для /stats и /metrics. COUNT(*) выполняется один раз
+    при старте, дальше значения увеличиваются там, где создаются записи.
+    Счётчики живут в памяти процесса и поэтому приблизительные: записи,
+    созданные другими репликами бота, видны только после перезапуска.
+    """
+
+    def __init__(self, session):
+        self.session = session
+
+    async def load_counters(self) -> None:
+        for kind, model in (("users", User), ("posts", Post), ("communities", Community)):
+            ENTITIES.set(await self.session.scalar(select(func.count(model.id))) or 0, kind=kind)
+
+    @staticmethod
+    def count(kind: str, amount: int = 1) -> None:
+        ENTITIES.inc(amount, kind=kind)
+
+    @staticmethod
+    def get(kind: str) -> int:
+        return int(ENTITIES.value(kind=kind))
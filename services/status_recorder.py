@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import update
+
+from config import settings
+from database import async_session_maker
+from models import PostStatus, PostToCommunity
+
+logger = logging.getLogger(__name__)
+
+
+def retry_delay(attempts: int) -> timedelta:
+    """
+    Экспоненциальная задержка перед следующей попыткой доставки (с небольшим джиттером).
+    """
+    delay = min(settings.OUTBOX_BACKOFF_MAX, settings.OUTBOX_BACKOFF_BASE * 2 ** max(0, attempts - 1))
+    return timedelta(seconds=delay + random.uniform(0, delay * 0.1))
+
+
+class StatusRecorder:
+    """
+    Копит результаты доставки PostToCommunity и записывает их одним
+    executemany UPDATE по первичному ключу — раз в STATUS_FLUSH_INTERVAL
+    или при STATUS_FLUSH_BATCH накопленных результатах, общим потоком для всех постов.
+    До записи строки остаются арендованными (locked_by), так что другие
+    воркеры их не берут; при падении процесса аренда истечёт и доставка повторится.
+    """
+
+    def __init__(
+        self,
+        session_maker=async_session_maker,
+        flush_batch: int = settings.STATUS_FLUSH_BATCH,
+        flush_interval: float = settings.STATUS_FLUSH_INTERVAL,
+    ):
+        self.session_maker = session_maker
+        self.flush_batch = flush_batch
+        self.flush_interval = flush_interval
+        self._pending: List[Dict[str, Any]] = []
+        self._flush_now = asyncio.Event()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+
+    @staticmethod
+    def result_values(ptc: PostToCommunity, ok: bool, error: Optional[str]) -> Dict[str, Any]:
+        """
+        Новые значения строки по результату попытки: SENT, FAILED после
+        OUTBOX_MAX_ATTEMPTS или PENDING с экспоненциальной задержкой.
+        """
+        now = datetime.now(timezone.utc)
+        attempts = (ptc.attempts or 0) + 1
+        values = {
+            "id": ptc.id,
+            "attempts": attempts,
+            "locked_by": None,
+            "locked_until": None,
+            "status": PostStatus.PENDING,
+            "sent_at": None,
+            "next_attempt_at": None,
+            "last_error": error,
+        }
+        if ok:
+            values.update(status=PostStatus.SENT, sent_at=now, last_error=None)
+        elif attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+            values.update(status=PostStatus.FAILED)
+        else:
+            values.update(next_attempt_at=now + retry_delay(attempts))
+        return values
+
+    def record(self, ptc: PostToCommunity, ok: bool, error: Optional[str]) -> None:
+        self._pending.append(self.result_values(ptc, ok, error))
+        self._ensure_flusher()
+        if len(self._pending) >= self.flush_batch:
+            self._flush_now.set()
+
+    def _ensure_flusher(self) -> None:
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop(), name="status-flush")
+
+    async def _flush_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Status flush error: {e}")
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, []
+            try:
+                async with self.session_maker() as session:
+                    await session.execute(update(PostToCommunity), batch)
+                    await session.commit()
+            except BaseException:
+                # Вернуть результаты в очередь (в том числе при отмене из close):
+                # иначе строки доставят повторно после истечения аренды
+                self._pending[:0] = batch
+                raise
+
+    async def close(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+
+
+status_recorder = StatusRecorder()
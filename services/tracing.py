@@ -0,0 +1,173 @@
+"""
+Трассировка апдейтов и доставок: дерево вложенных интервалов (span) с временем.
+
+Текущий span хранится в contextvar, поэтому задачи, созданные внутри (fan-out),
+добавляют свои span к родителю. Детально записывается доля TRACE_SAMPLE_RATE трасс;
+у остальных измеряется только общее время. Трассы дольше TRACE_SLOW_MS пишутся
+в лог кратким деревом и хранятся в памяти (последние TRACE_KEEP) для /slow.
+"""
+import logging
+import random
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(eq=False)
+class Span:
+    name: str
+    start: float
+    duration: float = 0.0
+    attrs: Dict[str, Any] = field(default_factory=dict)
+    children: List["Span"] = field(default_factory=list)
+
+
+@dataclass(eq=False)
+class Trace:
+    root: Span
+    started_at: datetime
+    sampled: bool
+    spans: int = 0
+    dropped: int = 0
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class Tracer:
+    def __init__(
+        self,
+        sample_rate: float = settings.TRACE_SAMPLE_RATE,
+        slow_ms: float = settings.TRACE_SLOW_MS,
+        keep: int = settings.TRACE_KEEP,
+        max_spans: int = settings.TRACE_MAX_SPANS,
+    ):
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.max_spans = max_spans
+        self.slow: Deque[Trace] = deque(maxlen=max(1, keep))
+
+    @contextmanager
+    def trace(self, name: str, **attrs: Any) -> Iterator[Optional[Span]]:
+        """
+        Корневой span апдейта или фоновой задачи. Внутри другой трассы — обычный span.
+        """
+        if _current_trace.get() is not None:
+            with self.span(name, **attrs) as span:
+                yield span
+            return
+
+        sampled = random.random() < self.sample_rate
+        root = Span(name, time.perf_counter(), attrs=attrs)
+        trace = Trace(root, datetime.now(timezone.utc), sampled)
+        trace_token = _current_trace.set(trace)
+        span_token = _current_span.set(root if sampled else None)
+        try:
+            yield root
+        except BaseException as e:
+            root.attrs["error"] = type(e).__name__
+            raise
+        finally:
+            root.duration = time.perf_counter() - root.start
+            _current_span.reset(span_token)
+            _current_trace.reset(trace_token)
+            if root.duration * 1000 >= self.slow_ms:
+                self.slow.append(trace)
+                logger.warning(f"Slow trace:\n{format_trace(trace)}")
+
+    @contextmanager
+    def span(self, name: str, **attrs: Any) -> Iterator[Optional[Span]]:
+        """
+        Вложенный span. Вне трассы или в трассе без выборки ничего не записывает.
+        """
+        parent = _current_span.get()
+        if parent is None:
+            yield None
+            return
+        span = self._child(parent, name, time.perf_counter(), attrs)
+        if span is None:
+            yield None
+            return
+
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.attrs["error"] = type(e).__name__
+            raise
+        finally:
+            span.duration = time.perf_counter() - span.start
+            _current_span.reset(token)
+
+    def add(self, name: str, started: float, **attrs: Any) -> None:
+        """
+        Завершённый span от started (perf_counter) до текущего момента — для мест,
+        где нельзя менять контекст (асинхронные генераторы, события SQLAlchemy).
+        """
+        parent = _current_span.get()
+        if parent is None:
+            return
+        span = self._child(parent, name, started, attrs)
+        if span is not None:
+            span.duration = time.perf_counter() - started
+
+    def _child(self, parent: Span, name: str, started: float, attrs: Dict[str, Any]) -> Optional[Span]:
+        trace = _current_trace.get()
+        if trace.spans >= self.max_spans:
+            trace.dropped += 1
+            return None
+        trace.spans += 1
+        span = Span(name, started, attrs=attrs)
+        parent.children.append(span)
+        return span
+
+
+def _ms(seconds: float) -> str:
+    return f"{seconds * 1000:.0f} ms"
+
+
+def _attrs(span: Span) -> str:
+    return "".join(f" {k}={v}" for k, v in span.attrs.items())
+
+
+def _format_span(span: Span, depth: int, lines: List[str]) -> None:
+    lines.append(f"{'  ' * depth}{_ms(span.duration)}  {span.name}{_attrs(span)}")
+
+    # Одноимённые соседние span (запросы к БД, отправки fan-out) — одной строкой;
+    # раскрывается только самый долгий из них
+    groups: Dict[str, List[Span]] = {}
+    for child in span.children:
+        groups.setdefault(child.name, []).append(child)
+    for name, group in groups.items():
+        if len(group) == 1:
+            _format_span(group[0], depth + 1, lines)
+            continue
+        slowest = max(group, key=lambda s: s.duration)
+        total = sum(s.duration for s in group)
+        errors = sum(1 for s in group if "error" in s.attrs)
+        suffix = f", errors {errors}" if errors else ""
+        lines.append(f"{'  ' * (depth + 1)}Σ {_ms(total)}  {name} ×{len(group)} (max {_ms(slowest.duration)}{suffix})")
+        if slowest.children:
+            _format_span(slowest, depth + 2, lines)
+
+
+def format_trace(trace: Trace) -> str:
+    lines = [f"{trace.started_at:%Y-%m-%d %H:%M:%S} UTC"]
+    _format_span(trace.root, 0, lines)
+    if not trace.sampled:
+        lines.append("  (без детализации: трасса не попала в выборку)")
+    if trace.dropped:
+        lines.append(f"  (не записано span: {trace.dropped})")
+    return "\n".join(lines)
+
+
+tracer = Tracer()
@@ -0,0 +1,92 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from aiogram.types import User as TelegramUser
+from sqlalchemy import select, update
+
+from config import settings
+from database import async_session_maker, dialect_insert
+from models import User
+from services.stats_service import StatsService
+
+
+@dataclass(frozen=True)
+class CachedUser:
+    """
+    Снимок строки users, который безопасно держать вне сессии.
+    """
+    id: int
+    telegram_id: int
+    username: Optional[str]
+
+
+class UserCache:
+    """
+    TTL + LRU кэш telegram_id -> CachedUser.
+    При промахе пользователь создаётся (upsert), поэтому известный пользователь
+    не стоит ни одного запроса к БД на апдейт.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items: "OrderedDict[int, Tuple[CachedUser, float]]" = OrderedDict()
+
+    def get(self, telegram_id: int) -> Optional[CachedUser]:
+        item = self._items.get(telegram_id)
+        if item is None:
+            return None
+        user, expires_at = item
+        if expires_at < time.monotonic():
+            del self._items[telegram_id]
+            return None
+        self._items.move_to_end(telegram_id)
+        return user
+
+    def put(self, user: CachedUser) -> None:
+        self._items[user.telegram_id] = (user, time.monotonic() + self.ttl)
+        self._items.move_to_end(user.telegram_id)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def invalidate(self, telegram_id: int) -> None:
+        self._items.pop(telegram_id, None)
+
+    async def resolve(self, tg_user: TelegramUser) -> CachedUser:
+        cached = self.get(tg_user.id)
+        if cached is not None:
+            return cached
+
+        async with async_session_maker() as session:
+            inserted = await session.execute(
+                dialect_insert(User)
+                .values(telegram_id=tg_user.id, username=tg_user.username)
+                .on_conflict_do_nothing(index_elements=[User.telegram_id])
+            )
+            row = (await session.execute(
+                select(User.id, User.telegram_id, User.username).where(User.telegram_id == tg_user.id)
+            )).one()
+            await session.commit()
+        if inserted.rowcount:
+            StatsService.count("users")
+
+        user = CachedUser(id=row.id, telegram_id=row.telegram_id, username=row.username)
+        self.put(user)
+        return user
+
+    async def refresh(self, tg_user: TelegramUser) -> CachedUser:
+        """
+        Обновляет username из Telegram и перечитывает пользователя мимо кэша.
+        """
+        self.invalidate(tg_user.id)
+        async with async_session_maker() as session:
+            await session.execute(
+                update(User).where(User.telegram_id == tg_user.id).values(username=tg_user.username)
+            )
+            await session.commit()
+        return await self.resolve(tg_user)
+
+
+user_cache = UserCache(max_size=settings.USER_CACHE_SIZE, ttl=settings.USER_CACHE_TTL)
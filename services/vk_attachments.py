@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, defaultdict
+from pathlib import Path
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+
+from config import settings
+from services.executors import run_in_file_executor
+from services.media import MediaRef
+from services.media_cache import MediaCache, media_cache
+from services.tracing import tracer
+from services.vk_service import VKService
+
+logger = logging.getLogger(__name__)
+
+CacheKey = Tuple[str, str]  # (file_unique_id, group_id)
+
+
+class PhotoUploadFailed(Exception):
+    """
+    Не все фото поста загрузились в группу: публиковать пост без них нельзя.
+    """
+
+
+class VKAttachmentCache:
+    """
+    LRU-кэш с TTL: (file_unique_id, group_id) -> 'photo{owner_id}_{id}'.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items: "OrderedDict[CacheKey, Tuple[str, float]]" = OrderedDict()
+
+    def get(self, key: CacheKey) -> Optional[str]:
+        item = self._items.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at < time.monotonic():
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return value
+
+    def set(self, key: CacheKey, value: str) -> None:
+        self._items[key] = (value, time.monotonic() + self.ttl)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class VKAttachmentPlanner:
+    """
+    Готовит вложения для всех VK групп поста заранее и параллельно.
+    Фото скачивается только если хотя бы одной группе нужна загрузка, и не
+    больше одного раза за plan: обычно повторные потоки отдаёт media_cache
+    с диска. Если кэш выключен, фото больше кэша или размер фото неизвестен,
+    поток для нескольких групп
+    один раз пишется во временный файл, и загрузки читают его. Файл целиком
+    в памяти не держится.
+    """
+
+    def __init__(self, cache: VKAttachmentCache, concurrency: int, files: MediaCache):
+        self.cache = cache
+        self.files = files
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def plan(
+        self,
+        group_ids: Iterable[str],
+        media: List[MediaRef],
+        open_stream: Callable[[MediaRef], AsyncIterator[bytes]],
+    ) -> Dict[str, List[str]]:
+        """
+        open_stream(media) открывает новый поток байтов фото.
+        Возвращает group_id -> список вложений в порядке media. Группы, в которые
+        не загрузилось хотя бы одно фото, в результат не попадают.
+        """
+        groups = list(dict.fromkeys(str(g).replace("-", "") for g in group_ids))
+        slots: Dict[str, List[Optional[str]]] = {g: [None] * len(media) for g in groups}
+
+        # Индекс фото -> группы, которым его нужно загрузить
+        misses: Dict[int, List[str]] = defaultdict(list)
+        for g in groups:
+            for i, m in enumerate(media):
+                cached = self.cache.get((m.file_unique_id, g))
+                if cached:
+                    slots[g][i] = cached
+                else:
+                    misses[i].append(g)
+
+        async def upload(g: str, m: MediaRef, i: int, chunks: AsyncIterator[bytes]) -> None:
+            # Ожидание семафора — разница между span и его вложенными вызовами
+            with tracer.span("vk.upload_photo", group=g):
+                async with self._semaphore:
+                    attachment = await VKService.upload_wall_photo(g, chunks)
+            if attachment:
+                self.cache.set((m.file_unique_id, g), attachment)
+                slots[g][i] = attachment
+
+        async def fan_out(i: int, targets: List[str]) -> None:
+            m = media[i]
+            if len(targets) == 1 or self._cached(m):
+                await asyncio.gather(*(upload(g, m, i, open_stream(m)) for g in targets))
+                return
+            try:
+                path = await self._spool(open_stream(m))
+            except Exception as e:
+                logger.error(f"VK upload photo: cannot download {m.file_unique_id}: {e}")
+                return
+            try:
+                await asyncio.gather(*(upload(g, m, i, self._read(path)) for g in targets))
+            finally:
+                path.unlink(missing_ok=True)
+
+        if misses:
+            await asyncio.gather(*(fan_out(i, targets) for i, targets in misses.items()))
+
+        return {g: atts for g, atts in slots.items() if all(atts)}
+
+    def _cached(self, m: MediaRef) -> bool:
+        # Кэш отдаёт одновременные потоки одного файла с диска, скачивая его один раз,
+        # если файл в него помещается (размер неизвестен — не рискуем)
+        return m.file_size is not None and 0 < m.file_size <= self.files.max_bytes
+
+    async def _spool(self, chunks: AsyncIterator[bytes]) -> Path:
+        path = await self.files.temp_path()
+        f = await run_in_file_executor(open, path, "wb")
+        try:
+            async for chunk in chunks:
+                await run_in_file_executor(f.write, chunk)
+        except BaseException:
+            f.close()
+            path.unlink(missing_ok=True)
+            raise
+        await run_in_file_executor(f.close)
+        return path
+
+    async def _read(self, path: Path) -> AsyncIterator[bytes]:
+        f = await run_in_file_executor(open, path, "rb")
+        try:
+            while True:
+                chunk = await run_in_file_executor(f.read, self.files.chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            f.close()
+
+
+attachment_cache = VKAttachmentCache(
+    max_size=settings.VK_ATTACHMENT_CACHE_SIZE,
+    ttl=settings.VK_ATTACHMENT_CACHE_TTL,
+)
+attachment_planner = VKAttachmentPlanner(
+    attachment_cache, concurrency=settings.VK_UPLOAD_CONCURRENCY, files=media_cache
+)
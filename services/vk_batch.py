@@ -0,0 +1,113 @@
+import asyncio
+import json
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from services.metrics import VK_API_ERRORS
+from services.vk_transport import VKApiError
+
+logger = logging.getLogger(__name__)
+
+# VK выполняет не больше 25 обращений к API внутри одного execute
+EXECUTE_MAX_CALLS = 25
+
+# Методы без побочных эффектов, которые безопасно объединять в execute
+BATCHABLE_METHODS = frozenset({
+    "users.get",
+    "groups.getById",
+    "utils.resolveScreenName",
+    "photos.getWallUploadServer",
+})
+
+PendingCall = Tuple[str, Dict[str, str], asyncio.Future]
+
+
+def build_execute_code(calls: List[Tuple[str, Dict[str, str]]]) -> str:
+    parts = [f"API.{method}({json.dumps(params, ensure_ascii=False)})" for method, params in calls]
+    return "return [" + ",".join(parts) + "];"
+
+
+class VKBatcher:
+    """
+    Собирает вызовы одного токена, пришедшие в течение window секунд,
+    в один запрос execute и раздаёт результаты обратно вызывающим.
+    """
+
+    def __init__(
+        self,
+        call: Callable[..., Awaitable[Any]],
+        execute: Callable[[str], Awaitable[Tuple[Any, List[Dict[str, Any]]]]],
+        window: float,
+    ):
+        self._call = call
+        self._execute = execute
+        self.window = window
+        self._pending: List[PendingCall] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def call(self, method: str, params: Dict[str, str]) -> Any:
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pending.append((method, params, fut))
+
+        if len(self._pending) >= EXECUTE_MAX_CALLS:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+
+        return await fut
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        task = asyncio.create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[PendingCall]) -> None:
+        if len(batch) == 1:
+            method, params, fut = batch[0]
+            try:
+                result = await self._call(method, **params)
+            except Exception as e:
+                _set_exception(fut, e)
+            else:
+                _set_result(fut, result)
+            return
+
+        try:
+            code = build_execute_code([(method, params) for method, params, _ in batch])
+            results, errors = await self._execute(code)
+        except Exception as e:
+            for _, _, fut in batch:
+                _set_exception(fut, e)
+            return
+
+        # Неудачные вызовы в ответе execute — false, а ошибки идут
+        # в execute_errors в том же порядке
+        errors = list(errors or [])
+        for i, (method, _, fut) in enumerate(batch):
+            result = results[i] if results and i < len(results) else False
+            if result is False:
+                error = errors.pop(0) if errors else {}
+                VK_API_ERRORS.inc(method=method, code=error.get("error_code", 0))
+                _set_exception(fut, VKApiError(
+                    method, error.get("error_code", 0), error.get("error_msg", "execute call failed")
+                ))
+            else:
+                _set_result(fut, result)
+
+
+def _set_result(fut: asyncio.Future, result: Any) -> None:
+    if not fut.done():
+        fut.set_result(result)
+
+
+def _set_exception(fut: asyncio.Future, exc: BaseException) -> None:
+    if not fut.done():
+        fut.set_exception(exc)
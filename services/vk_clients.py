@@ -0,0 +1,156 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import vk_api
+from vk_api.exceptions import ApiError
+
+from config import settings
+from services.executors import run_in_vk_executor
+from services.metrics import VK_API_DURATION, VK_API_ERRORS
+from services.tracing import tracer
+from services.rate_limiter import flood_scheduler
+from services.vk_batch import BATCHABLE_METHODS, VKBatcher
+from services.vk_transport import VKApiError, VKTransport, vk_transport
+
+logger = logging.getLogger(__name__)
+
+
+class VKClient:
+    """
+    Долгоживущий клиент VK для одного токена.
+    Вызовы идут через общий aiohttp-транспорт; при VK_TRANSPORT=vk_api —
+    через vk_api.VkApi в отдельном пуле потоков. VkApi держит свою
+    requests.Session, поэтому соединения переиспользуются (keep-alive).
+    Вызовы из BATCHABLE_METHODS объединяются в execute (VK_BATCH_WINDOW_MS).
+    """
+
+    def __init__(self, access_token: str):
+        self.access_token = access_token
+        self.last_used = time.monotonic()
+        self._session: Optional[vk_api.VkApi] = None
+        self._batcher: Optional[VKBatcher] = None
+        if settings.VK_BATCH_WINDOW_MS > 0:
+            self._batcher = VKBatcher(self._request, self.execute, settings.VK_BATCH_WINDOW_MS / 1000)
+
+    @property
+    def session(self) -> vk_api.VkApi:
+        if self._session is None:
+            self._session = vk_api.VkApi(token=self.access_token, api_version=settings.VK_API_VERSION)
+        return self._session
+
+    async def call(self, method: str, **params) -> Any:
+        if self._batcher is not None and method in BATCHABLE_METHODS:
+            return await self._batcher.call(method, VKTransport._prepare(params))
+        return await self._request(method, **params)
+
+    async def execute(self, code: str) -> Tuple[Any, List[Dict[str, Any]]]:
+        payload = await self._raw("execute", code=code)
+        return payload.get("response"), payload.get("execute_errors", [])
+
+    async def _request(self, method: str, **params) -> Any:
+        payload = await self._raw(method, **params)
+        return payload.get("response")
+
+    async def _raw(self, method: str, **params) -> Dict[str, Any]:
+        return await flood_scheduler.run_vk(self.access_token, lambda: self._send(method, params))
+
+    async def _send(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            with tracer.span(f"vk.{method}"):
+                return await self._send_raw(method, params)
+        except VKApiError as e:
+            VK_API_ERRORS.inc(method=method, code=e.code)
+            raise
+        except Exception as e:
+            VK_API_ERRORS.inc(method=method, code=type(e).__name__)
+            raise
+        finally:
+            VK_API_DURATION.observe(time.perf_counter() - started, method=method)
+
+    async def _send_raw(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        if settings.VK_TRANSPORT == "vk_api":
+            values = VKTransport._prepare(params)
+            try:
+                return await run_in_vk_executor(lambda: self.session.method(method, values, raw=True))
+            except ApiError as e:
+                raise VKApiError(method, e.code, e.error.get("error_msg", ""))
+        return await vk_transport.request(method, self.access_token, **params)
+
+    def close(self) -> None:
+        if self._session is None:
+            return
+        try:
+            self._session.http.close()
+        except Exception:
+            pass
+
+
+class VKClientRegistry:
+    """
+    Один клиент на токен: LRU по количеству и вытеснение по простою.
+    Клиент user токена (VK_USER_TOKEN) общий на процесс и не вытесняется.
+    Используется только из event loop, поэтому без блокировок.
+    """
+
+    def __init__(self, max_size: int, idle_ttl: float):
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self._clients: "OrderedDict[str, VKClient]" = OrderedDict()
+        self._user_client: Optional[VKClient] = None
+
+    def get(self, access_token: str) -> VKClient:
+        now = time.monotonic()
+        self._expire_idle(now)
+
+        client = self._clients.get(access_token)
+        if client is None:
+            client = VKClient(access_token)
+            self._clients[access_token] = client
+            while len(self._clients) > self.max_size:
+                _, evicted = self._clients.popitem(last=False)
+                evicted.close()
+        else:
+            self._clients.move_to_end(access_token)
+
+        client.last_used = now
+        return client
+
+    def user_client(self) -> VKClient:
+        if self._user_client is None:
+            self._user_client = VKClient(settings.VK_USER_TOKEN)
+        self._user_client.last_used = time.monotonic()
+        return self._user_client
+
+    def discard(self, access_token: str) -> None:
+        client = self._clients.pop(access_token, None)
+        if client:
+            client.close()
+
+    def _expire_idle(self, now: float) -> None:
+        # Самые давно использованные — в начале OrderedDict
+        while self._clients:
+            token, client = next(iter(self._clients.items()))
+            if now - client.last_used < self.idle_ttl:
+                break
+            self._clients.popitem(last=False)
+            client.close()
+
+    def close(self) -> None:
+        for client in self._clients.values():
+            client.close()
+        self._clients.clear()
+        if self._user_client:
+            self._user_client.close()
+            self._user_client = None
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+
+vk_clients = VKClientRegistry(
+    max_size=settings.VK_CLIENT_POOL_SIZE,
+    idle_ttl=settings.VK_CLIENT_IDLE_TTL,
+)
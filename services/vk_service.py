@@ -1,32 +1,71 @@
 import asyncio
 import logging
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, AsyncIterator, Iterable
 
-import vk_api
-from vk_api.exceptions import ApiError
+import aiohttp
 
-from config import VK_USER_TOKEN  # Импортируем user токен
+from services.metrics import MEDIA_UPLOAD_BYTES, VK_API_DURATION
+from services.tracing import tracer
+from services.vk_clients import vk_clients
+from services.vk_transport import VKApiError, vk_transport
 
 logger = logging.getLogger(__name__)
 
+# Лимит group_ids в одном groups.getById
+GROUPS_GET_BY_ID_MAX = 500
+
+# Коды ошибок VK, означающие, что сам токен недействителен
+VK_AUTH_ERROR_CODES = frozenset({5, 27, 28})
+
+
+async def _counted(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    async for chunk in chunks:
+        MEDIA_UPLOAD_BYTES.inc(len(chunk))
+        yield chunk
+
 
 class VKService:
     def __init__(self, access_token: str):
-        self.session = vk_api.VkApi(token=access_token)
-        self.api = self.session.get_api()
-        # Отдельная сессия с user токеном для загрузки фото
-        self.user_session = vk_api.VkApi(token=VK_USER_TOKEN)
+        self.client = vk_clients.get(access_token)
 
     @staticmethod
-    def validate_token(access_token: str) -> bool:
+    async def validate_token(access_token: str) -> bool:
+        """
+        False — VK отверг токен (ошибка авторизации).
+        Прочие ошибки (сеть, лимиты) пробрасываются: по ним о токене судить нельзя.
+        """
         try:
-            session = vk_api.VkApi(token=access_token)
-            api = session.get_api()
-            api.users.get()
+            await vk_clients.get(access_token).call("users.get")
             return True
-        except Exception:
+        except VKApiError as e:
+            if e.code not in VK_AUTH_ERROR_CODES:
+                raise
+            vk_clients.discard(access_token)
             return False
 
+    async def get_groups_info(self, group_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        groups.getById для многих групп пачками по GROUPS_GET_BY_ID_MAX.
+        Пачки одного токена уходят одним execute через батчер клиента.
+        Возвращает id группы (строкой) -> объект группы.
+        """
+        ids = list(dict.fromkeys(str(g).replace("-", "") for g in group_ids))
+        chunks = [ids[i:i + GROUPS_GET_BY_ID_MAX] for i in range(0, len(ids), GROUPS_GET_BY_ID_MAX)]
+        try:
+            responses = await asyncio.gather(
+                *(self.client.call("groups.getById", group_ids=chunk) for chunk in chunks)
+            )
+        except VKApiError as e:
+            logger.error(f"VK API error get_groups_info: {e}")
+            return {}
+        return {str(g["id"]): g for groups in responses for g in (groups or [])}
+
+    async def get_token_groups(self) -> List[Dict[str, Any]]:
+        """
+        groups.getById без параметров — группы, которым принадлежит токен.
+        """
+        return await self.client.call("groups.getById") or []
+
     async def get_group_info(self, group_id_or_screen: str) -> Optional[Dict[str, Any]]:
         """
         Принимает: '123', '-123', 'club123', 'public123', 'mygroup'
@@ -45,58 +84,83 @@ class VKService:
             if clean.startswith("-"):
                 clean = clean[1:]
 
-            loop = asyncio.get_event_loop()
-
             if not clean.isdigit():
-                resolved = await loop.run_in_executor(
-                    None, lambda: self.api.utils.resolveScreenName(screen_name=clean)
-                )
+                resolved = await self.client.call("utils.resolveScreenName", screen_name=clean)
                 if not resolved or resolved.get("type") != "group":
                     return None
                 clean = str(resolved["object_id"])
 
-            groups = await loop.run_in_executor(None, lambda: self.api.groups.getById(group_id=clean))
-            return groups[0] if groups else None
+            groups = await self.get_groups_info([clean])
+            return groups.get(clean)
 
-        except ApiError as e:
+        except VKApiError as e:
             logger.error(f"VK API error get_group_info: {e}")
             return None
         except Exception as e:
             logger.error(f"Error get_group_info: {e}")
             return None
 
+    @staticmethod
+    async def upload_wall_photo(group_id: str, chunks: AsyncIterator[bytes]) -> Optional[str]:
+        """
+        Загружает фото на стену группы user токеном.
+        Байты идут из chunks прямо в тело multipart-запроса, без временного файла.
+        Возвращает строку вложения вида photo{owner_id}_{id} или None.
+        """
+        clean_group_id = str(group_id).replace("-", "")
+        try:
+            # Загрузка фото требует user токен
+            user = vk_clients.user_client()
+            server = await user.call("photos.getWallUploadServer", group_id=clean_group_id)
+
+            with aiohttp.MultipartWriter("form-data") as form:
+                part = form.append_payload(
+                    aiohttp.payload.AsyncIterablePayload(_counted(chunks), content_type="image/jpeg")
+                )
+                part.set_content_disposition("form-data", name="photo", filename="photo.jpg")
+
+                with VK_API_DURATION.time(method="upload"), tracer.span("vk.upload"):
+                    async with vk_transport.session.post(server["upload_url"], data=form) as resp:
+                        uploaded = await resp.json(content_type=None)
+
+            if not uploaded.get("photo") or uploaded.get("photo") == "[]":
+                logger.error(f"VK upload photo: empty upload response {uploaded}")
+                return None
+
+            photo = await user.call(
+                "photos.saveWallPhoto",
+                group_id=clean_group_id,
+                photo=uploaded["photo"],
+                server=uploaded["server"],
+                hash=uploaded["hash"],
+            )
+            if photo:
+                return f"photo{photo[0]['owner_id']}_{photo[0]['id']}"
+            return None
+        except VKApiError as e:
+            if e.code == 27:
+                logger.error("VK: Ошибка 27 - токен не поддерживает загрузку фото.")
+            else:
+                logger.error(f"VK upload photo ApiError: {e}")
+            return None
+        except Exception as e:
+            logger.error(f"VK upload photo error: {e}")
+            return None
+        finally:
+            aclose = getattr(chunks, "aclose", None)
+            if aclose:
+                await aclose()
+
     async def post_to_wall(
         self,
         group_id: str,
         message: Optional[str],
-        photo_paths: Optional[List[str]] = None
+        attachments: Optional[List[str]] = None
     ) -> Optional[int]:
         try:
             clean_group_id = str(group_id).replace("-", "")
             owner_id = f"-{clean_group_id}"
 
-            loop = asyncio.get_event_loop()
-            attachments: List[str] = []
-
-            # Используем user токен для загрузки фото
-            if photo_paths:
-                upload = vk_api.VkUpload(self.user_session)  # Используем user_session
-                for p in photo_paths:
-                    try:
-                        photo = await loop.run_in_executor(
-                            None, lambda path=p: upload.photo_wall(path, group_id=clean_group_id)
-                        )
-                        if photo:
-                            attachments.append(f"photo{photo[0]['owner_id']}_{photo[0]['id']}")
-                    except ApiError as e:
-                        if e.code == 27:
-                            logger.error("VK: Ошибка 27 - токен не поддерживает загрузку фото.")
-                            attachments = []
-                            break
-                        logger.error(f"VK upload photo ApiError: {e}")
-                    except Exception as e:
-                        logger.error(f"VK upload photo error: {e}")
-
             # Публикуем пост с основным токеном группы
             params = {
                 "owner_id": owner_id,
@@ -107,12 +171,43 @@ class VKService:
             if msg:
                 params["message"] = msg
 
-            result = await loop.run_in_executor(None, lambda: self.api.wall.post(**params))
+            result = await self.client.call("wall.post", **params)
             return result.get("post_id")
 
-        except ApiError as e:
+        except VKApiError as e:
             logger.error(f"VK API error post_to_wall: {e}")
             return None
         except Exception as e:
             logger.error(f"Error post_to_wall: {e}")
             return None
+
+    async def edit_wall_post(
+        self,
+        group_id: str,
+        post_id: int,
+        message: Optional[str],
+        attachments: Optional[List[str]] = None
+    ) -> bool:
+        """
+        wall.edit заменяет текст и вложения поста целиком.
+        """
+        try:
+            clean_group_id = str(group_id).replace("-", "")
+            params = {
+                "owner_id": f"-{clean_group_id}",
+                "post_id": post_id,
+                "attachments": ",".join(attachments) if attachments else None,
+            }
+            msg = (message or "").strip()
+            if msg:
+                params["message"] = msg
+
+            await self.client.call("wall.edit", **params)
+            return True
+
+        except VKApiError as e:
+            logger.error(f"VK API error edit_wall_post: {e}")
+            return False
+        except Exception as e:
+            logger.error(f"Error edit_wall_post: {e}")
+            return False
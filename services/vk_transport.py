@@ -0,0 +1,84 @@
+import logging
+from typing import Any, Dict, Optional
+
+import aiohttp
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class VKApiError(Exception):
+    def __init__(self, method: str, code: int, message: str):
+        super().__init__(f"[{code}] {message} ({method})")
+        self.method = method
+        self.code = code
+        self.message = message
+
+
+class VKTransport:
+    """
+    Асинхронный HTTP-транспорт VK API поверх aiohttp.
+    Одна ClientSession на процесс: пул соединений общий для всех токенов.
+    """
+
+    def __init__(self, base_url: str, version: str, timeout: float, connections: int):
+        self.base_url = base_url.rstrip("/") + "/"
+        self.version = version
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.connections = connections
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=self.timeout,
+                connector=aiohttp.TCPConnector(limit=self.connections),
+            )
+        return self._session
+
+    @staticmethod
+    def _prepare(params: Dict[str, Any]) -> Dict[str, str]:
+        prepared = {}
+        for key, value in params.items():
+            if value is None:
+                continue
+            if isinstance(value, (list, tuple, set)):
+                value = ",".join(str(v) for v in value)
+            elif isinstance(value, bool):
+                value = int(value)
+            prepared[key] = str(value)
+        return prepared
+
+    async def request(self, method: str, access_token: str, **params: Any) -> Dict[str, Any]:
+        """
+        Возвращает весь ответ VK (нужно для execute_errors) или бросает VKApiError.
+        """
+        data = self._prepare(params)
+        data["access_token"] = access_token
+        data["v"] = self.version
+
+        async with self.session.post(self.base_url + method, data=data) as resp:
+            payload = await resp.json(content_type=None)
+
+        if "error" in payload:
+            error = payload["error"]
+            raise VKApiError(method, error.get("error_code", 0), error.get("error_msg", ""))
+        return payload
+
+    async def call(self, method: str, access_token: str, **params: Any) -> Any:
+        payload = await self.request(method, access_token, **params)
+        return payload.get("response")
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+vk_transport = VKTransport(
+    base_url=settings.VK_API_URL,
+    version=settings.VK_API_VERSION,
+    timeout=settings.VK_HTTP_TIMEOUT,
+    connections=settings.VK_HTTP_CONNECTIONS,
+)
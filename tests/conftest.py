@@ -0,0 +1,89 @@
+"""
+Общие настройки тестов.
+
+Переменные окружения выставляются до импорта модулей проекта: settings, движок БД,
+транспорт VK и кэш медиа создаются при импорте. База — временный файл SQLite,
+пересоздаётся фикстурой db; Telegram и VK — заглушки scripts/fake_apis.py на
+loopback (tests/loopback.py). async-тесты выполняются в одном event loop на всю
+сессию, как в процессе бота: синглтоны (status_recorder, flood_scheduler, ...)
+держат примитивы asyncio, привязанные к loop.
+"""
+import asyncio
+import inspect
+import os
+import socket
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+_TMP = Path(tempfile.mkdtemp(prefix="mpbot-tests-"))
+_API_URL = f"http://127.0.0.1:{_free_port()}"
+
+os.environ.setdefault("BOT_TOKEN", "123456:test")
+os.environ.setdefault("VK_USER_TOKEN", "vk1.a.test")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_TMP / 'test.sqlite3'}"
+os.environ["MEDIA_CACHE_DIR"] = str(_TMP / "media_cache")
+os.environ["METRICS_PORT"] = "0"
+os.environ["TELEGRAM_API_URL"] = _API_URL
+os.environ["VK_API_URL"] = _API_URL + "/method/"
+os.environ["VK_TRANSPORT"] = "aiohttp"
+os.environ["IMAGE_NORMALIZE"] = "false"
+for name in ("TG_GLOBAL_RATE", "TG_PRIVATE_CHAT_RATE", "VK_TOKEN_RATE"):
+    os.environ[name] = "1000000"
+os.environ["TG_CHAT_RATE_PER_MINUTE"] = "60000000"
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+_loop = asyncio.new_event_loop()
+asyncio.set_event_loop(_loop)
+
+
+def run(coro):
+    return _loop.run_until_complete(coro)
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_pyfunc_call(pyfuncitem):
+    if not inspect.iscoroutinefunction(pyfuncitem.obj):
+        return None
+    args = {name: pyfuncitem.funcargs[name] for name in pyfuncitem._fixtureinfo.argnames}
+    run(pyfuncitem.obj(**args))
+    return True
+
+
+def pytest_sessionfinish(session, exitstatus):
+    from database import engine
+    from services.vk_clients import vk_clients
+    from services.vk_transport import vk_transport
+
+    async def close():
+        vk_clients.close()
+        await vk_transport.close()
+        await engine.dispose()
+
+    run(close())
+
+
+@pytest.fixture
+def db():
+    """
+    Пустая база со схемой моделей.
+    """
+    from database import engine, init_db
+    from models import Base
+
+    async def reset():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+        await init_db()
+
+    run(reset())
@@ -0,0 +1,39 @@
+"""
+Записи для тестов: пользователь с сообществами.
+"""
+from typing import List, Tuple
+
+from database import async_session_maker
+from models import Community, PlatformType, User
+
+
+async def user_with_communities(telegram_id: int = 1, tg: int = 0, vk: int = 0) -> Tuple[int, List[int]]:
+    """
+    Пользователь с tg Telegram-каналами и vk VK группами (с токенами).
+    Возвращает users.id и id сообществ: сначала Telegram, затем VK.
+    """
+    async with async_session_maker() as session:
+        user = User(telegram_id=telegram_id, username=f"user{telegram_id}")
+        session.add(user)
+        await session.flush()
+        communities = [
+            Community(
+                user_id=user.id,
+                platform=PlatformType.TELEGRAM,
+                community_id=str(-1_000_000_000_000 - telegram_id * 100 - i),
+                community_name=f"tg {i}",
+            )
+            for i in range(tg)
+        ] + [
+            Community(
+                user_id=user.id,
+                platform=PlatformType.VK,
+                community_id=str(telegram_id * 100 + i),
+                community_name=f"vk {i}",
+                access_token=f"vk1.a.group-{telegram_id}-{i}",
+            )
+            for i in range(vk)
+        ]
+        session.add_all(communities)
+        await session.commit()
+        return user.id, [c.id for c in communities]
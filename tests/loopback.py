@@ -0,0 +1,29 @@
+"""
+Заглушки Telegram Bot API и VK API (scripts/fake_apis.py) внутри event loop теста,
+на адресе из TELEGRAM_API_URL / VK_API_URL (см. conftest.py).
+"""
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional, Tuple
+
+from aiogram import Bot
+from aiohttp import web
+from yarl import URL
+
+from config import settings
+from scripts.fake_apis import FakeAPIs, FaultConfig
+from services.bot_factory import create_bot
+
+
+@asynccontextmanager
+async def fake_apis(config: Optional[FaultConfig] = None) -> AsyncIterator[Tuple[FakeAPIs, Bot]]:
+    apis = FakeAPIs(config or FaultConfig(photo_bytes=64 * 1024, chunk_size=16 * 1024))
+    url = URL(settings.TELEGRAM_API_URL)
+    runner = web.AppRunner(apis.app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, url.host, url.port).start()
+    bot = create_bot(settings.BOT_TOKEN)
+    try:
+        yield apis, bot
+    finally:
+        await bot.session.close()
+        await runner.cleanup()
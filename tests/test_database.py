@@ -0,0 +1,32 @@
+import pytest
+from sqlalchemy import text
+
+from database import _postgres_url, _resolve_profile, engine
+
+
+@pytest.mark.parametrize(
+    "url, profile",
+    [
+        ("sqlite+aiosqlite:///bot.db", "sqlite"),
+        ("postgresql+asyncpg://u:p@localhost/db", "postgres"),
+        ("postgresql+psycopg://u:p@localhost/db", "postgres"),
+        ("mysql+aiomysql://u:p@localhost/db", "default"),
+    ],
+)
+def test_profile_follows_url(url, profile):
+    assert _resolve_profile(url, "auto") == profile
+
+
+def test_statement_cache_only_for_asyncpg():
+    asyncpg = _postgres_url("postgresql+asyncpg://u:p@localhost/db")
+    psycopg = _postgres_url("postgresql+psycopg://u:p@localhost/db")
+    explicit = _postgres_url("postgresql+asyncpg://u:p@localhost/db?prepared_statement_cache_size=0")
+
+    assert "prepared_statement_cache_size" in asyncpg.query
+    assert "prepared_statement_cache_size" not in psycopg.query
+    assert explicit.query["prepared_statement_cache_size"] == "0"
+
+
+async def test_sqlite_connections_use_wal(db):
+    async with engine.connect() as conn:
+        assert (await conn.execute(text("PRAGMA journal_mode"))).scalar() == "wal"
@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+from models import PlatformType
+from services.fanout import FanoutEngine
+
+
+def platform_of(target):
+    return target[0]
+
+
+async def test_limits_concurrency_per_platform():
+    engine = FanoutEngine({PlatformType.TELEGRAM: 2, PlatformType.VK: 1})
+    running = {PlatformType.TELEGRAM: 0, PlatformType.VK: 0}
+    peak = dict(running)
+
+    async def send(target):
+        platform = platform_of(target)
+        running[platform] += 1
+        peak[platform] = max(peak[platform], running[platform])
+        await asyncio.sleep(0.01)
+        running[platform] -= 1
+        return True
+
+    async def on_result(target, ok, error):
+        pass
+
+    targets = [(PlatformType.TELEGRAM, i) for i in range(6)] + [(PlatformType.VK, i) for i in range(3)]
+    assert await engine.run(targets, platform_of, send, on_result) == 9
+    assert peak == {PlatformType.TELEGRAM: 2, PlatformType.VK: 1}
+
+
+async def test_reports_failures_and_exceptions():
+    engine = FanoutEngine({PlatformType.TELEGRAM: 4, PlatformType.VK: 4})
+    results = {}
+
+    async def send(target):
+        if target[1] == "boom":
+            raise RuntimeError("network down")
+        return target[1] == "ok"
+
+    async def on_result(target, ok, error):
+        results[target[1]] = (ok, error)
+
+    targets = [(PlatformType.TELEGRAM, "ok"), (PlatformType.VK, "no"), (PlatformType.VK, "boom")]
+    assert await engine.run(targets, platform_of, send, on_result) == 1
+    assert results == {
+        "ok": (True, None),
+        "no": (False, "vk: delivery failed"),
+        "boom": (False, "vk: network down"),
+    }
+
+
+async def test_on_result_calls_do_not_overlap():
+    engine = FanoutEngine({PlatformType.TELEGRAM: 10})
+    inside = 0
+    overlapped = False
+
+    async def send(target):
+        return True
+
+    async def on_result(target, ok, error):
+        nonlocal inside, overlapped
+        inside += 1
+        overlapped |= inside > 1
+        await asyncio.sleep(0.001)
+        inside -= 1
+
+    targets = [(PlatformType.TELEGRAM, i) for i in range(10)]
+    assert await engine.run(targets, platform_of, send, on_result) == 10
+    assert not overlapped
+
+
+async def test_cancels_pending_sends_when_on_result_fails():
+    engine = FanoutEngine({PlatformType.TELEGRAM: 10})
+    finished = []
+
+    async def send(target):
+        await asyncio.sleep(0 if target[1] == 0 else 1)
+        finished.append(target[1])
+        return True
+
+    async def on_result(target, ok, error):
+        raise ValueError("db error")
+
+    targets = [(PlatformType.TELEGRAM, i) for i in range(3)]
+    with pytest.raises(ValueError):
+        await engine.run(targets, platform_of, send, on_result)
+    await asyncio.sleep(0.01)
+    assert finished == [0]
@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+from aiogram.fsm.storage.base import StorageKey
+from sqlalchemy import select
+
+from database import async_session_maker
+from models import FSMRecord
+from services.fsm_storage import SQLStorage
+
+
+def key(user_id: int = 1) -> StorageKey:
+    return StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+
+
+def storage(**kwargs) -> SQLStorage:
+    # Сброс только явный (flush/close), чтобы видеть, что лежит в БД
+    options = dict(cache_size=100, cache_ttl=60, flush_interval=60, flush_batch=100, shared=False)
+    options.update(kwargs)
+    return SQLStorage(**options)
+
+
+async def records() -> dict:
+    async with async_session_maker() as session:
+        rows = (await session.execute(select(FSMRecord))).scalars().all()
+    return {r.key: (r.state, r.data) for r in rows}
+
+
+async def test_writes_are_cached_until_flush(db):
+    fsm = storage()
+    await fsm.set_state(key(), "CreatePostState:waiting_for_communities")
+    await fsm.set_data(key(), {"selected": [1]})
+    await fsm.set_data(key(), {"selected": [1, 2]})
+
+    assert await fsm.get_state(key()) == "CreatePostState:waiting_for_communities"
+    assert await records() == {}
+
+    await fsm.close()
+    assert list((await records()).values()) == [("CreatePostState:waiting_for_communities", {"selected": [1, 2]})]
+
+    restarted = storage()
+    assert await restarted.get_data(key()) == {"selected": [1, 2]}
+    await restarted.close()
+
+
+async def test_cleared_state_removes_row(db):
+    fsm = storage()
+    await fsm.set_state(key(), "AddCommunityState:waiting_for_platform")
+    await fsm.flush()
+    await fsm.set_state(key(), None)
+    await fsm.set_data(key(), {})
+    await fsm.close()
+
+    assert await records() == {}
+
+
+async def test_dirty_entries_survive_eviction(db):
+    fsm = storage(cache_size=1)
+    for user_id in range(1, 4):
+        await fsm.set_data(key(user_id), {"user": user_id})
+
+    assert [await fsm.get_data(key(u)) for u in range(1, 4)] == [{"user": u} for u in range(1, 4)]
+
+    await fsm.close()
+    assert len(await records()) == 3
+
+
+async def test_shared_mode_writes_through(db):
+    first, second = storage(shared=True), storage(shared=True)
+
+    await first.set_data(key(), {"selected": [1]})
+    assert await second.get_data(key()) == {"selected": [1]}
+
+    await second.set_data(key(), {"selected": [1, 2]})
+    assert await first.get_data(key()) == {"selected": [1, 2]}
+
+    await first.close()
+    await second.close()
+
+
+async def test_failed_flush_keeps_changes(db):
+    def broken_session():
+        raise ConnectionError("database is down")
+
+    fsm = storage()
+    await fsm.set_data(key(), {"selected": [1]})
+    fsm.session_maker = broken_session
+
+    with pytest.raises(ConnectionError):
+        await fsm.flush()
+
+    fsm.session_maker = async_session_maker
+    await fsm.close()
+    assert list((await records()).values()) == [(None, {"selected": [1]})]
+
+
+async def test_cancelled_flush_keeps_changes(db):
+    started = asyncio.Event()
+
+    class HangingSession:
+        async def __aenter__(self):
+            started.set()
+            await asyncio.sleep(3600)
+
+        async def __aexit__(self, *exc):
+            return False
+
+    fsm = storage()
+    await fsm.set_data(key(), {"selected": [1]})
+    fsm.session_maker = HangingSession
+    flush = asyncio.create_task(fsm.flush())
+    await started.wait()
+    flush.cancel()
+    await asyncio.gather(flush, return_exceptions=True)
+
+    fsm.session_maker = async_session_maker
+    await fsm.close()
+    assert list((await records()).values()) == [(None, {"selected": [1]})]
@@ -0,0 +1,126 @@
+import asyncio
+import os
+
+import pytest
+
+from services.media_cache import MediaCache
+
+CHUNK = 1024
+
+
+class Source:
+    """
+    fetch() для MediaCache: отдаёт size байт кусками и считает скачивания.
+    """
+
+    def __init__(self, size: int = 4 * CHUNK, fill: bytes = b"x"):
+        self.data = fill * size
+        self.fetches = 0
+
+    async def fetch(self):
+        self.fetches += 1
+        for i in range(0, len(self.data), CHUNK):
+            await asyncio.sleep(0)
+            yield self.data[i:i + CHUNK]
+
+
+async def read(cache: MediaCache, key: str, source: Source) -> bytes:
+    return b"".join([chunk async for chunk in cache.stream(key, source.fetch)])
+
+
+def cache_at(path, max_bytes=1024 * 1024) -> MediaCache:
+    return MediaCache(root=str(path), max_bytes=max_bytes, chunk_size=CHUNK)
+
+
+async def test_miss_is_stored_and_hit_reads_from_disk(tmp_path):
+    cache, source = cache_at(tmp_path), Source()
+
+    assert await read(cache, "a", source) == source.data
+    assert await read(cache, "a", source) == source.data
+    assert source.fetches == 1
+    assert await cache.contains("a")
+    assert cache.size == len(source.data)
+    assert list((tmp_path / "tmp").iterdir()) == []
+
+
+async def test_concurrent_misses_fetch_once(tmp_path):
+    cache, source = cache_at(tmp_path), Source()
+
+    results = await asyncio.gather(*(read(cache, "a", source) for _ in range(5)))
+
+    assert results == [source.data] * 5
+    assert source.fetches == 1
+
+
+async def test_failed_fetch_leaves_no_entry(tmp_path):
+    cache = cache_at(tmp_path)
+
+    async def broken():
+        yield b"x" * CHUNK
+        raise ConnectionError("download interrupted")
+
+    with pytest.raises(ConnectionError):
+        async for _ in cache.stream("a", broken):
+            pass
+
+    assert not await cache.contains("a")
+    assert list((tmp_path / "tmp").iterdir()) == []
+
+
+async def test_least_recently_used_is_evicted_and_pinned_is_kept(tmp_path):
+    cache = cache_at(tmp_path, max_bytes=8 * CHUNK)
+    sources = {key: Source() for key in "abc"}
+
+    await read(cache, "a", sources["a"])
+    await read(cache, "b", sources["b"])
+    async with cache.pinned("a", sources["a"].fetch) as path:
+        await read(cache, "c", sources["c"])
+        assert path.read_bytes() == sources["a"].data
+
+    assert await cache.contains("a")
+    assert not await cache.contains("b")
+    assert await cache.contains("c")
+    assert cache.size <= cache.max_bytes
+
+
+async def test_file_removed_behind_cache_is_fetched_again(tmp_path):
+    cache, source = cache_at(tmp_path), Source()
+    async with cache.pinned("a", source.fetch) as path:
+        pass
+    path.unlink()
+
+    assert await read(cache, "a", source) == source.data
+    assert source.fetches == 2
+
+
+async def test_index_is_restored_after_restart(tmp_path):
+    first = cache_at(tmp_path)
+    for key in "ab":
+        async with first.pinned(key, Source().fetch) as path:
+            os.utime(path, (1, 1) if key == "a" else None)
+    stale = tmp_path / "tmp" / "unfinished"
+    stale.write_bytes(b"partial")
+
+    # Новый процесс: индекс по каталогу, старший по mtime вытесняется первым
+    second = cache_at(tmp_path, max_bytes=4 * CHUNK)
+    source = Source()
+    assert await read(second, "b", source) == source.data
+    assert source.fetches == 0
+    assert not await second.contains("a")
+    assert not stale.exists()
+
+
+async def test_first_load_scans_once(tmp_path, monkeypatch):
+    cache = cache_at(tmp_path)
+    scans = 0
+    scan = cache._scan
+
+    def counted():
+        nonlocal scans
+        scans += 1
+        return scan()
+
+    monkeypatch.setattr(cache, "_scan", counted)
+    await asyncio.gather(*(cache.contains(k) for k in "abcd"), cache.temp_path())
+
+    assert scans == 1
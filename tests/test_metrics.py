@@ -0,0 +1,100 @@
+import socket
+
+import aiohttp
+import pytest
+from sqlalchemy import text
+
+from database import async_session_maker, engine
+from factories import user_with_communities
+from services.metrics import DB_QUERY_DURATION, MetricsRegistry, start_metrics_server
+from services.stats_service import StatsService
+
+
+def test_counter_totals_by_label():
+    registry = MetricsRegistry()
+    results = registry.counter("results_total", "Результаты", ["platform", "result"])
+    results.inc(platform="vk", result="ok")
+    results.inc(2, platform="vk", result="error")
+    results.inc(platform="telegram", result="ok")
+
+    assert results.value(platform="vk", result="error") == 2
+    assert results.total(platform="vk") == 3
+    assert results.total(result="ok") == 2
+    assert results.total() == 4
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = MetricsRegistry()
+    duration = registry.histogram("duration_seconds", "Время", ["method"], buckets=(0.1, 1))
+    for value in (0.05, 0.5, 5):
+        duration.observe(value, method="wall.post")
+
+    rendered = registry.render()
+
+    assert "# TYPE duration_seconds histogram" in rendered
+    assert 'duration_seconds_bucket{method="wall.post",le="0.1"} 1' in rendered
+    assert 'duration_seconds_bucket{method="wall.post",le="1"} 2' in rendered
+    assert 'duration_seconds_bucket{method="wall.post",le="+Inf"} 3' in rendered
+    assert 'duration_seconds_sum{method="wall.post"} 5.55' in rendered
+    assert 'duration_seconds_count{method="wall.post"} 3' in rendered
+    assert duration.total() == (3, pytest.approx(5.55))
+
+
+def test_gauge_collect_and_label_escaping():
+    registry = MetricsRegistry()
+    registry.gauge("queue_depth", "Очередь", ["bucket"], collect=lambda: {('tg:chat:"1"',): 2})
+
+    def broken():
+        raise RuntimeError("collect failed")
+
+    registry.gauge("broken", "Сбор с ошибкой", ["bucket"], collect=broken)
+
+    rendered = registry.render()
+    assert 'queue_depth{bucket="tg:chat:\\"1\\""} 2' in rendered
+    assert "# TYPE broken gauge" in rendered
+
+
+def test_duplicate_metric_is_rejected():
+    registry = MetricsRegistry()
+    registry.counter("requests_total", "Запросы")
+    with pytest.raises(ValueError):
+        registry.gauge("requests_total", "Запросы")
+
+
+async def test_db_queries_are_timed(db):
+    before = DB_QUERY_DURATION.count(operation="SELECT")
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+    assert DB_QUERY_DURATION.count(operation="SELECT") == before + 1
+
+
+async def test_entity_counters_start_from_db_and_follow_inserts(db):
+    await user_with_communities(tg=2, vk=1)
+    async with async_session_maker() as session:
+        await StatsService(session).load_counters()
+
+    assert (StatsService.get("users"), StatsService.get("communities")) == (1, 3)
+    StatsService.count("communities")
+    assert StatsService.get("communities") == 4
+
+
+async def test_metrics_endpoint_serves_registry():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+
+    runner = await start_metrics_server("127.0.0.1", port)
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"http://127.0.0.1:{port}/metrics") as resp:
+                body = await resp.text()
+    finally:
+        await runner.cleanup()
+
+    assert resp.status == 200
+    assert "# TYPE db_query_duration_seconds histogram" in body
+
+
+async def test_metrics_disabled_without_port():
+    assert await start_metrics_server("127.0.0.1", 0) is None
@@ -0,0 +1,60 @@
+import pytest
+from sqlalchemy import Column, Integer, MetaData, Table, inspect, text
+
+from database import engine, init_db
+from migrations import MIGRATIONS, check_schema, run_migrations
+from models import Base
+
+# Колонки, которых не было у таблиц до outbox (и индексы на них)
+LEGACY_DROP = [
+    "DROP INDEX ix_ptc_status_next_attempt",
+    "DROP INDEX ix_posts_publish_at",
+    "ALTER TABLE post_to_community DROP COLUMN attempts",
+    "ALTER TABLE post_to_community DROP COLUMN next_attempt_at",
+    "ALTER TABLE post_to_community DROP COLUMN last_error",
+    "ALTER TABLE post_to_community DROP COLUMN locked_by",
+    "ALTER TABLE post_to_community DROP COLUMN locked_until",
+    "ALTER TABLE posts DROP COLUMN text",
+    "ALTER TABLE posts DROP COLUMN media",
+    "ALTER TABLE posts DROP COLUMN message_ids",
+    "ALTER TABLE posts DROP COLUMN publish_at",
+]
+
+
+def columns(conn, table):
+    return {c["name"] for c in inspect(conn).get_columns(table)}
+
+
+async def test_fresh_database_records_all_versions(db):
+    async with engine.begin() as conn:
+        versions = (await conn.execute(text("SELECT version FROM schema_version"))).scalars().all()
+        assert await conn.run_sync(run_migrations) == []
+
+    assert sorted(versions) == [version for version, _, _ in MIGRATIONS]
+
+
+async def test_old_tables_get_outbox_columns(db):
+    async with engine.begin() as conn:
+        for statement in LEGACY_DROP:
+            await conn.execute(text(statement))
+        await conn.execute(text("DELETE FROM schema_version"))
+        assert "attempts" not in await conn.run_sync(columns, "post_to_community")
+
+    await init_db()
+
+    async with engine.connect() as conn:
+        ptc = await conn.run_sync(columns, "post_to_community")
+        posts = await conn.run_sync(columns, "posts")
+    assert {"attempts", "next_attempt_at", "last_error", "locked_by", "locked_until"} <= ptc
+    assert {"text", "media", "message_ids", "publish_at"} <= posts
+
+
+async def test_missing_column_without_migration_stops_start(db):
+    metadata = MetaData()
+    for table in Base.metadata.sorted_tables:
+        table.to_metadata(metadata)
+    Table("posts", metadata, Column("not_migrated", Integer), extend_existing=True)
+
+    async with engine.connect() as conn:
+        with pytest.raises(RuntimeError, match="posts.not_migrated"):
+            await conn.run_sync(check_schema, metadata)
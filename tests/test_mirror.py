@@ -0,0 +1,141 @@
+import asyncio
+from datetime import datetime, timezone
+
+from aiogram.types import Chat, Message, PhotoSize
+from sqlalchemy import select
+
+from database import async_session_maker
+from factories import user_with_communities
+from loopback import fake_apis
+from models import ChannelMirror, MirroredPost
+from services.mirror import ChannelMirrorPipeline
+
+CHANNEL_ID = -1001234567890
+
+
+async def mirror_into(vk: int) -> list:
+    """
+    Канал CHANNEL_ID, зеркалируемый в vk групп. Возвращает id сообществ VK.
+    """
+    user_id, communities = await user_with_communities(tg=1, vk=vk)
+    channel, groups = communities[0], communities[1:]
+    async with async_session_maker() as session:
+        session.add_all([
+            ChannelMirror(user_id=user_id, channel_id=CHANNEL_ID, tg_community_id=channel, vk_community_id=g)
+            for g in groups
+        ])
+        await session.commit()
+    return groups
+
+
+def channel_post(bot, message_id: int, text=None, photo=None, media_group_id=None, edited=False) -> Message:
+    photos = [PhotoSize(file_id=photo, file_unique_id=photo, width=10, height=10, file_size=1024)] if photo else None
+    return Message(
+        message_id=message_id,
+        date=datetime.now(timezone.utc),
+        edit_date=int(datetime.now(timezone.utc).timestamp()) if edited else None,
+        chat=Chat(id=CHANNEL_ID, type="channel"),
+        text=text if not photo else None,
+        caption=text if photo else None,
+        photo=photos,
+        media_group_id=media_group_id,
+    ).as_(bot)
+
+
+async def mirrored_posts() -> list:
+    async with async_session_maker() as session:
+        return (await session.execute(
+            select(MirroredPost).order_by(MirroredPost.message_id, MirroredPost.community_id)
+        )).scalars().all()
+
+
+async def wait_for(condition, timeout: float = 5) -> None:
+    async def poll():
+        while not await condition():
+            await asyncio.sleep(0.02)
+
+    await asyncio.wait_for(poll(), timeout)
+
+
+async def test_channel_posts_are_mirrored_in_order(db):
+    groups = await mirror_into(vk=2)
+    pipeline = ChannelMirrorPipeline()
+    await pipeline.load()
+
+    async with fake_apis() as (apis, bot):
+        try:
+            for message_id in range(1, 4):
+                await pipeline.submit(channel_post(bot, message_id, text=f"post {message_id}"))
+
+            async def posted():
+                return len(await mirrored_posts()) == 6
+
+            await wait_for(posted)
+        finally:
+            await pipeline.stop()
+
+    rows = await mirrored_posts()
+    assert apis.stats["vk.wall.post"] == 6
+    for group in groups:
+        ids = [r.vk_post_id for r in rows if r.community_id == group]
+        assert ids == sorted(ids)
+
+
+async def test_album_becomes_one_post_and_edit_updates_it(db):
+    await mirror_into(vk=1)
+    pipeline = ChannelMirrorPipeline()
+    await pipeline.load()
+
+    async with fake_apis() as (apis, bot):
+        try:
+            await pipeline.submit(channel_post(bot, 1, text="album", photo="p1", media_group_id="g"))
+            await pipeline.submit(channel_post(bot, 2, photo="p2", media_group_id="g"))
+
+            async def posted():
+                return len(await mirrored_posts()) == 2
+
+            await wait_for(posted)
+            await pipeline.submit(channel_post(bot, 1, text="album, edited", photo="p1", edited=True), edit=True)
+
+            async def edited():
+                return all(r.text == "album, edited" for r in await mirrored_posts())
+
+            await wait_for(edited)
+        finally:
+            await pipeline.stop()
+
+    rows = await mirrored_posts()
+    assert apis.stats["vk.wall.post"] == 1
+    assert apis.stats["vk.upload"] == 2
+    assert apis.stats["vk.wall.edit"] == 1
+    assert len({r.vk_post_id for r in rows}) == 1
+    assert [r.position for r in rows] == [0, 1]
+
+
+async def test_posts_of_unmirrored_channels_are_ignored(db):
+    pipeline = ChannelMirrorPipeline()
+    await pipeline.load()
+
+    async with fake_apis() as (apis, bot):
+        await pipeline.submit(channel_post(bot, 1, text="post"))
+        await pipeline.stop()
+
+    assert pipeline.queue_depths() == {}
+    assert apis.stats["vk.wall.post"] == 0
+
+
+async def test_mirrors_added_elsewhere_are_picked_up_by_reload(db):
+    pipeline = ChannelMirrorPipeline(reload_interval=0.05)
+    await pipeline.load()
+    pipeline.start()
+    try:
+        assert pipeline.targets(CHANNEL_ID) == []
+        # Зеркало включили через другую реплику
+        await mirror_into(vk=2)
+
+        async def reloaded():
+            return len(pipeline.targets(CHANNEL_ID)) == 2
+
+        await wait_for(reloaded)
+    finally:
+        await pipeline.stop()
@@ -0,0 +1,144 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import select
+
+from config import settings
+from database import async_session_maker
+from factories import user_with_communities
+from loopback import fake_apis
+from models import PostStatus, PostToCommunity
+from services.outbox import Outbox
+from services.post_service import PostService
+from services.status_recorder import StatusRecorder
+
+
+async def new_post(tg: int = 0, vk: int = 0, telegram_id: int = 1, **kwargs) -> int:
+    user_id, community_ids = await user_with_communities(telegram_id=telegram_id, tg=tg, vk=vk)
+    async with async_session_maker() as session:
+        post, _ = await PostService(session).create_post(
+            user_id=user_id, from_chat_id=1, message_id=1, text="text",
+            photo_file_id=None, document_file_id=None, community_ids=community_ids, **kwargs,
+        )
+        return post.id
+
+
+async def outbox_rows() -> list:
+    async with async_session_maker() as session:
+        return (await session.execute(select(PostToCommunity).order_by(PostToCommunity.id))).scalars().all()
+
+
+async def wait_for(condition, timeout: float = 5) -> None:
+    async def poll():
+        while not await condition():
+            await asyncio.sleep(0.02)
+
+    await asyncio.wait_for(poll(), timeout)
+
+
+@pytest.mark.parametrize(
+    "ok, attempts, status",
+    [(True, 0, PostStatus.SENT), (False, 0, PostStatus.PENDING), (False, 7, PostStatus.FAILED)],
+)
+def test_result_values(ok, attempts, status):
+    values = StatusRecorder.result_values(PostToCommunity(id=1, attempts=attempts), ok, None if ok else "boom")
+
+    assert values["status"] == status
+    assert values["attempts"] == attempts + 1
+    assert values["locked_by"] is None and values["locked_until"] is None
+    if status == PostStatus.PENDING:
+        assert values["next_attempt_at"] > datetime.now(timezone.utc)
+
+
+async def test_outbox_delivers_pending_rows(db):
+    await new_post(tg=2, vk=2)
+
+    async with fake_apis() as (apis, bot):
+        outbox = Outbox(bot, workers=2, poll_interval=0.05)
+        await outbox.start()
+        try:
+            async def sent():
+                return all(r.status == PostStatus.SENT for r in await outbox_rows())
+
+            await wait_for(sent)
+        finally:
+            await outbox.stop()
+
+    assert apis.stats["tg.copyMessage"] == 2
+    assert apis.stats["vk.wall.post"] == 2
+    assert all(r.attempts == 1 and r.locked_by is None for r in await outbox_rows())
+
+
+async def test_failed_delivery_is_retried(db, monkeypatch):
+    monkeypatch.setattr(settings, "OUTBOX_BACKOFF_BASE", 0.05)
+    send = PostService._send_to_telegram
+    calls = 0
+
+    async def flaky_send(self, *args):
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise ConnectionError("telegram is down")
+        return await send(self, *args)
+
+    monkeypatch.setattr(PostService, "_send_to_telegram", flaky_send)
+    await new_post(tg=1)
+
+    async with fake_apis() as (apis, bot):
+        outbox = Outbox(bot, workers=1, poll_interval=0.05)
+        await outbox.start()
+        try:
+            async def sent():
+                return (await outbox_rows())[0].status == PostStatus.SENT
+
+            await wait_for(sent)
+        finally:
+            await outbox.stop()
+
+    row = (await outbox_rows())[0]
+    assert row.attempts == 2
+    assert row.last_error is None
+    assert apis.stats["tg.copyMessage"] == 1
+
+
+async def test_concurrent_claims_do_not_overlap(db):
+    for telegram_id in range(1, 6):
+        await new_post(tg=4, telegram_id=telegram_id)
+    outboxes = [Outbox(None, batch_size=8) for _ in range(3)]
+
+    claims = await asyncio.gather(*(o._claim() for o in outboxes))
+
+    claimed = [ptc_id for units, _ in claims for _, ptc_ids in units for ptc_id in ptc_ids]
+    assert len(claimed) == len(set(claimed)) == 20
+    owners = {r.id: r.locked_by for r in await outbox_rows()}
+    assert len(set(owners.values())) == 3
+
+
+async def test_leased_rows_wait_until_lease_expires(db):
+    await new_post(tg=2, locked_by="bot:1")
+    outbox = Outbox(None)
+
+    assert await outbox._claim() == ([], False)
+
+    async with async_session_maker() as session:
+        for row in (await session.execute(select(PostToCommunity))).scalars():
+            row.locked_until = datetime.now(timezone.utc) - timedelta(seconds=1)
+        await session.commit()
+
+    units, _ = await outbox._claim()
+    assert [len(ptc_ids) for _, ptc_ids in units] == [2]
+    assert all(r.locked_by.startswith(outbox.worker_id) for r in await outbox_rows())
+
+
+async def test_claim_skips_rows_not_yet_due_and_reports_full_batch(db):
+    await new_post(tg=1, telegram_id=1, publish_at=datetime.now(timezone.utc) + timedelta(hours=1))
+    await new_post(tg=3, telegram_id=2)
+
+    units, full = await Outbox(None, batch_size=2)._claim()
+    assert sum(len(ptc_ids) for _, ptc_ids in units) == 2
+    assert full
+
+    units, full = await Outbox(None, batch_size=2)._claim()
+    assert sum(len(ptc_ids) for _, ptc_ids in units) == 1
+    assert not full
@@ -0,0 +1,100 @@
+import asyncio
+import time
+
+import pytest
+
+from services import rate_limiter
+from services.rate_limiter import FloodScheduler, TokenBucket
+from services.vk_transport import VKApiError
+
+
+async def test_bucket_serves_burst_then_spaces_requests():
+    bucket = TokenBucket(rate=20, capacity=2)
+
+    waits = [await bucket.acquire() for _ in range(4)]
+
+    assert waits[0] < 0.01 and waits[1] < 0.01
+    assert waits[2] == pytest.approx(0.05, abs=0.03)
+    assert waits[3] == pytest.approx(0.05, abs=0.03)
+
+
+async def test_waiters_are_served_in_reserved_order():
+    bucket = TokenBucket(rate=50, capacity=1)
+    await bucket.acquire()
+    order = []
+
+    async def take(i):
+        await bucket.acquire()
+        order.append(i)
+
+    tasks = [asyncio.create_task(take(i)) for i in range(3)]
+    await asyncio.sleep(0)
+    assert bucket.waiting == 3
+    assert bucket.queue_wait() > 0.05
+
+    await asyncio.gather(*tasks)
+    assert order == [0, 1, 2]
+    assert bucket.waiting == 0
+
+
+async def test_pause_blocks_until_it_ends():
+    bucket = TokenBucket(rate=1000, capacity=10)
+    bucket.pause(0.1)
+
+    assert bucket.queue_wait() == pytest.approx(0.1, abs=0.02)
+    assert await bucket.acquire() == pytest.approx(0.1, abs=0.05)
+
+
+async def test_run_vk_retries_rate_errors(monkeypatch):
+    monkeypatch.setitem(rate_limiter.VK_RATE_ERRORS, 6, 0.01)
+    calls = 0
+
+    async def call():
+        nonlocal calls
+        calls += 1
+        if calls < 3:
+            raise VKApiError("wall.post", 6, "Too many requests per second")
+        return "ok"
+
+    assert await FloodScheduler().run_vk("token", call) == "ok"
+    assert calls == 3
+
+
+async def test_run_vk_raises_other_errors_at_once():
+    calls = 0
+
+    async def call():
+        nonlocal calls
+        calls += 1
+        raise VKApiError("wall.post", 15, "Access denied")
+
+    with pytest.raises(VKApiError):
+        await FloodScheduler().run_vk("token", call)
+    assert calls == 1
+
+
+def test_idle_buckets_expire_unless_paused():
+    scheduler = FloodScheduler(idle_ttl=10)
+    idle = scheduler.telegram_chat(1)
+    paused = scheduler.telegram_chat(2)
+    paused.pause(3600)
+    scheduler.telegram_chat(3)
+
+    now = time.monotonic()
+    idle.last_used = paused.last_used = now - 60
+    scheduler._expire_idle(now)
+
+    assert list(scheduler._buckets) == ["tg:chat:2", "tg:chat:3"]
+
+
+def test_expiry_stops_at_first_fresh_bucket():
+    scheduler = FloodScheduler(idle_ttl=10)
+    for chat in range(3):
+        scheduler.telegram_chat(chat)
+    # Устаревший bucket за свежим не трогаем: порядок OrderedDict — по последнему использованию
+    stale = scheduler._buckets["tg:chat:2"]
+    stale.last_used -= 60
+
+    scheduler._expire_idle(time.monotonic())
+
+    assert len(scheduler) == 3
@@ -0,0 +1,84 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from database import async_session_maker
+from factories import user_with_communities
+from handlers.posts import parse_publish_at
+from models import Post
+from services.scheduler import PostScheduler
+
+# 12:00 по Москве
+NOW = datetime(2026, 6, 15, 9, 0, tzinfo=timezone.utc)
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("+90m", NOW + timedelta(minutes=90)),
+        ("+ 2ч", NOW + timedelta(hours=2)),
+        ("18:30", datetime(2026, 6, 15, 15, 30, tzinfo=timezone.utc)),
+        ("11:00", datetime(2026, 6, 16, 8, 0, tzinfo=timezone.utc)),
+        ("25.12 18:30", datetime(2026, 12, 25, 15, 30, tzinfo=timezone.utc)),
+        ("01.01 00:00", datetime(2026, 12, 31, 21, 0, tzinfo=timezone.utc)),
+        ("10.06 12:00", datetime(2027, 6, 10, 9, 0, tzinfo=timezone.utc)),
+        ("25.12.2026 18:30", datetime(2026, 12, 25, 15, 30, tzinfo=timezone.utc)),
+    ],
+)
+def test_parse_publish_at(text, expected):
+    assert parse_publish_at(text, NOW) == expected
+
+
+@pytest.mark.parametrize(
+    "text",
+    ["", "завтра", "+5d", "25:00", "31.02 10:00", "+99999999h", "+" + "9" * 30 + "m"],
+)
+def test_parse_publish_at_rejects(text):
+    assert parse_publish_at(text, NOW) is None
+
+
+async def scheduled_post(publish_at: datetime) -> int:
+    user_id, _ = await user_with_communities()
+    async with async_session_maker() as session:
+        post = Post(user_id=user_id, message_id=1, from_chat_id=1, publish_at=publish_at)
+        session.add(post)
+        await session.commit()
+        return post.id
+
+
+async def test_scheduler_wakes_at_publish_time(db):
+    await scheduled_post(datetime.now(timezone.utc) + timedelta(seconds=0.3))
+    due = asyncio.Event()
+    scheduler = PostScheduler(due.set, window=60, batch=10, refresh=60)
+
+    scheduler.start()
+    try:
+        assert not due.is_set()
+        await asyncio.wait_for(due.wait(), timeout=3)
+    finally:
+        await scheduler.stop()
+    assert len(scheduler) == 0
+
+
+async def test_scheduler_picks_up_post_added_inside_window(db):
+    due = asyncio.Event()
+    scheduler = PostScheduler(due.set, window=60, batch=10, refresh=60)
+    scheduler.start()
+    try:
+        # Первое чтение окна — пустое; пост, созданный после него, приходит через add()
+        await asyncio.sleep(0.1)
+        publish_at = datetime.now(timezone.utc) + timedelta(seconds=0.2)
+        scheduler.add(await scheduled_post(publish_at), publish_at)
+        await asyncio.wait_for(due.wait(), timeout=3)
+    finally:
+        await scheduler.stop()
+
+
+async def test_scheduler_keeps_posts_beyond_window_in_db(db):
+    await scheduled_post(datetime.now(timezone.utc) + timedelta(hours=1))
+    scheduler = PostScheduler(lambda: None, window=60, batch=10, refresh=60)
+
+    await scheduler._refill(datetime.now(timezone.utc))
+
+    assert len(scheduler) == 0
@@ -0,0 +1,64 @@
+import asyncio
+
+from sqlalchemy import select
+
+from database import async_session_maker
+from factories import user_with_communities
+from models import Post, PostStatus, PostToCommunity
+from services.status_recorder import StatusRecorder
+
+
+async def outbox_rows(count: int) -> list:
+    user_id, community_ids = await user_with_communities(tg=count)
+    async with async_session_maker() as session:
+        post = Post(user_id=user_id, message_id=1, from_chat_id=1)
+        session.add(post)
+        await session.flush()
+        rows = [
+            PostToCommunity(post_id=post.id, community_id=c, status=PostStatus.PENDING, locked_by="test")
+            for c in community_ids
+        ]
+        session.add_all(rows)
+        await session.commit()
+    return rows
+
+
+async def statuses() -> list:
+    async with async_session_maker() as session:
+        rows = (await session.execute(select(PostToCommunity).order_by(PostToCommunity.id))).scalars().all()
+    return [(r.status, r.locked_by) for r in rows]
+
+
+async def test_results_are_written_in_one_batch(db):
+    rows = await outbox_rows(3)
+    recorder = StatusRecorder(flush_batch=3, flush_interval=60)
+
+    recorder.record(rows[0], True, None)
+    recorder.record(rows[1], False, "boom")
+    assert await statuses() == [(PostStatus.PENDING, "test")] * 3
+
+    recorder.record(rows[2], True, None)
+    await asyncio.sleep(0.1)
+    assert await statuses() == [(PostStatus.SENT, None), (PostStatus.PENDING, None), (PostStatus.SENT, None)]
+    await recorder.close()
+
+
+async def test_close_during_flush_keeps_results(db):
+    rows = await outbox_rows(1)
+    started = asyncio.Event()
+
+    class HangingSession:
+        async def __aenter__(self):
+            started.set()
+            await asyncio.sleep(3600)
+
+        async def __aexit__(self, *exc):
+            return False
+
+    recorder = StatusRecorder(session_maker=HangingSession, flush_batch=1, flush_interval=60)
+    recorder.record(rows[0], True, None)
+    await started.wait()
+
+    recorder.session_maker = async_session_maker
+    await recorder.close()
+    assert await statuses() == [(PostStatus.SENT, None)]
@@ -0,0 +1,113 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from aiogram.types import CallbackQuery, Chat, Message, Update, User
+
+from middlewares.tracing import update_name
+from services.tracing import Tracer, format_trace
+
+USER = User(id=1, is_bot=False, first_name="Test")
+CHAT = Chat(id=1, type="private")
+
+
+def message_update(text: str) -> Update:
+    return Update(
+        update_id=1,
+        message=Message(message_id=1, date=datetime.now(timezone.utc), chat=CHAT, from_user=USER, text=text),
+    )
+
+
+def callback_update(data: str) -> Update:
+    return Update(update_id=1, callback_query=CallbackQuery(id="1", from_user=USER, chat_instance="1", data=data))
+
+
+@pytest.mark.parametrize(
+    "text, name",
+    [
+        ("/start", "message /start"),
+        ("/start@mpbot ref_42", "message /start"),
+        ("hello", "message text"),
+    ],
+)
+def test_message_update_name(text, name):
+    assert update_name(message_update(text)) == name
+
+
+@pytest.mark.parametrize(
+    "data, name",
+    [
+        ("sel_15", "callback sel"),
+        ("sel_-100123", "callback sel"),
+        ("mirror:vk:1:2", "callback mirror"),
+        ("myposts:n:abc", "callback myposts"),
+        ("add_vk", "callback add_vk"),
+        ("confirm", "callback confirm"),
+    ],
+)
+def test_callback_update_name_has_no_ids(data, name):
+    assert update_name(callback_update(data)) == name
+
+
+def test_sampled_trace_records_nested_spans():
+    tracer = Tracer(sample_rate=1, slow_ms=0, keep=5, max_spans=100)
+
+    with tracer.trace("update", update_id=1) as root:
+        with tracer.span("db"):
+            with tracer.span("query"):
+                pass
+        with pytest.raises(ValueError):
+            with tracer.span("send"):
+                raise ValueError
+
+    assert [c.name for c in root.children] == ["db", "send"]
+    assert root.children[0].children[0].name == "query"
+    assert root.children[1].attrs["error"] == "ValueError"
+    assert tracer.slow[-1].root is root
+    assert "update update_id=1" in format_trace(tracer.slow[-1])
+
+
+def test_unsampled_trace_keeps_only_total_time():
+    tracer = Tracer(sample_rate=0, slow_ms=0, keep=5, max_spans=100)
+
+    with tracer.trace("update") as root:
+        with tracer.span("db") as span:
+            assert span is None
+
+    assert root.children == []
+    assert root.duration > 0
+    assert "без детализации" in format_trace(tracer.slow[-1])
+
+
+def test_span_limit_drops_extra_spans():
+    tracer = Tracer(sample_rate=1, slow_ms=0, keep=5, max_spans=3)
+
+    with tracer.trace("update") as root:
+        for _ in range(5):
+            with tracer.span("db"):
+                pass
+
+    assert len(root.children) == 3
+    assert tracer.slow[-1].dropped == 2
+
+
+def test_fast_traces_are_not_kept():
+    tracer = Tracer(sample_rate=1, slow_ms=60_000, keep=5, max_spans=100)
+
+    with tracer.trace("update"):
+        pass
+
+    assert len(tracer.slow) == 0
+
+
+async def test_tasks_add_spans_to_parent():
+    tracer = Tracer(sample_rate=1, slow_ms=60_000, keep=5, max_spans=100)
+
+    async def send(i):
+        with tracer.span("send", target=i):
+            await asyncio.sleep(0)
+
+    with tracer.trace("fanout") as root:
+        await asyncio.gather(*(asyncio.create_task(send(i)) for i in range(3)))
+
+    assert sorted(c.attrs["target"] for c in root.children) == [0, 1, 2]
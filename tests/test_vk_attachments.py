@@ -0,0 +1,104 @@
+import pytest
+from sqlalchemy import select
+
+from database import async_session_maker
+from factories import user_with_communities
+from loopback import fake_apis
+from models import PostStatus, PostToCommunity
+from services.media import MediaRef, stream_telegram_file
+from services.media_cache import MediaCache
+from services.post_service import PostService
+from services.status_recorder import status_recorder
+from services.vk_attachments import VKAttachmentCache, VKAttachmentPlanner
+from services.vk_service import VKService
+
+GROUPS = ["101", "102", "103"]
+PHOTO_BYTES = 64 * 1024
+PHOTOS = [MediaRef("photo-a", "photo-a", PHOTO_BYTES), MediaRef("photo-b", "photo-b", PHOTO_BYTES)]
+
+
+def planner(files: MediaCache) -> VKAttachmentPlanner:
+    return VKAttachmentPlanner(VKAttachmentCache(max_size=100, ttl=60), concurrency=4, files=files)
+
+
+def opener(bot, files: MediaCache):
+    return lambda m: files.stream(m.file_unique_id, lambda: stream_telegram_file(bot, m.file_id))
+
+
+@pytest.mark.parametrize(
+    "max_bytes, photos",
+    [
+        (10 * 1024 * 1024, PHOTOS),
+        (10 * 1024 * 1024, [MediaRef(m.file_id, m.file_unique_id) for m in PHOTOS]),
+        (1024, PHOTOS),
+        (0, PHOTOS),
+    ],
+    ids=["cached", "unknown-size", "larger-than-cache", "no-cache"],
+)
+async def test_cold_cache_multi_group_plan_downloads_each_photo_once(tmp_path, max_bytes, photos):
+    # Недописанный файл прошлого запуска: первая загрузка индекса удаляет tmp/
+    (tmp_path / "tmp").mkdir()
+    (tmp_path / "tmp" / "stale").write_bytes(b"x")
+    files = MediaCache(root=str(tmp_path), max_bytes=max_bytes, chunk_size=16 * 1024)
+
+    async with fake_apis() as (apis, bot):
+        plan = await planner(files).plan(GROUPS, photos, opener(bot, files))
+
+    assert sorted(plan) == GROUPS
+    assert all(len(attachments) == len(PHOTOS) for attachments in plan.values())
+    assert apis.stats["tg.download"] == len(PHOTOS)
+    assert apis.stats["vk.upload"] == len(GROUPS) * len(PHOTOS)
+    assert apis.stats["vk.upload_bytes"] >= len(GROUPS) * len(PHOTOS) * PHOTO_BYTES
+    assert list((tmp_path / "tmp").iterdir()) == []
+
+
+async def test_cached_attachments_skip_download(tmp_path):
+    files = MediaCache(root=str(tmp_path), max_bytes=10 * 1024 * 1024)
+    p = planner(files)
+    async with fake_apis() as (apis, bot):
+        first = await p.plan(GROUPS, PHOTOS, opener(bot, files))
+        second = await p.plan(GROUPS, PHOTOS, opener(bot, files))
+
+    assert first == second
+    assert apis.stats["vk.upload"] == len(GROUPS) * len(PHOTOS)
+
+
+async def test_group_with_failed_upload_is_left_out(tmp_path, monkeypatch):
+    upload = VKService.upload_wall_photo
+
+    async def flaky_upload(group_id, chunks):
+        if group_id == "102":
+            async for _ in chunks:
+                pass
+            return None
+        return await upload(group_id, chunks)
+
+    monkeypatch.setattr(VKService, "upload_wall_photo", staticmethod(flaky_upload))
+    files = MediaCache(root=str(tmp_path), max_bytes=0)
+    async with fake_apis() as (apis, bot):
+        plan = await planner(files).plan(GROUPS, PHOTOS, opener(bot, files))
+
+    assert sorted(plan) == ["101", "103"]
+
+
+async def test_failed_photo_upload_fails_delivery(db, monkeypatch):
+    async def failing_upload(group_id, chunks):
+        return None
+
+    monkeypatch.setattr(VKService, "upload_wall_photo", staticmethod(failing_upload))
+    user_id, community_ids = await user_with_communities(vk=2)
+    async with fake_apis() as (apis, bot):
+        async with async_session_maker() as session:
+            service = PostService(session)
+            post, _ = await service.create_post(
+                user_id=user_id, from_chat_id=1, message_id=1, text="text",
+                photo_file_id="photo-c", document_file_id=None, community_ids=community_ids,
+            )
+            assert await service.deliver(bot, post.id) == 0
+        await status_recorder.flush()
+
+    assert apis.stats["vk.wall.post"] == 0
+    async with async_session_maker() as session:
+        rows = (await session.execute(select(PostToCommunity))).scalars().all()
+    assert [(r.status, r.attempts) for r in rows] == [(PostStatus.PENDING, 1)] * 2
+    assert all("photo upload" in r.last_error for r in rows)
@@ -0,0 +1,126 @@
+import asyncio
+
+import pytest
+
+from loopback import fake_apis
+from scripts.fake_apis import parse_execute_code
+from services.vk_batch import EXECUTE_MAX_CALLS, VKBatcher
+from services.vk_clients import VKClient, vk_clients
+from services.vk_service import GROUPS_GET_BY_ID_MAX, VKService
+from services.vk_transport import VKApiError
+
+
+class FakeVK:
+    """
+    call/execute для VKBatcher: запоминает запросы, отвечает по словарю results.
+    """
+
+    def __init__(self, results):
+        self.results = results
+        self.calls = []
+        self.executes = []
+
+    async def call(self, method, **params):
+        self.calls.append((method, params))
+        return self.results[method]
+
+    async def execute(self, code):
+        self.executes.append(code)
+        responses, errors = [], []
+        for method, _ in parse_execute_code(code):
+            responses.append(self.results[method])
+            if self.results[method] is False:
+                errors.append({"method": method, "error_code": 15, "error_msg": "Access denied"})
+        return responses, errors
+
+
+async def test_single_call_goes_without_execute():
+    vk = FakeVK({"users.get": [{"id": 1}]})
+    batcher = VKBatcher(vk.call, vk.execute, window=0.01)
+
+    assert await batcher.call("users.get", {}) == [{"id": 1}]
+    assert vk.calls == [("users.get", {})]
+    assert vk.executes == []
+
+
+async def test_calls_within_window_share_one_execute_and_errors_stay_per_call():
+    vk = FakeVK({"users.get": [{"id": 1}], "groups.getById": False})
+    batcher = VKBatcher(vk.call, vk.execute, window=0.01)
+
+    users, groups = await asyncio.gather(
+        batcher.call("users.get", {}),
+        batcher.call("groups.getById", {"group_id": "1"}),
+        return_exceptions=True,
+    )
+
+    assert len(vk.executes) == 1
+    assert users == [{"id": 1}]
+    assert isinstance(groups, VKApiError) and groups.code == 15
+
+
+async def test_full_batch_flushes_without_waiting_for_window():
+    vk = FakeVK({"users.get": [{"id": 1}]})
+    batcher = VKBatcher(vk.call, vk.execute, window=60)
+
+    results = await asyncio.wait_for(
+        asyncio.gather(*(batcher.call("users.get", {}) for _ in range(EXECUTE_MAX_CALLS))), timeout=5
+    )
+
+    assert len(results) == EXECUTE_MAX_CALLS
+    assert len(vk.executes) == 1
+
+
+async def test_execute_failure_fails_every_call_in_batch():
+    async def execute(code):
+        raise VKApiError("execute", 6, "Too many requests per second")
+
+    batcher = VKBatcher(FakeVK({}).call, execute, window=0.01)
+    results = await asyncio.gather(
+        batcher.call("users.get", {}), batcher.call("users.get", {}), return_exceptions=True
+    )
+
+    assert all(isinstance(r, VKApiError) and r.code == 6 for r in results)
+
+
+async def test_get_groups_info_batches_chunks_into_one_execute():
+    ids = [str(i) for i in range(1, 2 * GROUPS_GET_BY_ID_MAX + 2)]
+
+    async with fake_apis() as (apis, _):
+        groups = await VKService("vk1.a.batch-groups").get_groups_info(ids + ["-1"])
+
+    assert sorted(groups, key=int) == ids
+    assert apis.stats["vk.execute"] == 1
+    assert apis.stats["vk.groups.getById"] == 3
+
+
+async def test_concurrent_group_lookups_of_one_token_share_execute():
+    vk = VKService("vk1.a.batch-lookup")
+
+    async with fake_apis() as (apis, _):
+        groups = await asyncio.gather(*(vk.get_group_info(g) for g in ("club1", "-2", "public3")))
+
+    assert [g["id"] for g in groups] == [1, 2, 3]
+    assert apis.stats["vk.execute"] == 1
+
+
+@pytest.mark.parametrize("code", [5, 27, 28])
+async def test_validate_token_auth_error_marks_token_invalid(monkeypatch, code):
+    async def call(self, method, **params):
+        raise VKApiError(method, code, "User authorization failed")
+
+    monkeypatch.setattr(VKClient, "call", call)
+    token = f"vk1.a.revoked-{code}"
+
+    assert await VKService.validate_token(token) is False
+    assert token not in vk_clients._clients
+
+
+async def test_validate_token_other_errors_propagate(monkeypatch):
+    async def call(self, method, **params):
+        raise VKApiError(method, 10, "Internal server error")
+
+    monkeypatch.setattr(VKClient, "call", call)
+
+    with pytest.raises(VKApiError):
+        await VKService.validate_token("vk1.a.flaky")
+    assert "vk1.a.flaky" in vk_clients._clients
@@ -0,0 +1,78 @@
+import asyncio
+import logging
+from typing import Any, Dict
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    """
+    SimpleRequestHandler с ограничением числа одновременно обрабатываемых апдейтов.
+    Апдейт принимается сразу, но если свободных слотов нет, ответ Telegram
+    задерживается до освобождения слота — так нагрузка не копится в памяти.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, max_concurrent_updates: int, **kwargs: Any):
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=True, **kwargs)
+        self._slots = asyncio.Semaphore(max_concurrent_updates)
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        update = await request.json(loads=bot.session.json_loads)
+        await self._slots.acquire()
+        task = asyncio.create_task(self._feed_update_bounded(bot, update))
+        self._background_feed_update_tasks.add(task)
+        task.add_done_callback(self._background_feed_update_tasks.discard)
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    async def _feed_update_bounded(self, bot: Bot, update: Dict[str, Any]) -> None:
+        try:
+            await self._background_feed_update(bot=bot, update=update)
+        except Exception as e:
+            logger.error(f"Webhook update error: {e}")
+        finally:
+            self._slots.release()
+
+
+def build_webhook_app(bot: Bot, dp: Dispatcher) -> web.Application:
+    app = web.Application()
+    handler = BoundedRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        max_concurrent_updates=settings.WEBHOOK_MAX_CONCURRENT_UPDATES,
+        secret_token=settings.WEBHOOK_SECRET,
+    )
+    handler.register(app, path=settings.WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher) -> None:
+    """
+    Принимает апдейты через webhook вместо long polling.
+    Если задан WEBHOOK_BASE_URL, регистрирует webhook в Telegram;
+    несколько реплик за балансировщиком регистрируют один и тот же URL.
+    """
+    if settings.WEBHOOK_BASE_URL:
+        await bot.set_webhook(
+            url=settings.WEBHOOK_BASE_URL.rstrip("/") + settings.WEBHOOK_PATH,
+            secret_token=settings.WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types(),
+            max_connections=min(100, settings.WEBHOOK_MAX_CONCURRENT_UPDATES),
+        )
+
+    runner = web.AppRunner(build_webhook_app(bot, dp))
+    await runner.setup()
+    site = web.TCPSite(runner, host=settings.WEBHOOK_HOST, port=settings.WEBHOOK_PORT)
+    await site.start()
+    logger.info(f"Webhook listening on {settings.WEBHOOK_HOST}:{settings.WEBHOOK_PORT}{settings.WEBHOOK_PATH}")
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
@@ -0,0 +1,55 @@
+import asyncio
+import logging
+import signal
+
+from config import BOT_TOKEN
+from database import init_db
+from services.bot_factory import create_bot
+from services.executors import shutdown_executors
+from services.metrics import start_metrics_server
+from services.outbox import Outbox
+from services.status_recorder import status_recorder
+from services.vk_clients import vk_clients
+from services.vk_transport import vk_transport
+
+logger = logging.getLogger(__name__)
+
+
+async def main():
+    """
+    Процесс доставки без polling: забирает PENDING-строки post_to_community
+    и публикует их. Можно запускать несколько экземпляров на разных машинах
+    рядом с одним ботом (в боте тогда OUTBOX_IN_BOT=false).
+    """
+    await init_db()
+    metrics_server = await start_metrics_server()
+    bot = create_bot(BOT_TOKEN)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            # Windows: остаётся KeyboardInterrupt
+            pass
+
+    outbox = Outbox(bot)
+    await outbox.start()
+    logger.info(f"Delivery worker {outbox.worker_id} started")
+
+    try:
+        await stop.wait()
+    finally:
+        await outbox.stop()
+        await status_recorder.close()
+        await bot.session.close()
+        await vk_transport.close()
+        vk_clients.close()
+        if metrics_server is not None:
+            await metrics_server.cleanup()
+        shutdown_executors()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())